@@ -0,0 +1,136 @@
+"""
+Compiling MPTs from Python without touching the filesystem.
+
+    from codegen.api import compile_mpt
+    files = compile_mpt(open("od.mpt").read(), {"reduction": ["symmetry"]})
+    print(files["cfgs.h"])
+"""
+
+from argparse import Namespace
+
+from parser.parser import Parser
+from codegen.codegen import CodeGenCpp, MemorySink
+from mpt.petcache import PETCache, MemoryPETCache
+
+# options of the compilation and their defaults, the same as the options of `mptc`
+DEFAULT_OPTIONS = {
+    "out_dir": "/tmp/mpt",
+    "build_type": None,
+    "debug": False,
+    "exit_on_error": False,
+    "verbose": False,
+    "stats": False,
+    "cmake_defs": [],
+    "reduction": [],
+    "auto_reduction": True,
+    "incremental": False,
+    "pet_cache": None,
+    "jobs": 1,
+    "max_pet_states": None,
+    "max_derivative_steps": None,
+    "max_pet_time": None,
+    "profile_compile": None,
+    "export_tables": None,
+    "fuse_transitions": False,
+    "pe_backend": "switch",
+    "profile_generate": False,
+    "profile_use": None,
+    "unity_build": False,
+    "precompiled_headers": False,
+    "split_cfgs": 1,
+    "incremental_cond": True,
+    "overwrite_default": [],
+    "cpp_files": [],
+}
+
+
+def make_options(options=None):
+    """
+    Create the options for `CodeGenCpp` from a dictionary or a namespace
+    (e.g., parsed arguments of `mptc`). Missing options get default values.
+    """
+    if options is None:
+        options = {}
+    elif isinstance(options, Namespace):
+        options = vars(options)
+    unknown = set(options).difference(DEFAULT_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown options: {', '.join(sorted(unknown))}")
+    return Namespace(**{**DEFAULT_OPTIONS, **options})
+
+
+class Compiler:
+    """
+    Compiles MPTs in memory. The parser and the PETs are kept between
+    compilations, so compiling many (similar) MPTs with one `Compiler`
+    is much faster than running `mptc` for each of them.
+    PETs are kept in memory (at most `MemoryPETCache.MAX_ENTRIES`
+    of them, the least recently used ones are dropped), or in the
+    persistent cache if the option `pet_cache` is set.
+    """
+
+    def __init__(self, options=None):
+        self.options = make_options(options)
+        self.parser = Parser()
+        if self.options.pet_cache:
+            self.pet_cache = PETCache(self.options.pet_cache)
+        else:
+            self.pet_cache = MemoryPETCache()
+        # the last parsed text and the result, re-compiling the same text
+        # (e.g., when only additional C++ files changed) does not parse it again
+        self._parsed = (None, None)
+
+    def parse(self, text):
+        if self._parsed[0] != text:
+            self._parsed = (text, self.parser.parse_text(text))
+        return self._parsed[1]
+
+    def compile(self, text, options=None):
+        """
+        Compile the MPT given by `text`. `options` override the options
+        of the compiler. Returns the generated files as a dictionary
+        {filename: contents}.
+        """
+        args = self.options
+        if options:
+            args = make_options({**vars(args), **(vars(options) if isinstance(options, Namespace) else options)})
+        _, mpt = self.parse(text)
+        sink = MemorySink()
+        CodeGenCpp(args, sink=sink, pet_cache=self.pet_cache).generate(mpt)
+        return sink.files
+
+    def compile_many(self, texts, options=None):
+        """
+        Compile MPTs given by `texts` (an iterable of strings or a dictionary
+        name -> text). Returns the list (or the dictionary name -> files)
+        of results of `compile`.
+        """
+        if isinstance(texts, dict):
+            return {name: self.compile(text, options) for name, text in texts.items()}
+        return [self.compile(text, options) for text in texts]
+
+
+_compiler = None
+
+
+def default_compiler():
+    """
+    The compiler shared by `compile_mpt` and `compile_many`. It lives as
+    long as the process, its PETs are bounded as in any `Compiler`.
+    """
+    global _compiler
+    if _compiler is None:
+        _compiler = Compiler()
+    return _compiler
+
+
+def compile_mpt(text, options=None):
+    """
+    Compile the MPT given by `text` with `options` (see `DEFAULT_OPTIONS`).
+    Returns the generated files as a dictionary {filename: contents}.
+    """
+    return default_compiler().compile(text, options)
+
+
+def compile_many(texts, options=None):
+    return default_compiler().compile_many(texts, options)
@@ -1,12 +1,21 @@
-from os import mkdir, readlink
-from os.path import join as pathjoin, abspath, dirname, islink, basename
-from shutil import rmtree, copy as shutilcopy
+import re
+from io import StringIO
+from os import mkdir, makedirs, readlink, replace, remove, getpid
+from os.path import join as pathjoin, abspath, dirname, islink, basename, isfile, splitext
+from shutil import rmtree
 from sys import stderr
 from itertools import permutations
-
-from mpt.pet import PrefixExpressionTransducer
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from mpt.pet import PrefixExpressionTransducer, PETBudget, PETBudgetExceeded
+from mpt.petcache import PETCache
+from mpt.tables import MPTTables, lower_pet, NONE
+from mpt.analysis import detect_reductions, live_pes, label_bounds
+from mpt.product import ProductPET
+from codegen.profile import profile_phase, derivatives_count, pet_edges_num, MonitorProfile
 from mpt.prefixexpr import SpecialAtom, Atom, Event
-from parser.expr import CompareExpr, SubWord
+from parser.expr import CompareExpr, SubWord, Label, ConstExpr, And, Or
 from parser.types.type import *
 
 
@@ -25,8 +34,128 @@ class CodeMapper:
         raise NotImplementedError(f"Unknown type: {ty}")
 
 
+def write_if_changed(path, contents):
+    """
+    Write `contents` (str or bytes) into the file `path` unless the file
+    already has exactly these contents. The file is replaced atomically.
+    Returns True if the file was written.
+    """
+    data = contents.encode("utf-8") if isinstance(contents, str) else contents
+    if isfile(path):
+        with open(path, "rb") as fl:
+            if fl.read() == data:
+                return False
+    tmp = f"{path}.{getpid()}.tmp"
+    with open(tmp, "wb") as fl:
+        fl.write(data)
+    replace(tmp, path)
+    return True
+
+
+class OutputFile(StringIO):
+    """
+    A file that is written into a memory buffer. When the file is closed,
+    the buffer is passed to `commit` (or discarded if `commit` is None).
+    The buffer is discarded if the file is left by an exception
+    or is never closed, so no partially generated file is written.
+    """
+
+    def __init__(self, commit=None):
+        super().__init__()
+        self._commit = commit
+
+    def close(self):
+        if not self.closed and self._commit is not None:
+            self._commit(self.getvalue())
+        super().close()
+
+    def discard(self):
+        self._commit = None
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+    def __del__(self):
+        # `IOBase.__del__` would close (and commit) the file
+        self.discard()
+
+
+class DirectorySink:
+    """
+    Writes generated files into the directory `out_dir`.
+    """
+
+    # the list of generated files, used to remove stale files
+    # in the incremental mode
+    MANIFEST = ".mptc-files"
+
+    def __init__(self, out_dir, incremental=False, debug=False):
+        self.out_dir = abspath(out_dir)
+
+        if incremental:
+            makedirs(self.out_dir, exist_ok=True)
+        else:
+            try:
+                mkdir(self.out_dir)
+            except OSError:
+                print("The output dir exists, overwriting its contents", file=stderr)
+                rmtree(self.out_dir)
+                mkdir(self.out_dir)
+
+        if debug:
+            makedirs(f"{self.out_dir}/dbg", exist_ok=True)
+
+    def write(self, name, contents):
+        """
+        Write the file `name` (relative to `out_dir`).
+        Returns True if the file was (re-)written.
+        """
+        path = pathjoin(self.out_dir, name)
+        if "/" in name:
+            makedirs(dirname(path), exist_ok=True)
+        return write_if_changed(path, contents)
+
+    def finish(self, generated):
+        """
+        Remove files generated by the previous run that were not generated
+        by this run and record the generated files.
+        """
+        manifest = pathjoin(self.out_dir, self.MANIFEST)
+        if isfile(manifest):
+            with open(manifest, "r") as fl:
+                old = set(fl.read().split())
+            for name in old.difference(generated):
+                path = pathjoin(self.out_dir, name)
+                if isfile(path):
+                    remove(path)
+        write_if_changed(manifest, "".join(f"{name}\n" for name in sorted(generated)))
+
+
+class MemorySink:
+    """
+    Collects generated files in the dictionary `files` (name -> contents).
+    The contents of text files are strings, the contents of binary files
+    (exported tables) are bytes.
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def write(self, name, contents):
+        self.files[name] = contents
+        return True
+
+    def finish(self, generated):
+        pass
+
+
 class CodeGen:
-    def __init__(self, args, codemapper=None):
+    def __init__(self, args, codemapper=None, sink=None):
         if codemapper is None:
             self.codemapper = CodeMapper()
         else:
@@ -34,44 +163,50 @@ class CodeGen:
 
         self.args  = args
         self.files = []
-        self.out_dir = abspath(args.out_dir)
         self.templates_path = None
-
-        try:
-            mkdir(self.out_dir)
-        except OSError:
-            print("The output dir exists, overwriting its contents", file=stderr)
-            rmtree(self.out_dir)
-            mkdir(self.out_dir)
-
-        if args.debug:
-            mkdir(f"{self.out_dir}/dbg")
+        # files (relative to the output directory) that were generated
+        # and those that were actually (re-)written
+        self.generated = []
+        self.written = []
+        # the name of the MPT if it is one of several MPTs monitored by one
+        # monitor (`CodeGenCpp.generate_properties`), its files are generated
+        # into the directory of this name
+        self.prop = None
+
+        if sink is None:
+            sink = DirectorySink(args.out_dir, args.incremental, args.debug)
+        self.sink = sink
+
+    def _output(self, name, contents):
+        assert name not in self.generated, (name, self.generated)
+        self.generated.append(name)
+        if self.sink.write(name, contents):
+            self.written.append(name)
 
     def copy_file(self, name):
         path = pathjoin(self.templates_path, name)
-        shutilcopy(path, self.out_dir)
+        with open(path, "r", newline="") as fl:
+            self._output(basename(path), fl.read())
 
     def new_file(self, name):
         if name in self.args.overwrite_default:
-            filename = "/dev/null"
-        else:
-            filename = pathjoin(self.out_dir, name)
-            assert filename not in self.files, (filename, self.files)
-            self.files.append(filename)
-        return open(filename, "w")
+            return OutputFile()
+        if self.prop:
+            name = pathjoin(self.prop, name)
+        assert name not in self.files, (name, self.files)
+        self.files.append(name)
+        return OutputFile(lambda contents: self._output(name, contents))
 
     def new_dbg_file(self, name):
-        filename = pathjoin(self.out_dir, "dbg/", name)
-        return open(filename, "w")
-
+        name = pathjoin("dbg", self.prop, name) if self.prop else pathjoin("dbg", name)
+        return OutputFile(lambda contents: self._output(name, contents))
 
     def gen_config(self, infile, outfile, values):
         if outfile in self.args.overwrite_default:
             return
         inpath = pathjoin(self.templates_path, infile)
-        outpath = pathjoin(self.out_dir, outfile)
         with open(inpath, "r") as infl:
-            with open(outpath, "w") as outfl:
+            with self.new_file(outfile) as outfl:
                 for line in infl:
                     if "@" in line:
                         for v, s in values.items():
@@ -80,14 +215,68 @@ class CodeGen:
                             line = line.replace(v, s)
                     outfl.write(line)
 
-    def input_file(self, stream, name):
+    def finish(self):
+        self.sink.finish(self.generated)
+
+        if self.args.verbose:
+            print(
+                f"Generated {len(self.generated)} files, {len(self.written)} of them changed",
+                file=stderr,
+            )
+
+    def input_file(self, stream, name, values=None):
         inpath = pathjoin(self.templates_path, name)
         with open(inpath, "r") as infl:
             write = stream.write
             for line in infl:
+                if values and "@" in line:
+                    for v, s in values.items():
+                        assert v.startswith("@"), v
+                        assert v.endswith("@"), v
+                        line = line.replace(v, s)
                 write(line)
 
 
+class PETBuild:
+    """
+    The result of building a PET: the minimized PET, the number of states
+    and edges before minimization, the dump of the PET before minimization
+    (if requested and the minimization changed the PET), the time
+    of building it and the number of computed derivatives.
+    """
+
+    def __init__(self, pet, states, edges, dump, time, derivatives):
+        self.pet = pet
+        self.states = states
+        self.edges = edges
+        self.dump = dump
+        self.time = time
+        self.derivatives = derivatives
+
+
+def build_pet(pe, alphabet, budget=None, dump=False):
+    """
+    Build the minimized PET for `pe`. Runs also in worker processes (`mptc -j`),
+    so it returns the results in a `PETBuild` that is cheap to pickle.
+    """
+    start, derivs = perf_counter(), derivatives_count()
+    pet = PrefixExpressionTransducer.from_pe(pe, alphabet, budget)
+    min_pet = pet.minimized()
+    text = None
+    if dump and min_pet is not pet:
+        fl = StringIO()
+        pet.dump(fl=fl)
+        text = fl.getvalue()
+    return PETBuild(
+        min_pet,
+        len(pet.states),
+        pet_edges_num(pet),
+        text,
+        perf_counter() - start,
+        derivatives_count() - derivs,
+    )
+
+
 def ev_kind(ev):
     assert isinstance(ev, Atom), ev
     if isinstance(ev, SpecialAtom):
@@ -106,14 +295,83 @@ def map_pos(pos):
     raise RuntimeError("Unreachable")
 
 
+def mpt_name_from_path(path):
+    """
+    The name of an MPT that does not have one: the name of its file
+    without the extension, made into a C++ identifier.
+    """
+    name = re.sub(r"\W", "_", splitext(basename(path))[0], flags=re.ASCII)
+    if not name or name[0].isdigit():
+        name = f"mpt_{name}"
+    return name
+
+
+# names of MPTs are namespaces in the monitor of several MPTs,
+# they must not clash with C++ keywords and with the global names
+# of the monitor and of its runtime
+RESERVED_NAMES = {
+    "alignas", "alignof", "and", "and_eq", "asm", "auto", "bitand", "bitor", "bool", "break",
+    "case", "catch", "char", "char16_t", "char32_t", "class", "compl", "const", "constexpr",
+    "const_cast", "continue", "decltype", "default", "delete", "do", "double", "dynamic_cast",
+    "else", "enum", "explicit", "export", "extern", "false", "float", "for", "friend", "goto",
+    "if", "inline", "int", "long", "mutable", "namespace", "new", "noexcept", "not", "not_eq",
+    "nullptr", "operator", "or", "or_eq", "private", "protected", "public", "register",
+    "reinterpret_cast", "return", "short", "signed", "sizeof", "static", "static_assert",
+    "static_cast", "struct", "switch", "template", "this", "thread_local", "throw", "true",
+    "try", "typedef", "typeid", "typename", "union", "unsigned", "using", "virtual", "void",
+    "volatile", "wchar_t", "while", "xor", "xor_eq",
+    "std", "vamos", "main", "monitor", "Properties", "add_new_cfgs", "update_traces",
+    "Inputs", "InputStream", "Trace", "TraceBase", "TraceEvent", "Event", "MString",
+    "PEStepResult", "PrefixExpression", "SubwordPrefixCompare", "Workbag", "WorkbagBase",
+    "Configuration", "ConfigurationBase", "Actions",
+}
+
+
+# do not fuse the transitions of a state if the product of their PETs
+# on some trace has more states than this
+MAX_PRODUCT_STATES = 1000
+
+# with a profile of the monitor (`args.profile_use`), edges of PEs taken
+# less often than this fraction of the steps of their state are marked unlikely
+COLD_EDGE_RATIO = 0.01
+
+
 class CodeGenCpp(CodeGen):
-    def __init__(self, args, codemapper=None):
-        super().__init__(args, codemapper)
+    def __init__(self, args, codemapper=None, profile=None, sink=None, pet_cache=None):
+        super().__init__(args, codemapper, sink)
         self_path = abspath(
             dirname(readlink(__file__) if islink(__file__) else __file__)
         )
         self.templates_path = pathjoin(self_path, "templates/cpp")
         self.cfgs = []
+        # configurations that run all outgoing transitions of a state
+        # (`args.fuse_transitions`), (index, name, state)
+        self.fused_cfgs = []
+        if pet_cache is None and args.pet_cache:
+            pet_cache = PETCache(args.pet_cache)
+        self.pet_cache = pet_cache
+        self.pet_budget = PETBudget(
+            args.max_pet_states, args.max_derivative_steps, args.max_pet_time
+        )
+        # PETs built in parallel (`args.jobs`), indexed by PEs
+        self.prebuilt_pets = {}
+        # `CompileProfile` if the compilation is profiled
+        self.profile = profile
+        # PETs of the generated PEs, indexed by PEs
+        self.pets = {}
+        # the reductions of tuples of traces, set in `generate`
+        self.reduction = list(args.reduction)
+        # the events of the MPT, set in `generate`
+        self.alphabet = []
+        # keys of the counters of the instrumented monitor
+        # (`args.profile_generate`), indexed by the ids of counters
+        self.profile_counters = []
+        # `MonitorProfile` that guides the generated code (`args.profile_use`)
+        self.monitor_profile = None
+        if args.profile_use:
+            self.monitor_profile = MonitorProfile.load(args.profile_use)
+        # the names of the MPTs monitored by one monitor (`generate_properties`)
+        self.properties = []
 
     def _copy_common_files(self):
         files = ["monitor.h", "mstring.h", "trace.h", "inputs.h",
@@ -126,6 +384,54 @@ class CodeGenCpp(CodeGen):
         for f in self.args.cpp_files:
             self.copy_file(f)
 
+    def _cfg_units(self):
+        """
+        The sources with the methods of configurations (`args.split_cfgs`).
+        """
+        return ["cfgs.cpp"] + [f"cfgs-{i}.cpp" for i in range(1, self.args.split_cfgs)]
+
+    def _monitor_sources(self):
+        if not self.properties:
+            return ["monitor.cpp", "events.cpp", "mstring.cpp"] + self._cfg_units()
+        sources = ["monitor.cpp", "events.cpp", "mstring.cpp"]
+        for prop in self.properties:
+            sources += [pathjoin(prop, f) for f in ["monitor.cpp"] + self._cfg_units()]
+        return sources
+
+    def _guard(self, name):
+        """
+        The include guard of the generated header `name` (e.g., "CFGS"),
+        the headers of several MPTs (`self.prop`) have different guards.
+        """
+        if self.prop:
+            return f"MPT_{self.prop}_{name}_H_"
+        return f"OD_{name}_H_"
+
+    def _namespace_begin(self, wr):
+        # the code of one of several MPTs is in the namespace of its name
+        if self.prop:
+            wr(f"namespace {self.prop} {{\n\n")
+
+    def _namespace_end(self, wr):
+        if self.prop:
+            wr(f"}} // namespace {self.prop}\n\n")
+
+    def _precompiled_headers(self):
+        """
+        The headers precompiled for the monitor library
+        (`args.precompiled_headers`). Only headers that are copied from
+        the templates are precompiled, the generated headers change
+        with the MPT.
+        """
+        if not self.args.precompiled_headers:
+            return []
+        headers = ["<iostream>", "<vector>", "<array>", "<cassert>"]
+        for f in ["mstring.h", "trace.h", "cfg.h", "workbag.h", "prefixexpr.h",
+                  "inputs.h", "monitor.h"]:
+            if f not in self.args.overwrite_default:
+                headers.append(f)
+        return headers
+
     def _generate_cmake(self):
         from config import vamos_buffers_DIR, vamos_hyper_DIR
 
@@ -139,99 +445,493 @@ class CodeGenCpp(CodeGen):
             {
                 "@vamos-buffers_DIR@": vamos_buffers_DIR,
                 "@vamos-hyper_DIR@": vamos_hyper_DIR,
+                "@monitor_sources@": " ".join(self._monitor_sources()),
+                "@unity_build@": "ON" if self.args.unity_build else "OFF",
+                "@precompiled_headers@": " ".join(self._precompiled_headers()),
                 "@additional_sources@": " ".join((basename(f) for f in self.args.cpp_files)),
                 "@additional_cmake_definitions@": " ".join((d for d in self.args.cmake_defs)),
                 "@CMAKE_BUILD_TYPE@": build_type,
             },
         )
 
-    def _generate_pe(self, pe, name, wr):
-        pet = PrefixExpressionTransducer.from_pe(pe)
+    def _profile_hit(self, key, wr, indent):
+        """
+        Count hits of `key` in the instrumented monitor.
+        """
+        if self.args.profile_generate:
+            wr(f"{indent}MPT_PROFILE_HIT({len(self.profile_counters)}); // {key}\n")
+            self.profile_counters.append(key)
+
+    def _profile_count(self, key):
+        if self.monitor_profile is None:
+            return 0
+        return self.monitor_profile.count(key)
+
+    def _generate_profile(self):
+        with self.new_file("profile.h") as f:
+            wr = f.write
+            wr("#ifndef OD_PROFILE_H_\n#define OD_PROFILE_H_\n\n")
+            wr("#include <cstdint>\n#include <cstdio>\n#include <cstdlib>\n\n")
+            wr("// hit counts of the edges of PEs and of the moves of configurations,\n"
+               "// written into the file $MPT_PROFILE (default: mpt-profile.txt)\n"
+               "// when the monitor exits\n")
+            n = len(self.profile_counters)
+            wr("namespace mpt_profile {\n\n")
+            wr(f"static constexpr size_t COUNTERS = {max(n, 1)};\n")
+            wr("inline uint64_t counts[COUNTERS];\n")
+            wr("inline const char *keys[COUNTERS] = {\n")
+            for key in self.profile_counters:
+                wr(f'  "{key}",\n')
+            if n == 0:
+                wr("  nullptr\n")
+            wr("};\n\n")
+            wr("struct Writer {\n"
+               "  ~Writer() {\n"
+               '    const char *path = getenv("MPT_PROFILE");\n'
+               '    FILE *fl = fopen(path ? path : "mpt-profile.txt", "w");\n'
+               "    if (!fl) {\n"
+               '      perror("Failed writing the profile");\n'
+               "      return;\n"
+               "    }\n"
+               f"    for (size_t i = 0; i < {n}; ++i) {{\n"
+               '      fprintf(fl, "%llu %s\\n", (unsigned long long)counts[i], keys[i]);\n'
+               "    }\n"
+               "    fclose(fl);\n"
+               "  }\n"
+               "};\n\n"
+               "inline Writer writer;\n\n"
+               "} // namespace mpt_profile\n\n")
+            wr("#define MPT_PROFILE_HIT(n) (++mpt_profile::counts[(n)])\n\n")
+            wr("#endif\n")
+
+    def _generate_pe_edge(self, state, succ, labels, wr, indent="          "):
+        succ_state, out = succ
+        if out:
+            wr(f"{indent}// output: {out};\n")
+            for label, pos in out.items():
+                labels.setdefault(label)
+                for p in pos:
+                    wr(indent)
+                    wr(
+                        self.codemapper.append_mstring(
+                            f"mstr_{label.name}", map_pos(p[0]), map_pos(p[1])
+                        )
+                    )
+                    wr(";\n")
+
+        pe = succ_state.pe
+        if pe.is_empty():  # is accepting?
+            wr(f"{indent}return PEStepResult::Accept;\n")
+        elif pe.is_bot():
+            wr(f"{indent}return PEStepResult::Reject;\n")
+        else:
+            if succ_state is not state:
+                wr(f"{indent}state = {succ_state.id};\n")
+            wr(f"{indent}break;\n")
+
+    def _build_pets_parallel(self, mpt):
+        """
+        Build the PETs of all PEs of `mpt` (that are not in the PET cache)
+        in `args.jobs` processes. `_build_pet` then only picks the results,
+        so the generated code is the same as when building PETs serially.
+        """
+        jobs = {}
+        for transition in mpt.transitions:
+            for trace, pe in live_pes(transition).items():
+                alphabet = pe.alphabet()
+                if pe in jobs or self.pet_cache and self.pet_cache.has(pe, alphabet):
+                    continue
+                jobs[pe] = (transition, trace, alphabet)
+        if len(jobs) < 2:
+            return
+
+        with ProcessPoolExecutor(min(self.args.jobs, len(jobs))) as pool:
+            futures = {
+                pe: pool.submit(build_pet, pe, alphabet, self.pet_budget, self.args.debug)
+                for pe, (_, _, alphabet) in jobs.items()
+            }
+            # wait for the results in order, so that the first error is
+            # the same as in the serial run
+            for pe, (transition, trace, _) in jobs.items():
+                try:
+                    self.prebuilt_pets[pe] = futures[pe].result()
+                except PETBudgetExceeded as e:
+                    pool.shutdown(cancel_futures=True)
+                    e.where = f"transition {transition.start.name} -> {transition.end.name}, trace {trace.name}"
+                    raise
+
+    def _build_pet(self, pe, name):
+        """
+        Build the minimized PET for `pe`, or take it from the PETs built
+        in parallel, or get it from the PET cache.
+        """
+        alphabet = pe.alphabet()
+        # the result of building the PET if it was not in the cache
+        built = []
+
+        def build():
+            b = self.prebuilt_pets.get(pe)
+            if b is None:
+                b = build_pet(pe, alphabet, self.pet_budget, self.args.debug)
+            built.append(b)
+            return b.pet
+
+        start = perf_counter()
+        if self.pet_cache is None:
+            pet = build()
+        else:
+            pet = self.pet_cache.build(pe, alphabet, build)
+        built = built[0] if built else None
+
+        if self.profile:
+            self.profile.add_pe(
+                name,
+                pe,
+                perf_counter() - start if built is None else built.time,
+                cached=built is None,
+                states=None if built is None else built.states,
+                edges=None if built is None else built.edges,
+                min_pet=pet,
+                derivatives=0 if built is None else built.derivatives,
+            )
+
         if self.args.debug:
+            if built is None:
+                info = "# loaded from the PET cache"
+            else:
+                info = f"# states: {built.states}, after minimization: {len(pet.states)}"
+                if built.dump is not None:
+                    with self.new_dbg_file(f"{name}-unminimized.txt") as fl:
+                        fl.write(built.dump)
             with self.new_dbg_file(f"{name}.txt") as fl:
+                print(info, file=fl)
                 pet.dump(fl=fl)
             with self.new_dbg_file(f"{name}.dot") as fl:
                 pet.to_dot(reduced=True, fl=fl)
-        labels = set()
+        return pet
+
+    def _generate_pe(self, pe, name, wr):
+        with profile_phase(self.profile, "codegen/pets"):
+            pet = self._build_pet(pe, name)
+        self.pets[pe] = pet
+        labels = {}
         wr(f"struct {name} : public PrefixExpression {{\n\n")
+        if self.args.pe_backend == "table":
+            self._generate_pe_table(pet, labels, wr)
+        else:
+            self._generate_pe_switch(pet, name, labels, wr)
+
+        # labels with a bounded number of letters do not need the heap
+        bounds = label_bounds(pet)
+        for label in labels:
+            letters = bounds[label.name].letters
+            if letters is None:
+                wr(f"  MString mstr_{label.name};\n")
+            else:
+                wr(f"  FixedMString<{max(letters, 1)}> mstr_{label.name};\n")
+
+        wr("};\n\n")
+        return bounds
 
+    def _generate_pe_switch(self, pet, name, labels, wr):
+        """
+        The step of the PET as a switch over states, each state tests
+        the kind of the event against its edges. With a profile of the monitor,
+        the edges of a state are tested from the most often taken.
+        """
         wr(
             "  PEStepResult step(const TraceEvent *ev, size_t pos) {\n"
             "    switch (state) {\n"
         )
         for state in pet.states.values():
             wr(f"      case {state.id}: {{ // {state}\n")
-            for l, succ in state.successors.items():
-                if isinstance(l, Event) and l.params:
-                    raise NotImplementedError(
-                        f"Parameters binding not supported yet: {l}"
-                    )
-
-                ## OPTIMIZATION 1: successors of the accepting and rejecting states are BOT
-                if state.pe.is_empty() or state.pe.is_bot():
-                    wr(f"        return PEStepResult::Reject;\n")
-                    break
-
-                evkind = ev_kind(l)
-                wr(f"        if ((Kind)ev->kind() == Kind::{evkind}) {{ // {l}\n")
-                if succ[1]:  # output
-                    wr(f"          // output: {succ[1]};\n")
-                    for label, pos in succ[1].items():
-                        labels.add(label)
-                        for p in pos:
-                            wr("          ")
-                            wr(
-                                self.codemapper.append_mstring(
-                                    f"mstr_{label.name}", map_pos(p[0]), map_pos(p[1])
-                                )
-                            )
-                            wr(";\n")
-
-                pe = succ[0].pe
-                if pe.is_empty():  # is accepting?
-                    wr(f"          return PEStepResult::Accept;\n")
-                elif pe.is_bot():
-                    wr(f"          return PEStepResult::Reject;\n")
-                else:
-                    wr(f"          state = {succ[0].id};\n")
+            ## OPTIMIZATION 1: successors of the accepting and rejecting states are BOT
+            if state.pe.is_empty() or state.pe.is_bot():
+                wr(f"        return PEStepResult::Reject;\n")
+                wr("        }\n")
+                continue
+
+            # edges are grouped by classes of letters, the letters that
+            # are not handled explicitly take the default edge
+            edges = []
+            for letters, succ in pet.edges(state):
+                for l in letters:
+                    if isinstance(l, Event) and l.params:
+                        raise NotImplementedError(
+                            f"Parameters binding not supported yet: {l}"
+                        )
+                kinds = ",".join(sorted({ev_kind(l) for l in letters}))
+                key = MonitorProfile.edge_key(name, state.id, kinds)
+                edges.append((letters, succ, key, self._profile_count(key)))
+            default_key = MonitorProfile.edge_key(name, state.id, "default")
+            hits = sum(e[3] for e in edges) + self._profile_count(default_key)
+            if self.monitor_profile:
+                edges.sort(key=lambda e: -e[3])
+
+            for letters, succ, key, count in edges:
+                test = " || ".join(
+                    (f"(Kind)ev->kind() == Kind::{ev_kind(l)}" for l in letters)
+                )
+                cold = hits > 0 and count < COLD_EDGE_RATIO * hits
+                wr(f"        if ({test}){' MPT_UNLIKELY' if cold else ''} {{"
+                   f" // {', '.join(map(str, letters))}\n")
+                self._profile_hit(key, wr, "          ")
+                self._generate_pe_edge(state, succ, labels, wr)
                 wr("        }\n")
-            wr("        break;\n" "        }\n")
+
+            wr(f"        // default: {state.default[0]}\n")
+            self._profile_hit(default_key, wr, "        ")
+            self._generate_pe_edge(state, state.default, labels, wr, indent="        ")
+            wr("        }\n")
         wr("      default: abort();\n")
         wr("    }\n"
            "  return PEStepResult::None;\n"
            "}\n\n")
-        wr("  // TODO: use MStringFixed when possible\n")
-        for label in labels:
-            wr(f"  MString mstr_{label.name};\n")
 
-        wr("};\n\n")
+    def _generate_pe_table(self, pet, labels, wr):
+        """
+        The step of the PET as a lookup into tables of successors and
+        actions indexed by the state and the code of the kind of the event
+        (see `kindCode` in events.h), the outputs of edges are dispatched
+        by the id of the action.
+        """
+        kinds = {ev.name.name: code for code, ev in enumerate(self.alphabet)}
+        # the codes of kinds, then END and other kinds
+        kinds_num = len(kinds) + 2
+        actions = []
+
+        def action_id(out):
+            for n, o in enumerate(actions):
+                if o is out:
+                    return n + 1
+            actions.append(out)
+            return len(actions)
+
+        succ, action, bot = lower_pet(pet, kinds, kinds_num, len(kinds), action_id)
+        states_num = len(pet.states)
+        if NONE in succ:
+            # edges without a successor go to an extra state that rejects
+            succ = [states_num if n == NONE else n for n in succ] + [states_num] * kinds_num
+            action = action + [0] * kinds_num
+            bot = bot + [True]
+            states_num += 1
+        next_ty = "uint16_t" if states_num <= 0xFFFF else "uint32_t"
+        action_ty = "uint8_t" if len(actions) < 0xFF else "uint16_t"
+
+        def rows(table):
+            return ",\n".join(
+                "    {" + ", ".join(map(str, table[s * kinds_num:(s + 1) * kinds_num])) + "}"
+                for s in range(states_num)
+            )
+
+        results = ["PEStepResult::Reject" if b else "PEStepResult::None" for b in bot]
+        for s in pet.states.values():
+            if s.pe.is_empty():
+                results[s.id] = "PEStepResult::Accept"
+
+        wr(f"  static constexpr {next_ty} NEXT[{states_num}][KINDS_NUM] = {{\n{rows(succ)}}};\n")
+        wr(f"  static constexpr {action_ty} ACTION[{states_num}][KINDS_NUM] = {{\n{rows(action)}}};\n")
+        wr(f"  static constexpr PEStepResult RESULT[{states_num}] = {{\n    {', '.join(results)}}};\n\n")
+
+        wr("  PEStepResult step(const TraceEvent *ev, size_t pos) {\n"
+           "    const size_t code = kindCode(ev->kind());\n")
+        if actions:
+            wr("    switch (ACTION[state][code]) {\n"
+               "    case 0: break;\n")
+            for n, out in enumerate(actions):
+                wr(f"    case {n + 1}: // output: {out};\n")
+                for label, pos in out.items():
+                    labels.setdefault(label)
+                    for p in pos:
+                        wr("      ")
+                        wr(
+                            self.codemapper.append_mstring(
+                                f"mstr_{label.name}", map_pos(p[0]), map_pos(p[1])
+                            )
+                        )
+                        wr(";\n")
+                wr("      break;\n")
+            wr("    default: abort();\n"
+               "    }\n")
+        else:
+            wr("    (void)pos;\n")
+        wr("    state = NEXT[state][code];\n"
+           "    return RESULT[state];\n"
+           "  }\n\n")
+
+    def _label_mstrings(self, label, bounds):
+        """
+        The m-strings that may hold `label` (the name of a label without
+        a trace): the label is matched on the first trace whose PE has it.
+        """
+        mstrs = [f"pe_{trace}.mstr_{label}" for trace, labels in bounds.items() if label in labels]
+        return mstrs or ["MString()"]
+
+    def _compare_labels(self, lhs, rhs):
+        """
+        Compare the m-strings of two labels, `lhs` and `rhs` are lists of
+        the m-strings that may hold them, the first non-empty one is taken.
+        """
+        if len(lhs) > 1:
+            return (f"(!{lhs[0]}.empty() ? {self._compare_labels(lhs[:1], rhs)}"
+                    f" : {self._compare_labels(lhs[1:], rhs)})")
+        if len(rhs) > 1:
+            return (f"(!{rhs[0]}.empty() ? {self._compare_labels(lhs, rhs[:1])}"
+                    f" : {self._compare_labels(lhs, rhs[1:])})")
+        return f"__mstring_equal({lhs[0]}, {rhs[0]})"
+
+    def _cond_traces(self, cond, bounds):
+        """
+        The names of traces whose labels `cond` reads.
+        """
+        if isinstance(cond, SubWord):
+            return {cond.lhs.name}
+        if isinstance(cond, Label):
+            return {trace for trace, labels in bounds.items() if cond.name.name in labels}
+        if isinstance(cond, (CompareExpr, And, Or)):
+            return self._cond_traces(cond.lhs, bounds) | self._cond_traces(cond.rhs, bounds)
+        return set()
+
+    def _cond_terms(self, cond):
+        """
+        The operands of nested conjunctions (or disjunctions) in `cond`.
+        """
+        if isinstance(cond.lhs, type(cond)):
+            terms = self._cond_terms(cond.lhs)
+        else:
+            terms = [cond.lhs]
+        if isinstance(cond.rhs, type(cond)):
+            return terms + self._cond_terms(cond.rhs)
+        return terms + [cond.rhs]
 
-    def _generate_mpe_cond(self, cond, wr):
-        if isinstance(cond, CompareExpr):
+    def _cond_expr(self, cond, bounds):
+        """
+        The C++ expression that evaluates `cond` and its estimated cost.
+        Operands of conjunctions and disjunctions are evaluated from the cheapest
+        (constants, comparisons of labels, sub-words of single events) to
+        the most expensive (sub-words of unbounded length) and short-circuit.
+        `bounds` are the bounds on labels of PEs (trace -> label -> `LabelBound`).
+        """
+        if cond is None:
+            return "true", 0
+        if isinstance(cond, ConstExpr) and isinstance(cond.value, bool):
+            return ("true" if cond.value else "false"), 0
+        if isinstance(cond, (And, Or)):
+            terms = sorted(
+                (self._cond_expr(t, bounds) for t in self._cond_terms(cond)),
+                key=lambda t: t[1],
+            )
+            op = " && " if isinstance(cond, And) else " || "
+            return f"({op.join(code for code, _ in terms)})", sum(c for _, c in terms)
+        if isinstance(cond, CompareExpr) and cond.comparison in ("==", "!="):
             lhs, rhs = cond.lhs, cond.rhs
-            if isinstance(lhs, SubWord):
-                if isinstance(rhs, SubWord):
-                    # compare two subwords
-                    ltrace = lhs.lhs.name
-                    rtrace = rhs.lhs.name
-                    isnot = cond.comparison == "!="
-                    wr(
-                        f"    return {'!' if isnot else ''}__subword_compare({ltrace}, pe_{ltrace}.mstr_{lhs.label.name.name},"
-                        f" {rtrace}, pe_{rtrace}.mstr_{rhs.label.name.name});\n"
-                    )
+            isnot = "!" if cond.comparison == "!=" else ""
+            if isinstance(lhs, SubWord) and isinstance(rhs, SubWord):
+                # compare two subwords
+                ltrace = lhs.lhs.name
+                rtrace = rhs.lhs.name
+                lbound = bounds[ltrace][lhs.label.name.name]
+                rbound = bounds[rtrace][rhs.label.name.name]
+                # sub-words of single events are compared directly
+                if lbound.single_event and rbound.single_event:
+                    compare, cost = "__subword_compare_single", 2
                 else:
-                    raise NotImplementedError(f"Unhandled condition: {cond}")
-            return
+                    compare, cost = "__subword_compare", 10
+                return (
+                    f"{isnot}{compare}({ltrace}, pe_{ltrace}.mstr_{lhs.label.name.name},"
+                    f" {rtrace}, pe_{rtrace}.mstr_{rhs.label.name.name})",
+                    cost,
+                )
+            if isinstance(lhs, Label) and isinstance(rhs, Label):
+                # labels are compared by the positions they matched
+                code = self._compare_labels(
+                    self._label_mstrings(lhs.name.name, bounds),
+                    self._label_mstrings(rhs.name.name, bounds),
+                )
+                return f"{isnot}{code}", 1
 
         raise NotImplementedError(f"Unhandled condition: {cond}")
 
+    def _cond_viable(self, cond, bounds, traces, members):
+        """
+        The C++ expression that is false only if `cond` cannot hold anymore.
+        A comparison whose traces are done (their PEs accepted) is evaluated
+        once and its result is kept, an equality of sub-words is checked
+        on the known prefixes of the sub-words until then. `members` gets
+        the declarations of the members of the MPE that keep the state
+        of the checks.
+        """
+        if isinstance(cond, (And, Or)):
+            terms = sorted(
+                self._cond_terms(cond), key=lambda t: self._cond_expr(t, bounds)[1]
+            )
+            op = " && " if isinstance(cond, And) else " || "
+            return f"({op.join(self._cond_viable(t, bounds, traces, members) for t in terms)})"
+        code, _ = self._cond_expr(cond, bounds)
+        if not isinstance(cond, CompareExpr):
+            return code
+
+        done = " && ".join(
+            f"done[{traces.index(t)}]" for t in sorted(self._cond_traces(cond, bounds))
+        ) or "true"
+        partial = "true"
+        lhs, rhs = cond.lhs, cond.rhs
+        k = len(members)
+        if cond.comparison == "==" and isinstance(lhs, SubWord) and isinstance(rhs, SubWord):
+            l, r = traces.index(lhs.lhs.name), traces.index(rhs.lhs.name)
+            members.append(f"SubwordPrefixCompare _cond_prefix{k};")
+            partial = (
+                f"_cond_prefix{k}.check({lhs.lhs.name}, pe_{lhs.lhs.name}.mstr_{lhs.label.name.name}, known[{l}], done[{l}],"
+                f" {rhs.lhs.name}, pe_{rhs.lhs.name}.mstr_{rhs.label.name.name}, known[{r}], done[{r}])"
+            )
+        members.append(f"signed char _cond_atom{k}{{-1}};")
+        atom = f"_cond_atom{k}"
+        return f"({done} ? ({atom} < 0 ? ({atom} = {code}) : {atom}) : {partial})"
+
+    def _has_cond_viable(self, cond):
+        """
+        Is the condition checked before all PEs accepted (`args.incremental_cond`)?
+        """
+        return self.args.incremental_cond and cond is not None
+
+    def _generate_mpe_cond_viable(self, transition, wr, bounds):
+        """
+        `condViable` returns false once the condition of the transition cannot
+        hold anymore, given the positions after the last read events on traces
+        (`known`) and the traces whose PEs accepted (`done`).
+        """
+        traces = [trace.name for trace in transition.mpe.exprs.keys()]
+        params = "".join(f", const Trace<TraceEvent> *{trace}" for trace in traces)
+        if not self._has_cond_viable(transition.cond):
+            unnamed = ", const Trace<TraceEvent> *" * len(traces)
+            wr(f"  bool condViable(const size_t *, const bool *{unnamed}) {{ return true; }}\n\n")
+            return
+
+        members = []
+        code = self._cond_viable(transition.cond, bounds, traces, members)
+        wr("  // the state of checking the condition before all PEs accepted\n")
+        for m in members:
+            wr(f"  {m}\n")
+        wr(f"  bool condViable(const size_t *known, const bool *done{params}) {{\n")
+        for param in ["known", "done"] + traces:
+            if not re.search(rf"\b{param}\b", code):
+                wr(f"    (void){param};\n")
+        wr(f"    return {code};\n"
+           "  }\n\n")
+
     def _generate_mpe(self, transition, wr):
         mpe = transition.mpe
         mpe_name = f"MPE_{transition.start.name}_{transition.end.name}"
         pes = []
-        for trace, pe in mpe.exprs.items():
+        bounds = {}
+        # labels that no condition reads are stripped, so they are not tracked
+        for trace, pe in live_pes(transition).items():
             pe_name = f"{mpe_name}_PE_{trace.name}"
-            self._generate_pe(pe, pe_name, wr)
+            try:
+                bounds[trace.name] = self._generate_pe(pe, pe_name, wr)
+            except PETBudgetExceeded as e:
+                e.where = f"transition {transition.start.name} -> {transition.end.name}, trace {trace.name}"
+                raise
             pes.append((pe_name, trace))
             #print(trace, pe)
 
@@ -259,12 +959,31 @@ class CodeGenCpp(CodeGen):
             f"const Trace<TraceEvent> *{trace.name}" for trace in mpe.exprs.keys()
         )
         wr(f"  bool cond({', '.join(params)}) const {{\n")
-        self._generate_mpe_cond(cond, wr)
+        wr(f"    return {self._cond_expr(cond, bounds)[0]};\n")
         wr("  }\n\n")
+        self._generate_mpe_cond_viable(transition, wr, bounds)
         wr("};\n\n")
 
         return mpe_name
 
+    def _reductions(self, mpt):
+        """
+        The reductions of tuples of traces: the reductions given by the user
+        and the reductions that the analysis of the MPT proves sound.
+        """
+        if not self.args.auto_reduction:
+            return list(self.args.reduction)
+
+        detected = detect_reductions(mpt)
+        for r in self.args.reduction:
+            if r not in detected:
+                print(f"warning: the reduction '{r}' was requested, but it is not "
+                      "provably sound for this MPT", file=stderr)
+        if self.args.verbose:
+            print(f"Reductions proved sound: {', '.join(detected) or 'none'}", file=stderr)
+        return [r for r in ("symmetry", "reflexivity")
+                if r in detected or r in self.args.reduction]
+
     def _generate_add_cfgs(self, mpt, wr):
         wr("template <typename TracesT>\n")
         wr(
@@ -274,22 +993,28 @@ class CodeGenCpp(CodeGen):
         N = len(mpt.traces_in) - 1
         assert N < mpt.get_max_outdegree(), mpt
 
-        for i in range(0, N):
-            wr(f"  for (auto &t{i} : traces) {{\n")
+        if "symmetry" in self.reduction:
+            # combinations (with repetition) of traces, the new trace is the last one
+            for i in range(0, N):
+                first = "0" if i == 0 else f"i{i - 1}"
+                wr(f"  for (size_t i{i} = {first}; i{i} < traces.size(); ++i{i}) {{\n"
+                   f"    auto &t{i} = traces[i{i}];\n")
+        else:
+            for i in range(0, N):
+                wr(f"  for (auto &t{i} : traces) {{\n")
 
-        if "reflexivity" in self.args.reduction:
+        if "reflexivity" in self.reduction:
             cond = " && ".join((f"trace == t{i}.get()" for i in range(0, N)))
             wr(f"    if ({cond}) // reduction: reflexivity\n"
                    "      continue;\n\n")
         wr("    S.clear();\n")
 
-        assert self.cfgs
+        init_cfgs = self._state_cfgs(mpt, mpt.init_state)
+        assert init_cfgs
 
-        if "symmetry" in self.args.reduction:
+        if "symmetry" in self.reduction:
             traces = ", ".join(f"t{i}.get()" if i != N else "trace" for i in range(0, N+1))
-            for n, cfg, transition in self.cfgs:
-                if not mpt.is_init_transition(transition):
-                    continue
+            for cfg in init_cfgs:
                 wr(f"    S.add({cfg}({{{traces}}}));\n")
             wr("    workbag.push(std::move(S));\n")
         else:
@@ -297,9 +1022,7 @@ class CodeGenCpp(CodeGen):
                 if idx > 0:
                     wr("\n    S.clear();\n")
                 traces = ", ".join(f"t{i}.get()" if i != N else "trace" for i in P)
-                for n, cfg, transition in self.cfgs:
-                    if not mpt.is_init_transition(transition):
-                        continue
+                for cfg in init_cfgs:
                     wr(f"    S.add({cfg}({{{traces}}}));\n")
                 wr("    workbag.push(std::move(S));\n")
 
@@ -310,8 +1033,16 @@ class CodeGenCpp(CodeGen):
         wr("}\n\n")
 
 
-    def _generate_cfg(self, mpt, transition, cf, cfcpp, mfwr):
-        mpe_name = self._generate_mpe(transition, mfwr)
+    def _state_cfgs(self, mpt, state):
+        """
+        The names of the configurations that are created when `state` is entered.
+        """
+        for _, cfg, fused in self.fused_cfgs:
+            if fused == state:
+                return [cfg]
+        return [f"Cfg_{t.start.name}_{t.end.name}" for t in mpt.delta.get(state, [])]
+
+    def _generate_cfg(self, mpt, transition, mpe_name, cf, cfcpp):
         cfg_name = f"Cfg_{transition.start.name}_{transition.end.name}"
         cfwr = cf.write
         K = len(transition.mpe.exprs)
@@ -324,22 +1055,21 @@ class CodeGenCpp(CodeGen):
             f"  static constexpr size_t TRACES_NUM = {len(transition.mpe.exprs)};\n\n"
             f"  void queueNextConfigurations(WorkbagBase& workbag);\n\n")
 
-        self.input_file(cf, "partials/cfg_methods.h")
+        traces = ", ".join(f"trace({i})" for i in range(0, K))
+        self.input_file(cf, "partials/cfg_methods.h", {"@traces@": traces})
 
         cfwr("};\n\n")
         cfwr(f"std::ostream &operator<<(std::ostream &s, const {cfg_name}& c);\n\n")
 
         wr = cfcpp.write
         wr(f"void {cfg_name}::queueNextConfigurations(WorkbagBase& workbag) {{\n")
-        cond = ", ".join(f"trace({i})" for i in range(0, K))
-        wr(f"  assert (mPE.accepted() && mPE.cond({cond}));\n\n")
-        S = mpt.successors(transition)
+        wr(f"  assert (mPE.accepted() && mPE.cond({traces}));\n\n")
+        S = self._state_cfgs(mpt, transition.end)
         if S:
-            wr(f"  ConfigurationsSet<{mpt.get_max_outdegree()}> S;\n\n")
-            for succ in S:
-                succ_cfg_name = f"Cfg_{succ.start.name}_{succ.end.name}"
+            wr(f"  ConfigurationsSet<AnyCfg, {mpt.get_max_outdegree()}> S;\n\n")
+            for succ_cfg_name in S:
                 wr(f"  S.add({succ_cfg_name}(traces, positions));\n")
-            wr(f"  static_cast<Workbag<ConfigurationsSet<{mpt.get_max_outdegree()}>>&>(workbag).push(std::move(S));\n")
+            wr(f"  static_cast<Workbag<ConfigurationsSet<AnyCfg, {mpt.get_max_outdegree()}>>&>(workbag).push(std::move(S));\n")
         wr("}\n\n")
 
         if self.args.debug:
@@ -364,14 +1094,253 @@ class CodeGenCpp(CodeGen):
 
         return cfg_name
 
+    def _fuse_state(self, mpt, state):
+        """
+        The products of the PETs of the outgoing transitions of `state`
+        (name of trace -> `ProductPET`), or None if the transitions
+        of `state` are not fused.
+        """
+        transitions = mpt.delta.get(state, [])
+        # the transitions are tracked in bit masks of 64 bits
+        if not self.args.fuse_transitions or not 2 <= len(transitions) <= 64:
+            return None
+        traces = [trace.name for trace in transitions[0].mpe.exprs]
+        if any([trace.name for trace in t.mpe.exprs] != traces for t in transitions):
+            return None
+
+        pes = [{trace.name: pe for trace, pe in live_pes(t).items()} for t in transitions]
+        products = {}
+        for trace in traces:
+            try:
+                products[trace] = ProductPET(
+                    [self.pets[p[trace]] for p in pes], MAX_PRODUCT_STATES
+                )
+            except ValueError as e:
+                if self.args.verbose:
+                    print(f"Not fusing the transitions from {state.name}: {e}", file=stderr)
+                return None
+        return products
+
+    def _generate_product_edge(self, state, edge, idx, trace, members, wr, indent="          "):
+        for k, out in edge.outputs:
+            wr(f"{indent}// output of {members[k]}: {out};\n")
+            for label, pos in out.items():
+                for p in pos:
+                    wr(indent)
+                    wr(
+                        self.codemapper.append_mstring(
+                            f"{members[k]}.pe_{trace}.mstr_{label.name}",
+                            map_pos(p[0]),
+                            map_pos(p[1]),
+                        )
+                    )
+                    wr(";\n")
+        if edge.accepted:
+            wr(f"{indent}accepted |= {hex(sum(1 << k for k in edge.accepted))}ull;\n")
+        if edge.rejected:
+            wr(f"{indent}rejected |= {hex(sum(1 << k for k in edge.rejected))}ull;\n")
+        if edge.succ is not state:
+            wr(f"{indent}state[{idx}] = {edge.succ.id};\n")
+        wr(f"{indent}return;\n")
+
+    def _generate_fused_mpe(self, mpt, state, products, wr):
+        """
+        The MPEs of the outgoing transitions of `state` where each trace
+        is read by the product of the PETs of the transitions.
+        """
+        transitions = mpt.delta[state]
+        mpe_name = f"MPE_{state.name}"
+        members = [f"mpe_{t.start.name}_{t.end.name}" for t in transitions]
+        traces = list(products)
+
+        wr(f"struct {mpe_name} {{\n")
+        for t, member in zip(transitions, members):
+            wr(f"  MPE_{t.start.name}_{t.end.name} {member};\n")
+        wr(f"  // states of the products of PETs on traces\n"
+           f"  size_t state[{len(traces)}] = {{0}};\n\n")
+
+        wr("  // `accepted` and `rejected` get the masks of transitions whose PEs\n"
+           "  // accepted or rejected on this event\n"
+           "  void step(size_t idx, const TraceEvent *ev, size_t pos,\n"
+           "            unsigned long long &accepted, unsigned long long &rejected) {\n"
+           "    switch (idx) {\n")
+        for idx, trace in enumerate(traces):
+            wr(f"    case {idx}: step_{trace}(ev, pos, accepted, rejected); break;\n")
+        wr("    default: abort();\n"
+           "    }\n"
+           "  }\n\n")
+
+        for idx, trace in enumerate(traces):
+            product = products[trace]
+            wr(f"  void step_{trace}(const TraceEvent *ev, size_t pos,\n"
+               f"    {' ' * len(trace)}      unsigned long long &accepted, unsigned long long &rejected) {{\n"
+               f"    switch (state[{idx}]) {{\n")
+            for s in product.states.values():
+                wr(f"      case {s.id}: {{ // {s}\n")
+                if s.is_final():
+                    # all PEs accepted or rejected, the trace is not read anymore
+                    wr("        return;\n"
+                       "        }\n")
+                    continue
+                for letters, edge in product.edges(s):
+                    test = " || ".join(
+                        (f"(Kind)ev->kind() == Kind::{ev_kind(l)}" for l in letters)
+                    )
+                    wr(f"        if ({test}) {{ // {', '.join(map(str, letters))}\n")
+                    self._generate_product_edge(s, edge, idx, trace, members, wr)
+                    wr("        }\n")
+                wr("        // default\n")
+                self._generate_product_edge(s, s.default, idx, trace, members, wr, indent="        ")
+                wr("        }\n")
+            wr("      default: abort();\n"
+               "    }\n"
+               "  }\n\n")
+
+        params = ", ".join(f"const Trace<TraceEvent> *{trace}" for trace in traces)
+        args = ", ".join(traces)
+        wr(f"  bool cond(unsigned transition, {params}) const {{\n"
+           "    switch (transition) {\n")
+        for j, member in enumerate(members):
+            wr(f"    case {j}: return {member}.cond({args});\n")
+        wr("    default: abort();\n"
+           "    }\n"
+           "  }\n\n")
+
+        wr(f"  bool condViable(unsigned transition, const size_t *known, const bool *done, {params}) {{\n"
+           "    switch (transition) {\n")
+        for j, member in enumerate(members):
+            wr(f"    case {j}: return {member}.condViable(known, done, {args});\n")
+        wr("    default: abort();\n"
+           "    }\n"
+           "  }\n"
+           "};\n\n")
+        return mpe_name
+
+    def _fused_cond_viable(self, transitions, K, traces):
+        """
+        The code that drops the transitions whose conditions cannot hold anymore.
+        """
+        code = ""
+        for j, transition in enumerate(transitions):
+            if not self._has_cond_viable(transition.cond):
+                continue
+            code += (f"    if (_alive & (1ull << {j})) {{ // {transition.start.name} -> {transition.end.name}\n"
+                     f"      bool done[{K}];\n"
+                     f"      for (size_t i = 0; i < {K}; ++i)\n"
+                     f"        done[i] = _accepted[i] & (1ull << {j});\n"
+                     f"      if (!mPE.condViable({j}, positions, done, {traces}))\n"
+                     f"        _alive &= ~(1ull << {j});\n"
+                      "    }\n")
+        return code
+
+    def _generate_fused_cfg(self, mpt, state, mpe_name, cf, cfcpp):
+        transitions = mpt.delta[state]
+        cfg_name = f"Cfg_{state.name}"
+        K = len(transitions[0].mpe.exprs)
+        D = len(transitions)
+        traces = ", ".join(f"trace({i})" for i in range(0, K))
+        cfwr = cf.write
+        cfwr(
+            f"// all transitions from {state.name}, every trace is read once for all of them\n"
+            f"class {cfg_name} : public Configuration <Trace<TraceEvent>, {K}> {{\n\n"
+            f"  {mpe_name} mPE;\n"
+             "  // transitions that may still match and transitions whose PEs accepted on traces\n"
+            f"  unsigned long long _alive{{{hex((1 << D) - 1)}ull}};\n"
+            f"  unsigned long long _accepted[{K}] = {{0}};\n"
+             "  // positions where the PEs of transitions accepted\n"
+            f"  size_t _ends[{D}][{K}];\n"
+            f"  unsigned _matched{{{D}}};\n\n"
+             "public:\n"
+            f"  {cfg_name}(const std::array<Trace<TraceEvent> *, {K}> &tr) : Configuration(tr) {{}}\n"
+            f"  {cfg_name}(const std::array<Trace<TraceEvent> *, {K}> &tr, size_t pos[{K}]) : Configuration(tr, pos) {{}}\n\n"
+            f"  static constexpr size_t TRACES_NUM = {K};\n\n"
+             "  void queueNextConfigurations(WorkbagBase& workbag);\n\n"
+             "  // the transition that matched\n"
+             "  unsigned matched() const { return _matched; }\n"
+             "  unsigned long long alive() const { return _alive; }\n\n"
+             "  bool canProceed(size_t idx) const {\n"
+             "    return (_alive & ~_accepted[idx]) != 0 && trace(idx)->size() > positions[idx];\n"
+             "  }\n\n"
+             "  void step(size_t idx) {\n"
+             "    assert(canProceed(idx) && \"Step on invalid PE\");\n\n"
+             "    const TraceEvent *ev = static_cast<const TraceEvent*>(trace(idx)->get(positions[idx]));\n"
+             "    assert(ev && \"No event\");\n"
+             "    unsigned long long accepted = 0, rejected = 0;\n"
+             "    mPE.step(idx, ev, positions[idx], accepted, rejected);\n\n"
+             "    ++positions[idx];\n\n"
+             "    _alive &= ~rejected;\n"
+             "    _accepted[idx] |= accepted;\n"
+            f"    for (unsigned j = 0; j < {D}; ++j) {{\n"
+             "      if (accepted & (1ull << j))\n"
+             "        _ends[j][idx] = positions[idx];\n"
+             "    }\n"
+            f"{self._fused_cond_viable(transitions, K, traces)}"
+             "  }\n\n"
+             "  // check the conditions of transitions whose PEs accepted on all traces\n"
+             "  PEStepResult resolve() {\n"
+            f"    for (unsigned j = 0; j < {D}; ++j) {{\n"
+             "      const unsigned long long bit = 1ull << j;\n"
+             "      bool accepted = _alive & bit;\n"
+            f"      for (size_t idx = 0; idx < {K}; ++idx)\n"
+             "        accepted = accepted && (_accepted[idx] & bit);\n"
+             "      if (!accepted)\n"
+             "        continue;\n"
+            f"      if (mPE.cond(j, {traces})) {{\n"
+             "        _matched = j;\n"
+             "        return PEStepResult::Accept;\n"
+             "      }\n"
+             "      _alive &= ~bit;\n"
+             "    }\n"
+             "    if (_alive == 0) {\n"
+             "      _failed = true;\n"
+             "      return PEStepResult::Reject;\n"
+             "    }\n"
+             "    return PEStepResult::None;\n"
+             "  }\n"
+             "};\n\n"
+            f"std::ostream &operator<<(std::ostream &s, const {cfg_name}& c);\n\n"
+        )
+
+        wr = cfcpp.write
+        wr(f"void {cfg_name}::queueNextConfigurations(WorkbagBase& workbag) {{\n"
+            "  switch (_matched) {\n")
+        for j, transition in enumerate(transitions):
+            wr(f"  case {j}: {{ // {transition.start.name} -> {transition.end.name}\n")
+            S = self._state_cfgs(mpt, transition.end)
+            if S:
+                wr(f"    ConfigurationsSet<AnyCfg, {mpt.get_max_outdegree()}> S;\n")
+                for succ_cfg_name in S:
+                    wr(f"    S.add({succ_cfg_name}(traces, _ends[{j}]));\n")
+                wr(f"    static_cast<Workbag<ConfigurationsSet<AnyCfg, {mpt.get_max_outdegree()}>>&>(workbag).push(std::move(S));\n")
+            wr("    break;\n"
+               "  }\n")
+        wr("  default: abort();\n"
+           "  }\n"
+           "}\n\n")
+
+        if self.args.debug:
+            wr(f"std::ostream &operator<<(std::ostream & s, const {cfg_name}& c) {{\n"
+               f'  s << "{cfg_name} {{fail: " << c.failed() << ", alive: " << c.alive() << ", pos=[" ')
+            for i in range(0, K):
+                if i > 0:
+                    wr('<< ", " ')
+                wr(f'<< c.pos({i})')
+            wr('  << "]}";\n'
+               '  return s;\n'
+               "}\n\n")
+
+        return cfg_name
+
     def _generate_AnyCfg(self, cfgs):
         """
         This is a union of all configurations. It has smaller overhead than std::variant, so we use this.
         """
         with self.new_file("anycfg.h") as cf:
             wr = cf.write
-            wr("#ifndef OD_ANYCFG_H_\n#define OD_ANYCFG_H_\n\n")
+            guard = self._guard("ANYCFG")
+            wr(f"#ifndef {guard}\n#define {guard}\n\n")
             wr('#include "cfgs.h"\n\n')
+            self._namespace_begin(wr)
 
             wr("struct AnyCfg {\n" f"  unsigned short _idx{{{len(cfgs)}}};\n\n")
             wr("  auto index() const -> auto{ return _idx; }\n\n")
@@ -427,43 +1396,111 @@ class CodeGenCpp(CodeGen):
             )
 
             wr("};\n\n")
+            self._namespace_end(wr)
             wr("#endif\n")
 
     def _generate_cfgs(self, mpt):
         mf = self.new_file("mpes.h")
         cf = self.new_file("cfgs.h")
-        cfcpp = self.new_file("cfgs.cpp")
-        self.input_file(cfcpp, "partials/cfgs.cpp")
+        # the methods of configurations are spread over `args.split_cfgs`
+        # sources, so that they can be compiled in parallel
+        units = []
+        for name in self._cfg_units():
+            unit = self.new_file(name)
+            unit.write('#include <cassert>\n#include <iostream>\n\n'
+                       '#include "anycfg.h"\n#include "cfgs.h"\n#include "cfgset.h"\n#include "workbag.h"\n\n')
+            if name == "cfgs.cpp" and not self.prop:
+                # with several MPTs, it is defined in the monitor of all of them
+                self.input_file(unit, "partials/pe_step_result.cpp")
+            self._namespace_begin(unit.write)
+            units.append(unit)
+
+        def cfg_unit():
+            return units[(len(cfgs) + len(fused_cfgs)) % len(units)]
 
         mfwr = mf.write
-        mfwr("#ifndef OD_MPES_H_\n#define OD_MPES_H_\n\n")
+        guard = self._guard("MPES")
+        mfwr(f"#ifndef {guard}\n#define {guard}\n\n")
         mfwr('#include "trace.h"\n\n')
         mfwr('#include "prefixexpr.h"\n\n')
         mfwr('#include "subword-compare.h"\n\n')
+        if self.args.profile_generate:
+            mfwr('#include "profile.h"\n\n')
+        self._namespace_begin(mfwr)
 
         cfwr = cf.write
-        cfwr("#ifndef OD_CFGS_H_\n#define OD_CFGS_H_\n\n")
+        guard = self._guard("CFGS")
+        cfwr(f"#ifndef {guard}\n#define {guard}\n\n")
         cfwr('#include "mpes.h"\n')
         cfwr('#include "cfg.h"\n\n')
         cfwr('class WorkbagBase;\n\n')
         if self.args.debug:
             cfwr('#include <iostream>\n\n')
+        self._namespace_begin(cfwr)
+
+        if self.args.jobs > 1:
+            with profile_phase(self.profile, "codegen/pets"):
+                self._build_pets_parallel(mpt)
+
+        mpes = []
+        for transition in mpt.transitions:
+            start = perf_counter()
+            mpes.append(self._generate_mpe(transition, mfwr))
+            if self.profile:
+                self.profile.add_transition(
+                    f"{transition.start.name} -> {transition.end.name}",
+                    perf_counter() - start,
+                    [f"MPE_{transition.start.name}_{transition.end.name}_PE_{trace.name}"
+                     for trace in transition.mpe.exprs],
+                )
 
-        cfgs = []
-        for n, transition in enumerate(mpt.transitions):
-            cfg_name = self._generate_cfg(mpt, transition, cf, cfcpp, mfwr)
-            cfgs.append((n, cfg_name, transition))
-
-        self._generate_AnyCfg(cfgs)
+        # the states whose transitions are fused must be known before
+        # generating the configurations that enter them
+        fused = []
+        for state in sorted(mpt.delta, key=lambda s: mpt.transitions.index(mpt.delta[s][0])):
+            products = self._fuse_state(mpt, state)
+            if products is not None:
+                fused.append((state, products))
+                self.fused_cfgs.append((None, f"Cfg_{state.name}", state))
+
+        cfgs, fused_cfgs = [], []
+        for transition, mpe_name in zip(mpt.transitions, mpes):
+            if any(state == transition.start for state, _ in fused):
+                continue
+            cfg_name = self._generate_cfg(mpt, transition, mpe_name, cf, cfg_unit())
+            cfgs.append((len(cfgs), cfg_name, transition))
         self.cfgs = cfgs
 
+        for state, products in fused:
+            mpe_name = self._generate_fused_mpe(mpt, state, products, mfwr)
+            cfg_name = self._generate_fused_cfg(mpt, state, mpe_name, cf, cfg_unit())
+            fused_cfgs.append((len(cfgs) + len(fused_cfgs), cfg_name, state))
+        self.fused_cfgs = fused_cfgs
+
+        if self.monitor_profile:
+            # the most often moved configurations get the lowest indices,
+            # they come first in `AnyCfg` and in the switch of the monitor
+            order = sorted(
+                cfgs + fused_cfgs,
+                key=lambda c: -self._profile_count(MonitorProfile.cfg_key(c[1])),
+            )
+            index = {c[1]: n for n, c in enumerate(order)}
+            self.cfgs = cfgs = [(index[c], c, t) for _, c, t in cfgs]
+            self.fused_cfgs = fused_cfgs = [(index[c], c, s) for _, c, s in fused_cfgs]
+
+        self._generate_AnyCfg(sorted(cfgs + fused_cfgs, key=lambda c: c[0]))
+
+        self._namespace_end(mfwr)
+        self._namespace_end(cfwr)
         mfwr("#endif")
         cfwr("#endif")
         mf.close()
         cf.close()
-        cfcpp.close()
+        for unit in units:
+            self._namespace_end(unit.write)
+            unit.close()
 
-    def _generate_events(self, mpt):
+    def _generate_events(self):
         with self.new_file("events.h") as f:
             wr = f.write
             wr("#ifndef OD_EVENTS_H_\n#define OD_EVENTS_H_\n\n")
@@ -472,16 +1509,29 @@ class CodeGenCpp(CodeGen):
 
             wr("enum class Kind : vms_kind {\n")
             wr("  END = Event::doneKind(),\n")
-            for n, event in enumerate(mpt.alphabet):
+            for n, event in enumerate(self.alphabet):
                 wr(
                     f'  {event.name.name}{" = Event::firstValidKind()" if n == 0 else ""},\n'
                 )
             wr("};\n\n")
 
+            if self.args.pe_backend == "table":
+                K = len(self.alphabet)
+                first = f"(vms_kind)Kind::{self.alphabet[0].name.name}" if K else "Event::firstValidKind()"
+                wr("// codes of kinds of events for the tables of PEs: the kinds\n"
+                   f"// of events are 0 to {K - 1}, END is {K} and other kinds are {K + 1}\n"
+                   f"static constexpr size_t KINDS_NUM = {K + 2};\n\n"
+                   "inline size_t kindCode(vms_kind kind) {\n"
+                   f"  const vms_kind code = kind - {first};\n"
+                   f"  if (code < {K})\n"
+                   "    return code;\n"
+                   f"  return kind == (vms_kind)Kind::END ? {K} : {K + 1};\n"
+                   "}\n\n")
+
             wr("struct TraceEvent : Event {\n")
             wr("  union {\n")
             c_type = self.codemapper.c_type
-            for event in mpt.alphabet:
+            for event in self.alphabet:
                 sname = event.name.name
                 wr(f"    struct _{sname} {{\n")
                 for field in event.fields:
@@ -510,7 +1560,7 @@ class CodeGenCpp(CodeGen):
                 "    switch (kind()) {\n"
                 "      case (vms_kind)Kind::END: return true;\n"
             )
-            for event in mpt.alphabet:
+            for event in self.alphabet:
                 sname = event.name.name
                 wr(
                     f"      case (vms_kind)Kind::{sname}: return data.{sname} == rhs.data.{sname};\n"
@@ -523,7 +1573,7 @@ class CodeGenCpp(CodeGen):
             )
             wr("};\n\n")
 
-            for event in mpt.alphabet:
+            for event in self.alphabet:
                 sname = event.name.name
                 wr(f"// Wrapper around event `{sname}` for simple construction\n")
                 wr(f"struct Event_{sname} : public TraceEvent {{\n")
@@ -560,7 +1610,7 @@ class CodeGenCpp(CodeGen):
             wr('    case Kind::END: s << "END" << color_reset'
                '                      << ", " << color_red << std::setw(2) << std::right << ev.id() << color_reset;\n'
                '      break;\n')
-            for event in mpt.alphabet:
+            for event in self.alphabet:
                 wr(
                     f"    case Kind::{event.name.name}:\n"
                     f'      s << "{event.name.name}"\n'
@@ -568,8 +1618,6 @@ class CodeGenCpp(CodeGen):
                     ' << std::right << ev.id() << color_reset;\n'
                 )
 
-                if not event.fields:
-                    continue
                 for n, field in enumerate(event.fields):
                     wr(f'      s << ", ";\n')
                     wr(
@@ -586,17 +1634,71 @@ class CodeGenCpp(CodeGen):
             wr("}\n\n")
             wr("#endif\n")
 
+    def _generate_output(self, mpt, transition, wr):
+        out = transition.output
+        if out and mpt.has_single_boolean_output():
+            assert len(out) == 1, out
+            if out[0].value is False:
+                if self.args.debug or self.args.verbose:
+                    prop = f"{self.prop}: " if self.prop else ""
+                    wr(f'            std::cout << "\033[1;31m{prop}PROPERTY VIOLATED!\033[0m\\n";\n')
+                if self.prop:
+                    wr( "           _violated = true;\n")
+                if self.args.exit_on_error:
+                    wr( "           goto violated;\n")
+            elif out[0].value is True:
+                wr("           /* out: true */\n")
+            else:
+                raise NotImplementedError(f"Non-boolean output not implemented: {transition.output}")
+
+    def _generate_move_result(self, wr):
+        wr( "            // fall-through\n")
+        wr( "          case CFGSET_DONE:\n"
+            "            C.setInvalid();\n"
+            "            ++wbg_invalid;\n"
+            "            goto outer_loop;\n"
+            "            break;\n"
+            "          case NONE:\n"
+            "          case CFG_FAILED: // remove c from C\n"
+            "            break;\n"
+            "           }\n")
+        wr( '          break;\n'
+            '          }\n')
+
+    def _generate_fused_move(self, mpt, cfg, state, wr):
+        if self.args.debug:
+            wr(f'          std::cout << "-- " << cfg;\n')
+        K = len(mpt.delta[state][0].mpe.exprs)
+        wr(f"          auto move_result = move_fused_cfg<{cfg}, {K}>(new_workbag, cfg);\n")
+        if self.args.debug:
+            wr(f'          std::cout << "\\n~> " << cfg  << "\\n=> " << actionToStr(move_result) << "\\n";\n')
+        wr(f"          switch (move_result) {{\n"
+            "          case CFGSET_MATCHED:\n"
+            "            switch (cfg.matched()) {\n")
+        for j, transition in enumerate(mpt.delta[state]):
+            wr(f"            case {j}: // {transition.start.name} -> {transition.end.name}\n")
+            self._generate_output(mpt, transition, wr)
+            wr("              break;\n")
+        wr("            }\n")
+        self._generate_move_result(wr)
+
     def _generate_monitor_core(self, mpt, wr):
         wr('      for (auto &c : C) {\n'
            '        switch (c.index()) {\n')
-        for n, cfg, transition in self.cfgs:
+        fused = {cfg for _, cfg, _ in self.fused_cfgs}
+        for n, cfg, x in sorted(self.cfgs + self.fused_cfgs, key=lambda c: c[0]):
             wr(f"        case {n}: /* {cfg} */ {{\n"
                f"          auto &cfg = c.cfg.{cfg.lower()};\n"
                 "          if (cfg.failed()) {\n"
                 "              continue;\n"
                 "          }\n"
                 "          non_empty = true;\n")
+            self._profile_hit(MonitorProfile.cfg_key(cfg), wr, "          ")
+            if cfg in fused:
+                self._generate_fused_move(mpt, cfg, x, wr)
+                continue
 
+            transition = x
             if self.args.debug:
                 wr(f'          std::cout << "-- " << cfg;\n')
             wr(f"          auto move_result = move_cfg<{cfg}, {len(transition.mpe.exprs)}>(new_workbag, cfg);\n")
@@ -604,30 +1706,8 @@ class CodeGenCpp(CodeGen):
                 wr(f'          std::cout << "\\n~> " << cfg  << "\\n=> " << actionToStr(move_result) << "\\n";\n')
             wr(f"          switch (move_result) {{\n"
                 "          case CFGSET_MATCHED:\n")
-            out = transition.output
-            if out and mpt.has_single_boolean_output():
-                assert len(out) == 1, out
-                if out[0].value is False:
-                    if self.args.debug or self.args.verbose:
-                        wr('            std::cout << "\033[1;31mPROPERTY VIOLATED!\033[0m\\n";\n')
-                    if self.args.exit_on_error:
-                        wr( "           goto violated;\n")
-                elif out[0].value is True:
-                    wr("           /* out: true */\n")
-                else:
-                    raise NotImplementedError(f"Non-boolean output not implemented: {transition.output}")
-            wr( "            // fall-through\n")
-            wr( "          case CFGSET_DONE:\n"
-                "            C.setInvalid();\n"
-                "            ++wbg_invalid;\n"
-                "            goto outer_loop;\n"
-                "            break;\n"
-                "          case NONE:\n"
-                "          case CFG_FAILED: // remove c from C\n"
-                "            break;\n"
-                "           }\n")
-            wr( '          break;\n'
-                '          }\n')
+            self._generate_output(mpt, transition, wr)
+            self._generate_move_result(wr)
         wr ( '         default:\n'
              '           assert(false && "Unknown configuration"); abort();\n'
              '           }\n'
@@ -654,29 +1734,232 @@ class CodeGenCpp(CodeGen):
             wr('#include "workbag.h"\n')
             wr('#include "inputs.h"\n\n')
 
-            wr('#include "cfgs.h"\n\n')
+            wr('#include "cfgs.h"\n')
+            wr('#include "anycfg.h"\n\n')
 
-            wr(f'using ConfigurationsSetTy = ConfigurationsSet<{mpt.get_max_outdegree()}>;\n')
+            wr(f'using ConfigurationsSetTy = ConfigurationsSet<AnyCfg, {mpt.get_max_outdegree()}>;\n')
             wr(f'using WorkbagTy = Workbag<ConfigurationsSetTy>;\n\n')
 
             self._generate_add_cfgs(mpt, wr)
 
             self.input_file(f, "partials/update_traces.h")
             self.input_file(f, "partials/move_cfg.h")
+            if self.fused_cfgs:
+                self.input_file(f, "partials/move_fused_cfg.h")
 
             self.input_file(f, "partials/monitor_begin.h")
             self._generate_monitor_core(mpt, wr)
             self.input_file(f, "partials/monitor_end.h")
 
+    def _generate_property(self, mpt):
+        """
+        The monitor of one of several MPTs (`self.prop`): the class `Property`
+        with the workbags of the MPT, it is moved by the monitor of all
+        the MPTs (`_generate_properties_monitor`).
+        """
+        with self.new_file("property.h") as f:
+            wr = f.write
+            guard = self._guard("PROPERTY")
+            wr(f"#ifndef {guard}\n#define {guard}\n\n")
+            wr("#include <memory>\n#include <vector>\n\n")
+            wr('#include "events.h"\n')
+            wr('#include "trace.h"\n')
+            wr('#include "anycfg.h"\n')
+            wr('#include "cfgset.h"\n')
+            wr('#include "workbag.h"\n\n')
+            self._namespace_begin(wr)
+
+            wr(f'using ConfigurationsSetTy = ConfigurationsSet<AnyCfg, {mpt.get_max_outdegree()}>;\n')
+            wr(f'using WorkbagTy = Workbag<ConfigurationsSetTy>;\n')
+            wr('using Traces = std::vector<std::unique_ptr<Trace<TraceEvent>>>;\n\n')
+            wr("class Property {\n"
+               "  WorkbagTy workbag;\n"
+               "  WorkbagTy new_workbag;\n"
+               "  bool _violated{false};\n"
+               "  size_t _max_wbg_size{0};\n\n"
+               "public:\n"
+               "  // add the configurations for the tuples of traces with the new `trace`\n"
+               "  void addTrace(const Traces &traces, Trace<TraceEvent> *trace);\n"
+               "  // move every configuration in the workbag once\n"
+               "  void step();\n\n"
+               "  bool violated() const { return _violated; }\n"
+               "  bool done() { return workbag.empty(); }\n"
+               "  size_t maxWorkbagSize() const { return _max_wbg_size; }\n"
+               "};\n\n")
+            self._namespace_end(wr)
+            wr("#endif\n")
+
+        with self.new_file("monitor.cpp") as f:
+            wr = f.write
+            wr("#include <algorithm>\n")
+            wr("#include <iostream>\n")
+            wr("#include <cassert>\n\n")
+
+            wr('#include "events.h"\n')
+            wr('#include "monitor.h"\n')
+            wr('#include "trace.h"\n')
+            wr('#include "prefixexpr.h"\n')
+            wr('#include "property.h"\n\n')
+            self._namespace_begin(wr)
+
+            self._generate_add_cfgs(mpt, wr)
+
+            self.input_file(f, "partials/move_cfg.h")
+            if self.fused_cfgs:
+                self.input_file(f, "partials/move_fused_cfg.h")
+
+            self.input_file(f, "partials/property_begin.h")
+            self._generate_monitor_core(mpt, wr)
+            self.input_file(f, "partials/property_end.h")
+            self._namespace_end(wr)
+
+    def _generate_properties_monitor(self):
+        """
+        The monitor of several MPTs: the traces are read and stored once,
+        every new trace is passed to all the MPTs and every round moves
+        the configurations of all the MPTs that are not done.
+        """
+        props = [(prop, f"{prop}_property") for prop in self.properties]
+        with self.new_file("monitor.cpp") as f:
+            wr = f.write
+            wr("#include <iostream>\n")
+            wr("#include <cassert>\n\n")
+
+            wr('#include "events.h"\n')
+            wr('#include "monitor.h"\n')
+            wr('#include "trace.h"\n')
+            wr('#include "prefixexpr.h"\n')
+            wr('#include "inputs.h"\n\n')
+            for prop, _ in props:
+                wr(f'#include "{prop}/property.h"\n')
+            wr("\n")
+            self.input_file(f, "partials/pe_step_result.cpp")
+
+            wr("\n// the monitors of the MPTs, they share the traces\n"
+               "struct Properties {\n")
+            for prop, member in props:
+                wr(f"  {prop}::Property {member};\n")
+            wr("};\n\n")
+
+            wr("template <typename TracesT>\n"
+               "static void add_new_cfgs(Properties &properties, const TracesT &traces, Trace<TraceEvent> *trace) {\n")
+            for _, member in props:
+                wr(f"  properties.{member}.addTrace(traces, trace);\n")
+            wr("}\n\n")
+
+            self.input_file(f, "partials/update_traces.h")
+
+            wr("\nint monitor(Inputs &inputs) {\n\n"
+               "  std::vector<std::unique_ptr<Trace<TraceEvent>>> traces;\n"
+               "  std::vector<InputStream *> online_traces;\n\n"
+               "  Properties properties;\n\n"
+               "  while (true) {\n"
+               "    update_traces(inputs, properties, traces, online_traces);\n\n")
+            for _, member in props:
+                wr(f"    properties.{member}.step();\n")
+            done = " && ".join(f"properties.{member}.done()" for _, member in props)
+            wr(f"\n    if (inputs.done() && {done})\n"
+                "      break;\n")
+            if self.args.exit_on_error:
+                violated = " && ".join(f"properties.{member}.violated()" for _, member in props)
+                wr(f"    if ({violated})\n"
+                    "      break;\n")
+            wr("  }\n\n"
+               "  int result = 0;\n")
+            for prop, member in props:
+                wr(f"  if (properties.{member}.violated()) {{\n"
+                   f'    std::cout << "{prop}: \033[1;31mPROPERTY VIOLATED!\033[0m\\n";\n'
+                    "    result = 1;\n"
+                    "  } else {\n"
+                   f'    std::cout << "{prop}: \033[1;32mNO VIOLATION FOUND!\033[0m\\n";\n'
+                    "  }\n"
+                   f'  std::cout << "{prop}: Max workbag size: " << properties.{member}.maxWorkbagSize() << "\\n";\n')
+            wr('  std::cout << "Traces #: " << traces.size() << "\\n";\n\n'
+               "  return result;\n"
+               "}\n")
+
+    def _dump_mpt(self, mpt):
+        with self.new_dbg_file(f"mpt.txt") as fl:
+            mpt.dump(fl=fl)
+        with self.new_dbg_file(f"mpt.dot") as fl:
+            mpt.to_dot(fl=fl)
+
     def generate(self, mpt):
         if self.args.debug:
-            with self.new_dbg_file(f"mpt.txt") as fl:
-                mpt.dump(fl=fl)
-            with self.new_dbg_file(f"mpt.dot") as fl:
-                mpt.to_dot(fl=fl)
+            self._dump_mpt(mpt)
+
+        self.reduction = self._reductions(mpt)
+        self.alphabet = mpt.alphabet
 
         self._copy_common_files()
         self._generate_cmake()
-        self._generate_events(mpt)
+        self._generate_events()
         self._generate_cfgs(mpt)
         self._generate_monitor(mpt)
+        if self.args.profile_generate:
+            self._generate_profile()
+
+        if self.args.export_tables:
+            tables = MPTTables(mpt, self.pets.__getitem__, self.reduction)
+            # not a part of the generated project (and of its manifest),
+            # a relative path is relative to the output directory
+            self.sink.write(self.args.export_tables, tables.to_bytes())
+
+        with profile_phase(self.profile, "codegen/write"):
+            self.finish()
+
+        if self.args.pet_cache:
+            self.pet_cache.report(fl=stderr)
+
+    def generate_properties(self, mpts):
+        """
+        Generate one monitor for several MPTs, `mpts` is a list of pairs
+        (name, MPT). The traces are read and stored once for all the MPTs,
+        every MPT has its own configurations, workbags and verdict. The code
+        of an MPT is in the namespace of its name and its files are in
+        the directory of its name.
+        """
+        names = [name for name, _ in mpts]
+        for name in names:
+            if not name.isidentifier() or not name.isascii():
+                raise RuntimeError(f"The name of an MPT is not an identifier: {name}")
+            if name in RESERVED_NAMES:
+                raise RuntimeError(f"The name of an MPT clashes with a name in the monitor: {name}")
+        # the files of an MPT are in the directory of its name,
+        # directories may clash on case-insensitive file systems
+        seen = {}
+        for name in names:
+            if name.lower() in seen:
+                raise RuntimeError(f"The names of MPTs clash: {seen[name.lower()]} and {name}")
+            seen[name.lower()] = name
+
+        alphabet = {}
+        for _, mpt in mpts:
+            for ev in mpt.alphabet:
+                decl = alphabet.setdefault(ev.name.name, ev)
+                if str(decl) != str(ev):
+                    raise RuntimeError(f"Event {ev.name.name} is declared differently in the MPTs")
+        self.alphabet = list(alphabet.values())
+        self.properties = names
+
+        self._copy_common_files()
+        self._generate_cmake()
+        self._generate_events()
+        for name, mpt in mpts:
+            gen = CodeGenCpp(self.args, self.codemapper, self.profile, self.sink, self.pet_cache)
+            gen.prop = name
+            # all the files are one output
+            gen.files, gen.generated, gen.written = self.files, self.generated, self.written
+            if self.args.debug:
+                gen._dump_mpt(mpt)
+            gen.reduction = gen._reductions(mpt)
+            gen.alphabet = self.alphabet
+            gen._generate_cfgs(mpt)
+            gen._generate_property(mpt)
+        self._generate_properties_monitor()
+
+        with profile_phase(self.profile, "codegen/write"):
+            self.finish()
+
+        if self.args.pet_cache:
+            self.pet_cache.report(fl=stderr)
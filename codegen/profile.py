@@ -0,0 +1,171 @@
+import json
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+from mpt.prefixexpr import PrefixExpr
+
+
+def pet_edges_num(pet):
+    """
+    The number of edges of `pet` as they are generated: the edges grouped
+    by successors and outputs plus the default edges.
+    """
+    return sum(
+        len(pet.edges(s)) + (s.default is not None) for s in pet.states.values()
+    )
+
+
+class CompileProfile:
+    """
+    Timings and statistics of a single run of the compiler
+    (`mptc --profile-compile`). Phases are identified by names,
+    sub-phases have names of the form `phase/sub-phase`.
+    The peak memory is measured with `tracemalloc`, so the timings
+    include the overhead of tracing allocations.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.transitions = []
+        self.pes = []
+        self.peak_memory = None
+        self._start = perf_counter()
+        self.total_time = None
+        tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name):
+        # register the phase on entering it, so that phases are listed
+        # before their sub-phases
+        self.phases.setdefault(name, 0.0)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += perf_counter() - start
+
+    def add_transition(self, name, time, pes):
+        self.transitions.append({"transition": name, "time": time, "pes": pes})
+
+    def add_pe(self, name, pe, time, cached, states, edges, min_pet, derivatives):
+        """
+        Record building the PET `min_pet` for `pe`. `states` and `edges`
+        are the sizes of the PET before minimization, they are None
+        if the PET was taken from the PET cache.
+        """
+        self.pes.append(
+            {
+                "name": name,
+                "pe": pe.pretty_str(),
+                "time": time,
+                "cached": cached,
+                "states": states,
+                "edges": edges,
+                "min_states": len(min_pet.states),
+                "min_edges": pet_edges_num(min_pet),
+                "derivatives": derivatives,
+            }
+        )
+
+    def finish(self):
+        self.total_time = perf_counter() - self._start
+        self.peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    def to_json(self):
+        return {
+            "total_time": self.total_time,
+            "peak_memory": self.peak_memory,
+            "derivatives": sum(pe["derivatives"] for pe in self.pes),
+            "phases": self.phases,
+            "transitions": self.transitions,
+            "pes": self.pes,
+        }
+
+    def write(self, path):
+        with open(path, "w") as fl:
+            json.dump(self.to_json(), fl, indent=2)
+            fl.write("\n")
+
+    def report(self, fl=None, top=10):
+        total = self.total_time or 1e-9
+        print(f"{'phase':<28} {'time [s]':>10} {'%':>6}", file=fl)
+        for name, time in self.phases.items():
+            indent = "  " * name.count("/")
+            name = f"{indent}{name.rsplit('/', 1)[-1]}"
+            print(f"{name:<28} {time:>10.3f} {100 * time / total:>6.1f}", file=fl)
+        print(f"{'total':<28} {total:>10.3f}", file=fl)
+
+        if self.pes:
+            print(
+                f"\n{'PE (slowest first)':<36} {'time [s]':>10} {'states':>13}"
+                f" {'edges':>13} {'derivs':>8}",
+                file=fl,
+            )
+
+            def size(unmin, mini):
+                return f"{'-' if unmin is None else unmin}/{mini}"
+
+            for pe in sorted(self.pes, key=lambda pe: -pe["time"])[:top]:
+                name = pe["name"] + (" (cached)" if pe["cached"] else "")
+                print(
+                    f"{name:<36} {pe['time']:>10.3f}"
+                    f" {size(pe['states'], pe['min_states']):>13}"
+                    f" {size(pe['edges'], pe['min_edges']):>13}"
+                    f" {pe['derivatives']:>8}",
+                    file=fl,
+                )
+        print(
+            f"\nderivatives computed: {sum(pe['derivatives'] for pe in self.pes)}, "
+            f"peak memory: {self.peak_memory / 2**20:.1f} MiB",
+            file=fl,
+        )
+
+
+class MonitorProfile:
+    """
+    Hit counts recorded by a monitor generated with `mptc --profile-generate`
+    and consumed by `mptc --profile-use`. The file has a line `<count> <key>`
+    for every counter, keys are `edge <PE> <state> <kinds>` for edges
+    of PEs (the kinds are `default` for the default edge) and `cfg <name>`
+    for moves of configurations. Lines with the same key are summed,
+    so profiles of several runs can be concatenated.
+    """
+
+    def __init__(self, counts=None):
+        self.counts = counts or {}
+
+    @staticmethod
+    def edge_key(pe_name, state, kinds):
+        return f"edge {pe_name} {state} {kinds}"
+
+    @staticmethod
+    def cfg_key(name):
+        return f"cfg {name}"
+
+    @classmethod
+    def load(cls, path):
+        counts = {}
+        with open(path) as fl:
+            for line in fl:
+                line = line.strip()
+                if not line:
+                    continue
+                count, key = line.split(" ", 1)
+                counts[key] = counts.get(key, 0) + int(count)
+        return cls(counts)
+
+    def count(self, key):
+        return self.counts.get(key, 0)
+
+
+def profile_phase(profile, name):
+    """
+    `profile.phase(name)` if profiling is enabled (`profile` is not None).
+    """
+    return nullcontext() if profile is None else profile.phase(name)
+
+
+def derivatives_count():
+    return PrefixExpr.computed_derivatives
@@ -0,0 +1,176 @@
+"""
+Long-running modes of `mptc`: watching the inputs (`--watch`) and serving
+compile requests over a Unix socket (`--serve`). Both keep one `Compiler`,
+i.e., the parser and the compiled PETs, and the files generated last time,
+so only the files whose contents changed are written.
+
+Requests and responses are single lines of JSON. A request is
+
+    {"input": PATH or "text": TEXT, "out_dir": DIR, "options": {...}}
+
+If `out_dir` is missing, the generated files are returned in the response
+(`"files": {name: contents}`, the contents of binary files, i.e., exported
+tables, are in base64 and their names are listed in `"binary"`), otherwise
+they are written into `out_dir` and the response lists the files that were
+(re-)written (`"written"`).
+"""
+
+import json
+import socket
+from base64 import b64encode
+from os import stat, remove
+from os.path import abspath, exists
+from stat import S_ISSOCK
+from socketserver import UnixStreamServer, StreamRequestHandler
+from sys import stderr
+from time import perf_counter, sleep
+
+from codegen.api import DEFAULT_OPTIONS
+from codegen.codegen import DirectorySink
+
+
+def options_from_args(args):
+    """
+    Take the options of the compilation from the arguments of `mptc`.
+    """
+    return {k: v for k, v in vars(args).items() if k in DEFAULT_OPTIONS}
+
+
+class OutputDir:
+    """
+    Output directory that remembers the files written into it,
+    so that the files that did not change are not compared on the disk.
+    """
+
+    def __init__(self, out_dir):
+        self.sink = DirectorySink(out_dir, incremental=True)
+        self.files = {}
+
+    def update(self, files):
+        """
+        Write `files` (name -> contents) and remove the files generated
+        previously that are not in `files`. Returns the written files.
+        """
+        written = [
+            name
+            for name, contents in files.items()
+            if self.files.get(name) != contents and self.sink.write(name, contents)
+        ]
+        self.sink.finish(list(files))
+        self.files = files
+        return written
+
+
+def _mtimes(paths):
+    result = {}
+    for path in paths:
+        try:
+            st = stat(path)
+            result[path] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            result[path] = None
+    return result
+
+
+def watch(compiler, args, interval=0.5):
+    """
+    Compile `args.input_mpt` into `args.out_dir` and then re-compile it
+    whenever the .mpt file or the additional C++ files change.
+    Runs until interrupted.
+    """
+    paths = [args.input_mpt] + args.cpp_files
+    out = OutputDir(args.out_dir)
+    mtimes = None
+    while True:
+        new_mtimes = _mtimes(paths)
+        if new_mtimes != mtimes:
+            mtimes = new_mtimes
+            start = perf_counter()
+            try:
+                with open(args.input_mpt) as fl:
+                    files = compiler.compile(fl.read())
+                written = out.update(files)
+            except Exception as e:
+                print(f"error: {e}", file=stderr)
+            else:
+                print(
+                    f"Compiled {args.input_mpt} in {perf_counter() - start:.3f}s, "
+                    f"{len(written)} files changed: {' '.join(written)}",
+                    file=stderr,
+                )
+        sleep(interval)
+
+
+class CompileRequestHandler(StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.compile(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class CompileServer(UnixStreamServer):
+    """
+    Serves compile requests on the Unix socket `path`, one at a time.
+    """
+
+    def __init__(self, path, compiler):
+        super().__init__(path, CompileRequestHandler)
+        self.compiler = compiler
+        self.outputs = {}
+
+    def compile(self, request):
+        start = perf_counter()
+        text = request.get("text")
+        if text is None:
+            with open(request["input"]) as fl:
+                text = fl.read()
+        options = request.get("options")
+        files = self.compiler.compile(text, options)
+
+        response = {"ok": True}
+        out_dir = request.get("out_dir")
+        if out_dir is None:
+            binary = [name for name, contents in files.items() if isinstance(contents, bytes)]
+            for name in binary:
+                files[name] = b64encode(files[name]).decode("ascii")
+            response["files"] = files
+            response["binary"] = binary
+        else:
+            out_dir = abspath(out_dir)
+            out = self.outputs.get(out_dir)
+            if out is None:
+                out = self.outputs[out_dir] = OutputDir(out_dir)
+            response["written"] = out.update(files)
+            response["generated"] = len(files)
+        response["time"] = perf_counter() - start
+        return response
+
+
+def serve(compiler, path):
+    # remove the socket left by a previous server
+    if exists(path) and S_ISSOCK(stat(path).st_mode):
+        remove(path)
+    with CompileServer(path, compiler) as server:
+        print(f"Serving compile requests on {path}", file=stderr)
+        try:
+            server.serve_forever()
+        finally:
+            remove(path)
+
+
+def send_request(path, request):
+    """
+    Send `request` to the server listening on `path` and return its response.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile("rb") as fl:
+            return json.loads(fl.readline())
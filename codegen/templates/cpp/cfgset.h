@@ -4,21 +4,21 @@
 #include <array>
 #include <cstddef>
 
-#include "anycfg.h"
-
-template <size_t MAX_SIZE> struct ConfigurationsSet {
+// a set of configurations, `AnyCfgTy` is the union of the configurations
+// of the MPT (`AnyCfg` in anycfg.h)
+template <typename AnyCfgTy, size_t MAX_SIZE> struct ConfigurationsSet {
   size_t _size{0};
   bool _invalid{false};
-  std::array<AnyCfg, MAX_SIZE> _confs;
+  std::array<AnyCfgTy, MAX_SIZE> _confs;
 
   /*
-  void add(const AnyCfg &c) {
+  void add(const AnyCfgTy &c) {
     assert(_size < MAX_SIZE);
     _confs[_size++] = c;
   }
   */
 
-  void add(AnyCfg &&c) {
+  void add(AnyCfgTy &&c) {
     assert(_size < MAX_SIZE);
     _confs[_size++] = std::move(c);
   }
@@ -37,7 +37,7 @@ template <size_t MAX_SIZE> struct ConfigurationsSet {
   bool invalid() const { return _invalid; }
 
   auto begin() -> auto{ return _confs.begin(); }
-  auto end() -> auto{ return _confs.end(); }
+  auto end() -> auto{ return _confs.begin() + _size; }
 };
 
 #endif // OD_CFGSET_H
@@ -13,18 +13,30 @@ void MString::append(const MString::Letter &l) {
 
   auto &last = back();
   if (last.end == MString::Letter::BOT) {
-    assert(last.end != MString::Letter::BOT);
-    assert(l.start != MString::Letter::BOT);
-    last.start = l.start;
+    // close the last letter
+    assert(l.start == MString::Letter::BOT);
+    assert(l.end != MString::Letter::BOT);
+    last.end = l.end;
   } else {
     assert(last.start != MString::Letter::BOT);
     assert(l.start != MString::Letter::BOT);
-    ++_size;
-    if (_size <= ARRAY_SIZE) {
-      _data.arr[_size - 1] = l;
+    if (l.start == last.end + 1) {
+      // the letter abuts the last one, extend the last letter
+      last.end = l.end;
+      return;
+    }
+    if (_size < ARRAY_SIZE) {
+      _data.arr[_size] = l;
     } else {
+      if (_size == ARRAY_SIZE) {
+        // move the letters from the array into the vector
+        Letter tmp[ARRAY_SIZE];
+        memcpy(tmp, _data.arr, sizeof(tmp));
+        new (&_data.vec) std::vector<Letter>(tmp, tmp + ARRAY_SIZE);
+      }
       _data.vec.push_back(l);
     }
+    ++_size;
   }
 }
 
@@ -32,10 +44,6 @@ void MString::append(const MString::Letter &l) {
 #include <iomanip>
 #include <iostream>
 
-static const char *color_green = "\033[0;32m";
-static const char *color_red = "\033[0;31m";
-static const char *color_reset = "\033[0m";
-
 std::ostream &operator<<(std::ostream &s, const MString &ev) {
   auto sz = ev.size();
   for (size_t i = 0; i < sz; ++i) {
@@ -77,7 +77,7 @@ public:
     if (_size <= ARRAY_SIZE) {
       memcpy(_data.arr, rhs._data.arr, _size * sizeof(Letter));
     } else {
-      _data.vec = rhs._data.vec;
+      new (&_data.vec) std::vector<Letter>(rhs._data.vec);
     }
   }
 
@@ -95,11 +95,16 @@ public:
   */
 
   MString &operator=(MString &&rhs) {
+    if (this == &rhs)
+      return *this;
+    if (_size > ARRAY_SIZE) {
+      _data.vec.~vector();
+    }
     _size = rhs._size;
     if (_size <= ARRAY_SIZE) {
       memcpy(_data.arr, rhs._data.arr, _size * sizeof(Letter));
     } else {
-      _data.vec = std::move(rhs._data.vec);
+      new (&_data.vec) std::vector<Letter>(std::move(rhs._data.vec));
     }
 
     return *this;
@@ -143,12 +148,18 @@ public:
 
     auto &last = back();
     if (last.end == MString::Letter::BOT) {
-      assert(last.end != MString::Letter::BOT);
-      assert(l.start != MString::Letter::BOT);
-      last.start = l.start;
+      // close the last letter
+      assert(l.start == MString::Letter::BOT);
+      assert(l.end != MString::Letter::BOT);
+      last.end = l.end;
     } else {
       assert(last.start != MString::Letter::BOT);
       assert(l.start != MString::Letter::BOT);
+      if (l.start == last.end + 1) {
+        // the letter abuts the last one, extend the last letter
+        last.end = l.end;
+        return;
+      }
       assert(_size < ARRAY_SIZE && "OOB write");
       _data[_size++] = l;
     }
@@ -197,6 +208,10 @@ private:
 #ifdef DBG
 #include <iostream>
 std::ostream &operator<<(std::ostream &s, const MString &ev);
+
+inline const char *color_green = "\033[0;32m";
+inline const char *color_red = "\033[0;31m";
+inline const char *color_reset = "\033[0m";
 #endif
 
 #endif
@@ -15,13 +15,20 @@
     switch (res) {
     case PEStepResult::Accept:
       if (mPE.accepted()) {
-        if (mPE.cond(trace(0), trace(1))) {
+        if (mPE.cond(@traces@)) {
           return PEStepResult::Accept;
         } else {
           _failed = true;
           return PEStepResult::Reject;
         }
       }
+      // fall-through
+    case PEStepResult::None:
+      // fail as soon as the condition cannot hold
+      if (!mPE.condViable(positions, mPE._accepted, @traces@)) {
+        _failed = true;
+        return PEStepResult::Reject;
+      }
       return PEStepResult::None;
     case PEStepResult::Reject:
       _failed = true;
@@ -0,0 +1,33 @@
+// move a configuration that runs all outgoing transitions of an MPT state,
+// each trace is stepped once for all the transitions
+template <typename CfgTy, size_t TRACES_NUM>
+Actions move_fused_cfg(WorkbagTy &workbag, CfgTy &cfg) {
+  bool no_progress = true;
+  for (size_t idx = 0; idx < TRACES_NUM; ++idx) {
+    if (cfg.canProceed(idx)) {
+      no_progress = false;
+      cfg.step(idx);
+    }
+  }
+
+  if (no_progress) {
+    // check if the traces are done
+    for (size_t idx = 0; idx < TRACES_NUM; ++idx) {
+      if (!cfg.trace(idx)->done())
+        return NONE;
+    }
+    return CFGSET_DONE;
+  }
+
+  // the transitions that matched in this step are resolved in the order
+  // of the MPT, like when their configurations are moved one by one
+  switch (cfg.resolve()) {
+  case PEStepResult::Accept:
+    cfg.queueNextConfigurations(workbag);
+    return CFGSET_MATCHED;
+  case PEStepResult::Reject:
+    return CFG_FAILED;
+  default:
+    return NONE;
+  }
+}
@@ -0,0 +1,17 @@
+void Property::addTrace(const Traces &traces, Trace<TraceEvent> *trace) {
+  add_new_cfgs(workbag, traces, trace);
+}
+
+void Property::step() {
+  size_t wbg_size = workbag.size();
+  size_t wbg_invalid = 0;
+  _max_wbg_size = std::max(wbg_size, _max_wbg_size);
+#ifdef DEBUG
+  std::cout << "WORKBAG size: " << wbg_size << "\n";
+#endif
+  for (auto &C : workbag) {
+    if (C.invalid()) {
+      ++wbg_invalid;
+    }
+
+    bool non_empty = false;
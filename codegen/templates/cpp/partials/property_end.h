@@ -0,0 +1,16 @@
+  if (!new_workbag.empty() || wbg_invalid >= wbg_size / 3) {
+    for (auto &C : workbag) {
+      if (C.invalid())
+        continue;
+      new_workbag.push(std::move(C));
+    }
+    workbag.swap(new_workbag);
+    new_workbag.clear();
+  }
+  return;
+
+violated:
+  // stop monitoring the violated property, the other properties go on
+  workbag.clear();
+  new_workbag.clear();
+}
@@ -3,6 +3,13 @@
 
 #include "mstring.h"
 
+// cold edges of PEs in monitors generated with a profile (mptc --profile-use)
+#if __cplusplus >= 202002L
+#define MPT_UNLIKELY [[unlikely]]
+#else
+#define MPT_UNLIKELY
+#endif
+
 struct PrefixExpression {
   // the state of the PE (transducer)
   size_t state{0};
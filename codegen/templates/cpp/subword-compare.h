@@ -1,57 +1,142 @@
 #ifndef MSTRING_COMPARE_H_
 #define MSTRING_COMPARE_H_
 
+#include <algorithm>
+
 #include "events.h"
 
-template <typename TraceT, typename MStringT>
-bool __subword_compare(TraceT *t1, const MStringT &m1, TraceT *t2,
-                       const MStringT &m2) {
+template <typename TraceT, typename MStringT1, typename MStringT2>
+bool __subword_compare(TraceT *t1, const MStringT1 &m1, TraceT *t2,
+                       const MStringT2 &m2) {
   assert(!m1.empty() && !m2.empty());
 
   // std::cout << "match_eq: " << m1 << ", " << m2 << "\n";
 
-  auto pos1 = m1[0].start;
-  auto pos2 = m2[0].start;
 #ifndef NDEBUG
   const auto Bot = MString::Letter::BOT;
 #endif
   size_t m1i = 0;
   size_t m2i = 0;
+  auto pos1 = m1[0].start, end1 = m1[0].end;
+  auto pos2 = m2[0].start, end2 = m2[0].end;
 
+  // letters are ranges of positions, compare the overlapping parts
+  // of the current ranges at once
   while (true) {
-    assert(pos1 != Bot);
-    assert(pos2 != Bot);
-    if (*static_cast<const TraceEvent *>(t1->get(pos1)) !=
-        *static_cast<const TraceEvent *>(t2->get(pos2)))
-      return false;
-
-    if (pos1 == m1[m1i].end) {
-      ++m1i;
-      if (m1.size() == m1i) { // no more positions in m1
-        if (pos2 == m2[m2i].end && m2.size() == m2i + 1) {
-          // m2 ended as well
-          return true;
-        } else {
+    assert(pos1 != Bot && end1 != Bot);
+    assert(pos2 != Bot && end2 != Bot);
+    const size_t len = std::min(end1 - pos1, end2 - pos2) + 1;
+    // the same positions on the same trace are trivially equal
+    if (t1 != t2 || pos1 != pos2) {
+      for (size_t i = 0; i < len; ++i) {
+        if (*static_cast<const TraceEvent *>(t1->get(pos1 + i)) !=
+            *static_cast<const TraceEvent *>(t2->get(pos2 + i)))
           return false;
-        }
+      }
+    }
+    pos1 += len;
+    pos2 += len;
+
+    if (pos1 > end1) {
+      if (++m1i == m1.size()) {
+        // no more positions in m1, equal if m2 ended as well
+        return pos2 > end2 && m2i + 1 == m2.size();
       }
       pos1 = m1[m1i].start;
+      end1 = m1[m1i].end;
     }
-    if (pos2 == m2[m2i].end) {
-      ++m2i;
-      if (m2.size() == m2i) { // no more positions in m2
-        if (pos1 == m1[m1i].end && m1.size() == m1i + 1) {
-          // m1 ended as well
-          return true;
-        } else {
-          return false;
-        }
+    if (pos2 > end2) {
+      if (++m2i == m2.size()) {
+        // no more positions in m2, but m1 continues
+        return false;
       }
       pos2 = m2[m2i].start;
+      end2 = m2[m2i].end;
     }
   }
+}
+
+// Incremental comparison of two sub-words while the letters of their
+// m-strings are being appended. `check` compares the events that became known
+// on both sides since the last call and returns false once the sub-words
+// cannot be equal anymore. `known` is the position after the last read event
+// of the trace (it bounds the letters that are not closed yet) and `done`
+// is true if no more letters will be appended.
+class SubwordPrefixCompare {
+  static const size_t NONE = ~static_cast<size_t>(0);
+
+  // the next positions to compare (NONE if the letter was not entered yet)
+  size_t m1i{0}, pos1{NONE};
+  size_t m2i{0}, pos2{NONE};
+
+  // move the cursor to the next known position, `end` is set to the last
+  // known position of its letter
+  template <typename MStringT>
+  static bool cursor(const MStringT &m, size_t &mi, size_t &pos, size_t known,
+                     size_t &end) {
+    while (mi < m.size()) {
+      const auto l = m[mi];
+      if (pos == NONE)
+        pos = l.start;
+      end = l.end == MString::Letter::BOT ? known - 1 : l.end;
+      if (pos <= end)
+        return true;
+      // the last letter may still be extended by an abutting letter
+      if (mi + 1 == m.size())
+        return false;
+      ++mi;
+      pos = NONE;
+    }
+    return false;
+  }
+
+public:
+  template <typename TraceT, typename MStringT1, typename MStringT2>
+  bool check(TraceT *t1, const MStringT1 &m1, size_t known1, bool done1,
+             TraceT *t2, const MStringT2 &m2, size_t known2, bool done2) {
+    size_t end1, end2;
+    while (true) {
+      const bool has1 = cursor(m1, m1i, pos1, known1, end1);
+      const bool has2 = cursor(m2, m2i, pos2, known2, end2);
+      if (!has1 || !has2) {
+        // one sub-word is complete and the other one is longer
+        return !((!has1 && done1 && has2) || (!has2 && done2 && has1));
+      }
+
+      const size_t len = std::min(end1 - pos1, end2 - pos2) + 1;
+      if (t1 != t2 || pos1 != pos2) {
+        for (size_t i = 0; i < len; ++i) {
+          if (*static_cast<const TraceEvent *>(t1->get(pos1 + i)) !=
+              *static_cast<const TraceEvent *>(t2->get(pos2 + i)))
+            return false;
+        }
+      }
+      pos1 += len;
+      pos2 += len;
+    }
+  }
+};
+
+// compare the positions matched by two labels
+template <typename MStringT1, typename MStringT2>
+bool __mstring_equal(const MStringT1 &m1, const MStringT2 &m2) {
+  if (m1.size() != m2.size())
+    return false;
+  for (size_t i = 0; i < m1.size(); ++i) {
+    if (m1[i] != m2[i])
+      return false;
+  }
+  return true;
+}
+
+// compare sub-words of labels that match a single event
+template <typename TraceT, typename MStringT1, typename MStringT2>
+bool __subword_compare_single(TraceT *t1, const MStringT1 &m1, TraceT *t2,
+                              const MStringT2 &m2) {
+  assert(m1.size() == 1 && m2.size() == 1);
+  assert(m1[0].start == m1[0].end && m2[0].start == m2[0].end);
 
-  assert(false && "Unreachable");
-  abort();
+  return *static_cast<const TraceEvent *>(t1->get(m1[0].start)) ==
+         *static_cast<const TraceEvent *>(t2->get(m2[0].start));
 }
 #endif
@@ -0,0 +1,459 @@
+"""
+Static analyses of MPTs.
+
+The liveness of labels finds labels that no condition reads, so their
+m-strings need not be tracked. The other analyses decide which tuples
+of traces the monitor may skip:
+
+ - symmetry: the MPT gives the same outputs on all permutations
+   of a tuple of traces, so it is enough to evaluate one of them,
+ - reflexivity: the MPT never outputs `false` on tuples made of a single
+   trace, so these tuples need not be evaluated.
+
+The analyses are sound, but not complete: if they fail to prove the property,
+the reduction is not applied even if the MPT might have the property.
+"""
+
+from itertools import permutations
+
+from parser.element import Identifier
+from parser.expr import CompareExpr, SubWord, Label, ConstExpr, And, Or
+from mpt.prefixexpr import PrefixExpr, NamedGroup, Seq, Choice, mk_seq, mk_choice
+
+
+def rename_labels(pe, rename):
+    """
+    Return `pe` with the labels of named groups renamed by `rename`
+    (a function Identifier -> Identifier).
+    """
+    def ren(val):
+        if isinstance(val, PrefixExpr):
+            return rename_labels(val, rename)
+        if isinstance(val, tuple):
+            return tuple(map(ren, val))
+        return val
+
+    args = [ren(getattr(pe, f)) for f in pe._fields]
+    if isinstance(pe, NamedGroup):
+        args[pe._fields.index("name")] = rename(pe.name)
+    return type(pe)(*args)
+
+
+def strip_labels(pe, keep):
+    """
+    Return `pe` without the named groups whose labels are not in `keep`
+    (a set of names of labels). The PE matches the same words,
+    only its outputs change.
+    """
+    def strip(val):
+        if isinstance(val, PrefixExpr):
+            return strip_labels(val, keep)
+        if isinstance(val, tuple):
+            return tuple(map(strip, val))
+        return val
+
+    def same(new, old):
+        if isinstance(old, tuple):
+            return all(a is b for a, b in zip(new, old))
+        return new is old
+
+    args = [strip(getattr(pe, f)) for f in pe._fields]
+    if isinstance(pe, NamedGroup) and pe.name.name not in keep:
+        return args[pe._fields.index("elem")]
+    # keep the expression as it is if nothing was stripped from it
+    if all(same(a, getattr(pe, f)) for a, f in zip(args, pe._fields)):
+        return pe
+    if isinstance(pe, Seq):
+        return mk_seq(*args)
+    if isinstance(pe, Choice):
+        return mk_choice(*args)
+    return type(pe)(*args)
+
+
+def live_labels(transition):
+    """
+    Labels read by the condition of `transition`: a dictionary that maps
+    names of traces to sets of names of labels. A label that is used without
+    a trace (`Label`) is live on all traces, the key is None.
+    """
+    live = {}
+
+    def visit(e):
+        if isinstance(e, SubWord):
+            live.setdefault(e.lhs.name, set()).add(e.label.name.name)
+        elif isinstance(e, Label):
+            live.setdefault(None, set()).add(e.name.name)
+        elif isinstance(e, (CompareExpr, And, Or)):
+            visit(e.lhs)
+            visit(e.rhs)
+        # other expressions (constants, variables) do not read labels
+
+    if transition.cond is not None:
+        visit(transition.cond)
+    return live
+
+
+def live_pes(transition):
+    """
+    The PEs of `transition` (a dictionary trace -> PE as `mpe.exprs`)
+    with the labels that are not live stripped.
+    """
+    live = live_labels(transition)
+    return {
+        trace: strip_labels(pe, live.get(trace.name, set()) | live.get(None, set()))
+        for trace, pe in transition.mpe.exprs.items()
+    }
+
+
+def pe_labels(pe):
+    """
+    Labels of `pe` in the order of their first occurrence.
+    """
+    labels = []
+
+    def visit(e):
+        if isinstance(e, NamedGroup) and e.name.name not in labels:
+            labels.append(e.name.name)
+        for c in e.children():
+            visit(c)
+
+    visit(pe)
+    return labels
+
+
+def canonical_pe(pe):
+    """
+    Return `pe` with labels renamed to canonical names (by the order
+    of their occurrence) and the list of its original labels. PEs that
+    are equal up to renaming labels have the same (identical) canonical PE
+    and the labels on the same indices in the lists correspond to each other.
+    """
+    labels = pe_labels(pe)
+    canon = rename_labels(pe, lambda l: Identifier(f"#{labels.index(l.name)}"))
+    return canon, labels
+
+
+class TransitionShape:
+    """
+    Canonical PEs of a transition. `labels[trace]` are the labels
+    of the PE on the trace (trace is the index of the trace).
+    """
+
+    def __init__(self, mpt, transition):
+        self.traces = [decl.name for decl in mpt.traces_in]
+        self.pes = []
+        self.labels = []
+        for trace in self.traces:
+            pe = transition.mpe.get(trace)
+            canon, labels = (None, []) if pe is None else canonical_pe(pe)
+            self.pes.append(canon)
+            self.labels.append(labels)
+
+    def aligned(self):
+        """
+        Are the PEs on all traces the same up to renaming labels?
+        Then they match the same prefixes of the same trace.
+        """
+        return self.pes[0] is not None and all(pe is self.pes[0] for pe in self.pes)
+
+    def label_ref(self, expr):
+        """
+        The trace and the index of the label referenced by a sub-word,
+        or None if it cannot be determined.
+        """
+        if not isinstance(expr, SubWord):
+            return None
+        trace = self.traces.index(expr.lhs)
+        labels = self.labels[trace]
+        if expr.label.name.name not in labels:
+            return None
+        return trace, labels.index(expr.label.name.name)
+
+
+def _cond_key(cond, subword):
+    """
+    A key of the condition such that conditions with equal keys are equivalent.
+    Commutative operators have their operands sorted. `subword` maps
+    the (trace, label index) of sub-words. Returns None for conditions
+    that the analysis does not understand.
+    """
+    def key(e):
+        if isinstance(e, CompareExpr):
+            lhs, rhs = key(e.lhs), key(e.rhs)
+            if lhs is None or rhs is None:
+                return None
+            if e.comparison in ("==", "!="):
+                lhs, rhs = sorted((lhs, rhs))
+            return ("cmp", e.comparison, lhs, rhs)
+        if isinstance(e, (And, Or)):
+            lhs, rhs = key(e.lhs), key(e.rhs)
+            if lhs is None or rhs is None:
+                return None
+            return (type(e).__name__, *sorted((lhs, rhs)))
+        if isinstance(e, SubWord):
+            return ("subword", *subword(e))
+        if isinstance(e, ConstExpr):
+            return ("const", repr(e.value))
+        return None
+
+    return key(cond)
+
+
+def transition_is_symmetric(mpt, transition, permutation):
+    """
+    Check that permuting the traces by `permutation` (a tuple, trace `i`
+    becomes the trace `permutation[i]`) maps `transition` onto itself.
+    """
+    shape = TransitionShape(mpt, transition)
+    for i, j in enumerate(permutation):
+        if shape.pes[i] is not shape.pes[j]:
+            return False
+    if transition.cond is None:
+        return True
+
+    def subword(e):
+        ref = shape.label_ref(e)
+        if ref is None:
+            raise KeyError(e)
+        return ref
+
+    def permuted(e):
+        trace, label = subword(e)
+        return permutation[trace], label
+
+    try:
+        key = _cond_key(transition.cond, subword)
+        permuted_key = _cond_key(transition.cond, permuted)
+    except KeyError:
+        return False
+    return key is not None and key == permuted_key
+
+
+def is_symmetric(mpt):
+    """
+    Is the output of `mpt` the same on all permutations of a tuple of traces?
+    This holds if all traces have the same type and every transition is mapped
+    onto itself by every permutation of the traces (so also the priorities
+    of transitions are preserved).
+    """
+    types = {str(decl.type) for decl in mpt.traces_in}
+    if len(types) != 1:
+        return False
+    arity = len(mpt.traces_in)
+    return all(
+        transition_is_symmetric(mpt, t, p)
+        for t in mpt.transitions
+        for p in permutations(range(arity))
+    )
+
+
+def _diagonal_cond(cond, shape):
+    """
+    Evaluate the condition on a tuple made of a single trace: True or False
+    if the value is known, None otherwise. The PEs of the transition
+    must be aligned.
+    """
+    if isinstance(cond, CompareExpr) and cond.comparison in ("==", "!="):
+        lhs, rhs = shape.label_ref(cond.lhs), shape.label_ref(cond.rhs)
+        # corresponding labels of aligned PEs match the same sub-words
+        if lhs is None or rhs is None or lhs[1] != rhs[1]:
+            return None
+        return cond.comparison == "=="
+    if isinstance(cond, And):
+        lhs, rhs = _diagonal_cond(cond.lhs, shape), _diagonal_cond(cond.rhs, shape)
+        if lhs is False or rhs is False:
+            return False
+        return True if lhs and rhs else None
+    if isinstance(cond, Or):
+        lhs, rhs = _diagonal_cond(cond.lhs, shape), _diagonal_cond(cond.rhs, shape)
+        if lhs or rhs:
+            return True
+        return False if lhs is False and rhs is False else None
+    if isinstance(cond, ConstExpr) and isinstance(cond.value, bool):
+        return cond.value
+    return None
+
+
+def reflexive_tuples_irrelevant(mpt):
+    """
+    Can the MPT never output `false` on a tuple made of a single trace?
+    We explore the states of the MPT reachable on such tuples. While the
+    taken transitions have aligned PEs, all traces are read up to the same
+    position and conditions comparing corresponding labels are known.
+    Transitions with false conditions are never taken. After a transition
+    that is not aligned, any transition may be taken.
+    """
+    if len(mpt.traces_in) < 2:
+        return False
+    # state -> are the positions on traces aligned in the state?
+    reached = {mpt.init_state: True}
+    queue = [mpt.init_state]
+    while queue:
+        state = queue.pop()
+        aligned = reached[state]
+        for t in mpt.delta.get(state, ()):
+            shape = TransitionShape(mpt, t)
+            succ_aligned = aligned and shape.aligned()
+            if succ_aligned and t.cond is not None:
+                if _diagonal_cond(t.cond, shape) is False:
+                    continue
+            if any(o.value is False for o in t.output):
+                return False
+            if t.end not in reached or (reached[t.end] and not succ_aligned):
+                reached[t.end] = succ_aligned
+                queue.append(t.end)
+    return True
+
+
+def detect_reductions(mpt):
+    """
+    The reductions (as for `mptc --reduction`) that are sound for `mpt`.
+    """
+    reductions = []
+    if is_symmetric(mpt):
+        reductions.append("symmetry")
+    if reflexive_tuples_irrelevant(mpt):
+        reductions.append("reflexivity")
+    return reductions
+
+
+class LabelBound:
+    """
+    The bound on the m-string of a label: `letters` is the maximal number
+    of letters that the label collects before the PE accepts (None if it
+    is unbounded) and `single_event` is True if the label matches at most
+    one letter that spans a single event.
+    """
+
+    def __init__(self, letters, single_event):
+        self.letters = letters
+        self.single_event = single_event
+
+    def __repr__(self):
+        return f"LabelBound({self.letters}, single_event={self.single_event})"
+
+
+def _pet_edges(state):
+    edges = list(state.successors.values())
+    if state.default is not None:
+        edges.append(state.default)
+    return edges
+
+
+def _components(nodes, succs):
+    """
+    Strongly connected components of the graph in a topological order
+    (Kosaraju's algorithm, without recursion).
+    """
+    order, seen = [], set()
+    for root in nodes:
+        if root in seen:
+            continue
+        seen.add(root)
+        stack = [(root, iter(succs[root]))]
+        while stack:
+            node, it = stack[-1]
+            for nxt in it:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append((nxt, iter(succs[nxt])))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+
+    preds = {n: [] for n in nodes}
+    for n in nodes:
+        for m in succs[n]:
+            preds[m].append(n)
+    component, components = {}, []
+    for root in reversed(order):
+        if root in component:
+            continue
+        components.append([])
+        stack = [root]
+        component[root] = len(components) - 1
+        while stack:
+            node = stack.pop()
+            components[-1].append(node)
+            for m in preds[node]:
+                if m not in component:
+                    component[m] = len(components) - 1
+                    stack.append(m)
+    return components, component
+
+
+def label_bounds(pet):
+    """
+    Compute the bounds on the m-strings of the labels of `pet` from its
+    structure: a label collects at most as many letters as there are edges
+    starting a letter of the label on a path from the initial to the accepting
+    state. If such an edge lies on a cycle, the label is unbounded.
+    Returns a dictionary name of label -> `LabelBound`.
+    """
+    labels = {}
+    for s in pet.states.values():
+        for _, out in _pet_edges(s):
+            for l, letters in (out or {}).items():
+                single = labels.get(l.name, True)
+                labels[l.name] = single and all(x == ("p", "p") for x in letters)
+    if not labels:
+        return {}
+
+    # states on paths from the initial to the accepting state,
+    # there are no edges from the accepting state and from ⊥
+    acc = pet.acc_state
+    if acc is None:
+        return {l: LabelBound(0, single) for l, single in labels.items()}
+
+    def moves(s):
+        return [] if s is acc or s.pe.is_bot() else _pet_edges(s)
+
+    reachable, stack = {pet.init_state}, [pet.init_state]
+    while stack:
+        for succ, _ in moves(stack.pop()):
+            if succ not in reachable:
+                reachable.add(succ)
+                stack.append(succ)
+    preds = {}
+    for s in reachable:
+        for succ, _ in moves(s):
+            preds.setdefault(succ, []).append(s)
+    useful, stack = {acc}, [acc] if acc in reachable else []
+    while stack:
+        for p in preds.get(stack.pop(), ()):
+            if p not in useful:
+                useful.add(p)
+                stack.append(p)
+
+    nodes = [s for s in pet.states.values() if s in useful and s in reachable]
+    edges = {s: [(succ, out) for succ, out in moves(s) if succ in useful] for s in nodes}
+    components, component = _components(nodes, {s: [succ for succ, _ in edges[s]] for s in nodes})
+
+    bounds = {}
+    for label, single in labels.items():
+        def weight(out):
+            if not out:
+                return 0
+            return sum(
+                s is not None for l, letters in out.items() if l.name == label for s, _ in letters
+            )
+
+        # the longest path over components in the topological order
+        longest = [0] * len(components)
+        letters = 0
+        for c, members in enumerate(components):
+            for s in members:
+                for succ, out in edges[s]:
+                    w = weight(out)
+                    if component[succ] == c:
+                        if w > 0:
+                            letters = None
+                    else:
+                        longest[component[succ]] = max(longest[component[succ]], longest[c] + w)
+            if letters is None:
+                break
+        if letters is not None:
+            letters = longest[component[acc]] if acc in component else 0
+        bounds[label] = LabelBound(letters, single and letters is not None and letters <= 1)
+    return bounds
@@ -0,0 +1,380 @@
+"""
+Reference interpreter of MPTs that runs directly on `MPT` and PETs,
+without generating and compiling C++ code. PETs are lowered into dense
+NumPy tables indexed by (state, kind of event) and all tuples of traces
+in a batch are stepped at once.
+
+Traces are sequences of events, an event is a tuple `(kind, *fields)`
+(or just the name of the kind), e.g., `("InputL", 0x1000, 1)`. Events are
+compared by the kind and the fields. The END event (`$`) is appended
+to every trace, as the monitor does when a trace is done.
+
+The interpreter follows the semantics of the generated monitor: from
+a state of the MPT, the MPEs of all outgoing transitions are evaluated
+on the tuple of traces in lock-step, one event of each trace at a time,
+and the transition whose MPE matches (and its condition holds) first
+is taken. If more MPEs match in the same step, the transition that comes
+first in the MPT wins.
+"""
+
+from itertools import combinations_with_replacement, product
+
+import numpy as np
+
+from mpt.pet import PrefixExpressionTransducer
+from mpt.tables import lower_pet
+from mpt.analysis import live_pes
+from mpt.mstring import MString
+from parser.expr import CompareExpr, SubWord, Label, ConstExpr, And, Or
+
+
+def trace_tuples(traces_num, arity, reduction=()):
+    """
+    Tuples of indices of traces that the monitor evaluates. With the reduction
+    "symmetry", only one permutation of each tuple is evaluated, with
+    "reflexivity", tuples made of a single trace are skipped.
+    """
+    if "symmetry" in reduction:
+        tuples = combinations_with_replacement(range(traces_num), arity)
+    else:
+        tuples = product(range(traces_num), repeat=arity)
+    for t in tuples:
+        if "reflexivity" in reduction and arity > 1 and len(set(t)) == 1:
+            continue
+        yield t
+
+
+class PETTable:
+    """
+    A PET lowered to dense arrays indexed by (state, kind code):
+    `succ` is the successor state and `action` the index into `actions`
+    (the outputs of edges, 0 means no output).
+    """
+
+    def __init__(self, pet, kinds, kinds_num, end):
+        states_num = len(pet.states)
+        # the code of the padding after the end of traces
+        self.pad = kinds_num - 1
+        self.init = pet.init_state.id
+        self.acc = -1 if pet.acc_state is None else pet.acc_state.id
+        self.actions = [None]
+
+        action_ids = {}
+
+        def action_id(out):
+            if id(out) not in action_ids:
+                action_ids[id(out)] = len(self.actions)
+                self.actions.append(out)
+            return action_ids[id(out)]
+
+        succ, action, bot = lower_pet(pet, kinds, kinds_num, end, action_id)
+        self.succ = np.array(succ, dtype=np.int32).reshape(states_num, kinds_num)
+        self.action = np.array(action, dtype=np.int32).reshape(states_num, kinds_num)
+        self.bot = np.array(bot, dtype=bool)
+
+
+class PEMatches:
+    """
+    Results of running a PE on a batch of items: the length of the match
+    (-1 if the PE did not match) and the outputs of the PET for each item.
+    """
+
+    def __init__(self, table, lengths, rec_items, rec_pos, rec_actions):
+        self.table = table
+        self.lengths = lengths
+        # the outputs sorted by items (and positions)
+        order = np.argsort(rec_items, kind="stable")
+        self._items = rec_items[order]
+        self._pos = rec_pos[order]
+        self._actions = rec_actions[order]
+
+    def single_positions(self, items, label):
+        """
+        If `label` matched exactly one event for each of `items`
+        (which is the common case, e.g., `_*l@{a + b}`), return the array
+        of positions of these events. Otherwise, return None.
+        """
+        touching = np.zeros(len(self.table.actions), dtype=bool)
+        for n, out in enumerate(self.table.actions[1:], start=1):
+            letters = [x for l, x in out.items() if l == label]
+            if not letters:
+                continue
+            if letters != [[("p", "p")]]:
+                return None
+            touching[n] = True
+
+        mask = touching[self._actions]
+        rec_items = self._items[mask]
+        counts = np.bincount(rec_items, minlength=len(self.lengths))
+        if not (counts[items] == 1).all():
+            return None
+        positions = np.full(len(self.lengths), -1, dtype=np.int64)
+        positions[rec_items] = self._pos[mask]
+        return positions[items]
+
+    def mstring(self, item, label):
+        """
+        The list of ranges (start, end) of positions matched by `label` for `item`.
+        """
+        lo, hi = np.searchsorted(self._items, [item, item + 1])
+        mstr = MString()
+        for pos, act in zip(self._pos[lo:hi], self._actions[lo:hi]):
+            for l, letters in self.table.actions[act].items():
+                if l != label:
+                    continue
+                mstr.append(
+                    [[None if s is None else int(pos), None if e is None else int(pos)]
+                     for s, e in letters]
+                )
+        return mstr
+
+
+class MPTResult:
+    """
+    The results of running the interpreter: `tuples` are the evaluated
+    tuples of indices of traces and `outputs[i]` is the list of outputs
+    of the transitions taken on `tuples[i]`.
+    """
+
+    def __init__(self, tuples, outputs):
+        self.tuples = tuples
+        self.outputs = outputs
+
+    def violations(self):
+        """
+        Tuples of traces on which a transition with the output `false` was taken.
+        """
+        return [
+            tuple(int(i) for i in t)
+            for t, outs in zip(self.tuples, self.outputs)
+            if any(o is False for o in outs)
+        ]
+
+
+class MPTInterpreter:
+    def __init__(self, mpt, pet_cache=None):
+        self.mpt = mpt
+        self.traces = [decl.name for decl in mpt.traces_in]
+        # codes of kinds of events, then END, events not in the alphabet,
+        # and the padding after the end of a trace
+        self.kinds = {ev.name.name: n for n, ev in enumerate(mpt.alphabet)}
+        self.END = len(self.kinds)
+        self.OTHER = self.END + 1
+        self.PAD = self.END + 2
+        self.tables = {}
+        for t in mpt.transitions:
+            for trace, pe in live_pes(t).items():
+                self.tables[(id(t), trace)] = PETTable(
+                    self._build_pet(pe, pet_cache), self.kinds, self.PAD + 1, self.END
+                )
+
+    @staticmethod
+    def _build_pet(pe, pet_cache):
+        alphabet = pe.alphabet()
+
+        def build():
+            return PrefixExpressionTransducer.from_pe(pe, alphabet).minimized()
+
+        if pet_cache is None:
+            return build()
+        return pet_cache.build(pe, alphabet, build)
+
+    def encode(self, traces):
+        """
+        Encode traces into the arrays of kinds of events and of ids of events
+        (equal events have equal ids), padded to the same length.
+        """
+        length = max((len(t) for t in traces), default=0) + 2
+        kinds = np.full((len(traces), length), self.PAD, dtype=np.int32)
+        ids = np.full((len(traces), length), -1, dtype=np.int64)
+        events = {}
+        for i, trace in enumerate(traces):
+            for j, ev in enumerate(trace):
+                ev = (ev,) if isinstance(ev, str) else tuple(ev)
+                kinds[i, j] = self.kinds.get(ev[0], self.OTHER)
+                ids[i, j] = events.setdefault(ev, len(events))
+            kinds[i, len(trace)] = self.END
+            ids[i, len(trace)] = events.setdefault(("$",), len(events))
+        return kinds, ids
+
+    def run(self, traces, reduction=(), batch_size=4096):
+        """
+        Run the MPT on all tuples of `traces` (see `trace_tuples`).
+        """
+        kinds, ids = self.encode(traces)
+        tuples = np.array(
+            list(trace_tuples(len(traces), len(self.traces), reduction)), dtype=np.int64
+        ).reshape(-1, len(self.traces))
+        outputs = []
+        for start in range(0, len(tuples), batch_size):
+            outputs.extend(self.run_batch(kinds, ids, tuples[start : start + batch_size]))
+        return MPTResult(tuples, outputs)
+
+    def run_batch(self, kinds, ids, tuples):
+        """
+        Run the MPT on the tuples of (encoded) traces. Returns the list
+        of outputs of the taken transitions for each tuple.
+        """
+        outputs = [[] for _ in range(len(tuples))]
+        # items (a tuple and the positions on its traces) in each state
+        frontier = {
+            self.mpt.init_state: (
+                np.arange(len(tuples)),
+                np.zeros(tuples.shape, dtype=np.int64),
+            )
+        }
+        while frontier:
+            new_frontier = {}
+            for state, (items, positions) in frontier.items():
+                transitions = self.mpt.delta.get(state, [])
+                best = np.full(len(items), -1)
+                best_round = np.full(len(items), np.iinfo(np.int64).max)
+                ends = positions.copy()
+                for n, t in enumerate(transitions):
+                    lengths = self._match(t, kinds, ids, tuples[items], positions)
+                    rounds = lengths.max(axis=1)
+                    better = (lengths.min(axis=1) >= 0) & (rounds < best_round)
+                    best[better] = n
+                    best_round[better] = rounds[better]
+                    ends[better] = positions[better] + lengths[better]
+
+                for n, t in enumerate(transitions):
+                    taken = best == n
+                    if not taken.any():
+                        continue
+                    out = [o.value for o in t.output]
+                    for i in items[taken]:
+                        outputs[i].extend(out)
+                    if t.end in self.mpt.delta:
+                        new_frontier.setdefault(t.end, []).append((items[taken], ends[taken]))
+            frontier = {
+                state: (
+                    np.concatenate([it for it, _ in parts]),
+                    np.concatenate([pos for _, pos in parts]),
+                )
+                for state, parts in new_frontier.items()
+            }
+        return outputs
+
+    def _match(self, transition, kinds, ids, tuples, positions):
+        """
+        Evaluate the MPE of `transition` on the items. Returns the lengths
+        of matches on each trace (-1 where the MPE did not match).
+        """
+        lengths = np.full(tuples.shape, -1, dtype=np.int64)
+        matches = {}
+        for trace, _ in transition.mpe.exprs.items():
+            k = self.traces.index(trace)
+            m = self._run_pe(
+                self.tables[(id(transition), trace)], kinds, tuples[:, k], positions[:, k]
+            )
+            matches[trace] = m
+            lengths[:, k] = m.lengths
+
+        if transition.cond is not None:
+            candidates = np.nonzero(lengths.min(axis=1) >= 0)[0]
+            holds = self._eval_cond_batch(transition.cond, candidates, matches, ids, tuples)
+            if holds is None:
+                holds = np.array(
+                    [self._eval_cond(transition.cond, i, matches, ids, tuples[i]) for i in candidates],
+                    dtype=bool,
+                )
+            lengths[candidates[~holds], :] = -1
+        return lengths
+
+    def _eval_cond_batch(self, cond, items, matches, ids, tuples):
+        """
+        Evaluate the condition for all `items` at once. This is possible
+        for comparisons of sub-words that are single events. Returns None
+        if the condition cannot be evaluated this way.
+        """
+        if not (
+            isinstance(cond, CompareExpr)
+            and cond.comparison in ("==", "!=")
+            and isinstance(cond.lhs, SubWord)
+            and isinstance(cond.rhs, SubWord)
+        ):
+            return None
+
+        def events(expr):
+            pos = matches[expr.lhs].single_positions(items, expr.label.name)
+            if pos is None:
+                return None
+            return ids[tuples[items, self.traces.index(expr.lhs)], pos]
+
+        lhs = events(cond.lhs)
+        rhs = None if lhs is None else events(cond.rhs)
+        if rhs is None:
+            return None
+        return (lhs == rhs) == (cond.comparison == "==")
+
+    def _run_pe(self, table, kinds, traces, start):
+        n = len(traces)
+        state = np.full(n, table.init, dtype=np.int32)
+        pos = start.copy()
+        lengths = np.full(n, -1, dtype=np.int64)
+        active = np.arange(n)
+        rec_items, rec_pos, rec_actions = [], [], []
+        while active.size:
+            k = kinds[traces[active], pos[active]]
+            running = k != table.pad
+            active, k = active[running], k[running]
+
+            s = state[active]
+            act = table.action[s, k]
+            emitted = act != 0
+            if emitted.any():
+                rec_items.append(active[emitted])
+                rec_pos.append(pos[active][emitted])
+                rec_actions.append(act[emitted])
+
+            s = table.succ[s, k]
+            state[active] = s
+            pos[active] += 1
+            accepted = s == table.acc
+            lengths[active[accepted]] = pos[active[accepted]] - start[active[accepted]]
+            active = active[~(accepted | table.bot[s])]
+
+        def cat(arrs, dtype):
+            return np.concatenate(arrs) if arrs else np.zeros(0, dtype=dtype)
+
+        return PEMatches(
+            table,
+            lengths,
+            cat(rec_items, np.int64),
+            cat(rec_pos, np.int64),
+            cat(rec_actions, np.int32),
+        )
+
+    def _eval_cond(self, cond, i, matches, ids, tup):
+        if isinstance(cond, CompareExpr) and cond.comparison in ("==", "!="):
+            lhs = self._eval_expr(cond.lhs, i, matches, ids, tup)
+            rhs = self._eval_expr(cond.rhs, i, matches, ids, tup)
+            return np.array_equal(lhs, rhs) == (cond.comparison == "==")
+        if isinstance(cond, And):
+            return self._eval_cond(cond.lhs, i, matches, ids, tup) and self._eval_cond(
+                cond.rhs, i, matches, ids, tup
+            )
+        if isinstance(cond, Or):
+            return self._eval_cond(cond.lhs, i, matches, ids, tup) or self._eval_cond(
+                cond.rhs, i, matches, ids, tup
+            )
+        if isinstance(cond, ConstExpr) and isinstance(cond.value, bool):
+            return cond.value
+        raise NotImplementedError(f"Unhandled condition: {cond}")
+
+    def _eval_expr(self, expr, i, matches, ids, tup):
+        if isinstance(expr, SubWord):
+            trace = expr.lhs
+            mstr = matches[trace].mstring(i, expr.label.name)
+            row = ids[tup[self.traces.index(trace)]]
+            return np.concatenate(
+                [row[s : e + 1] for s, e in mstr] or [np.zeros(0, dtype=np.int64)]
+            )
+        if isinstance(expr, Label):
+            for m in matches.values():
+                mstr = m.mstring(i, expr.name)
+                if mstr:
+                    return np.array(mstr, dtype=np.int64)
+            return np.zeros((0, 2), dtype=np.int64)
+        raise NotImplementedError(f"Unhandled expression: {expr}")
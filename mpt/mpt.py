@@ -1,10 +1,13 @@
 class MPT:
     def __init__(self):
+        # the name of the MPT (optional)
+        self.name = None
         self.states = set()
         self.transitions = []
         self.delta = {}
         self.init_state = None
-        self.alphabet = set()
+        # event declarations in the order of declaration
+        self.alphabet = []
         self.traces_in = []
         self.traces_out = []
 
@@ -28,7 +31,7 @@ class MPT:
         print(
             f"""
 MPT:
-  states: {self.states}
+  states: {sorted(self.states, key=lambda s: s.name)}
   init_state: {self.init_state}
   traces_in: {self.traces_in}
   traces_out: {self.traces_out}
@@ -43,7 +46,7 @@ MPT:
             print(msg, file=fl)
 
         pr("digraph MPT {")
-        for s in self.states:
+        for s in sorted(self.states, key=lambda s: s.name):
             pr(f'{s.name}[label="{s.name}"];')
         pr("")
         for t in self.transitions:
@@ -13,6 +13,12 @@ class MString(list):
 
         last_start, last_end = self[-1]
         if last_end is not None:
+            start, end = x
+            # a letter that abuts the last one extends it (only concrete
+            # positions can abut, PETs output symbolic positions)
+            if isinstance(start, int) and isinstance(last_end, int) and start == last_end + 1:
+                self[-1][1] = end
+                return
             super().append(x)
             return
 
@@ -42,6 +48,11 @@ class MMap:
             self.data[l] = mstr
         return self
 
+    def copy(self):
+        new = MMap()
+        new.data = {l: MString(mstr) for l, mstr in self.data.items()}
+        return new
+
     def items(self):
         return self.data.items()
 
@@ -49,7 +60,7 @@ class MMap:
         return bool(self.data)
 
     def __eq__(self, rhs):
-        return self.data == rhs.data
+        return isinstance(rhs, MMap) and self.data == rhs.data
 
     def __hash__(self):
         return self.data.__hash__()
@@ -1,4 +1,134 @@
-from mpt.prefixexpr import PrefixExpr
+from time import perf_counter
+
+from mpt.prefixexpr import PrefixExpr, OTHER
+
+
+def partition_alphabet(PE: PrefixExpr, alphabet: list):
+    """
+    Split `alphabet` into classes of letters that `PE` (and so all its
+    derivatives) cannot distinguish. Letters that behave like a letter
+    outside of the alphabet (OTHER) are not put into any class,
+    they are covered by the default edges of the PET.
+    Returns the list of classes (lists of letters).
+    """
+    predicates = list(dict.fromkeys(PE.predicates()))
+
+    def signature(l):
+        return tuple(any(l == a for a in pred) for pred in predicates)
+
+    other = signature(OTHER)
+    classes = {}
+    for l in alphabet:
+        sig = signature(l)
+        if sig == other:
+            continue
+        classes.setdefault(sig, []).append(l)
+    return list(classes.values())
+
+
+class PETBudget:
+    """
+    Limits on the construction of a PET: the number of states, the number
+    of computed derivatives (including derivatives of sub-expressions),
+    and the wall-clock time in seconds. None means no limit.
+    """
+
+    def __init__(self, max_states=None, max_steps=None, max_time=None):
+        self.max_states = max_states
+        self.max_steps = max_steps
+        self.max_time = max_time
+
+    def __bool__(self):
+        return any(
+            x is not None for x in (self.max_states, self.max_steps, self.max_time)
+        )
+
+
+class PETBudgetExceeded(Exception):
+    """
+    Raised by `from_pe` when the construction of a PET exceeds its budget.
+    `where` is set by the caller to say which PE it was (e.g., the transition
+    and the trace).
+    """
+
+    def __init__(self, pe, reason, states, steps, time, culprit=None):
+        super().__init__(reason)
+        self.pe = pe
+        self.reason = reason
+        self.states = states
+        self.steps = steps
+        self.time = time
+        self.where = None
+        self.culprit = fastest_growing_subexpr(pe) if culprit is None else culprit
+
+    def __reduce__(self):
+        # the exception may come from a worker process (`mptc -j`),
+        # the culprit must be found there, where the derivatives are
+        return type(self), (
+            self.pe,
+            self.reason,
+            self.states,
+            self.steps,
+            self.time,
+            self.culprit,
+        )
+
+    def __str__(self):
+        where = f" ({self.where})" if self.where else ""
+        msg = (
+            f"building the PET of {self.pe.pretty_str()}{where} exceeded the budget: "
+            f"{self.reason} (states: {self.states}, derivatives: {self.steps}, "
+            f"time: {self.time:.2f}s)"
+        )
+        if self.culprit is not None:
+            sub, num = self.culprit
+            msg += (
+                f"\nthe fastest growing sub-expression is {sub.pretty_str()}"
+                f" with {num} different derivatives"
+            )
+        return msg
+
+
+def _derivatives_closure(pe, limit=100000):
+    """
+    The number of different expressions reachable from `pe` by derivatives
+    that were computed already (i.e., are in the memo of `step`).
+    """
+    seen = {id(pe)}
+    queue = [pe]
+    while queue and len(seen) < limit:
+        e = queue.pop()
+        for _, (d, _) in e._derivs.values():
+            if id(d) not in seen:
+                seen.add(id(d))
+                queue.append(d)
+    return len(seen)
+
+
+def fastest_growing_subexpr(pe):
+    """
+    Find the sub-expression of `pe` that multiplies the number of derivatives
+    of its own sub-expressions the most. Returns the pair (sub-expression,
+    the number of its derivatives computed so far) or None if `pe` has
+    no sub-expressions.
+    """
+    best, best_key = None, None
+    closure = {}
+
+    def visit(e):
+        if id(e) in closure:
+            return closure[id(e)]
+        n = closure[id(e)] = _derivatives_closure(e)
+        children = [visit(ch) for ch in e.children()]
+        if children:
+            nonlocal best, best_key
+            key = (n / max(children), n)
+            if best_key is None or key > best_key:
+                best, best_key = (e, n), key
+        return n
+
+    visit(pe)
+    return best
 
 
 class PrefixExpressionTransducer:
@@ -7,6 +137,8 @@ class PrefixExpressionTransducer:
             self.pe = pe
             self.id = num
             self.successors = {}
+            # the edge taken on letters that are not in `successors`
+            self.default = None
 
         def add_succ(self, l, s, out=None):
             assert l not in self.successors or self.successors[l] == (s, out), (
@@ -18,6 +150,12 @@ class PrefixExpressionTransducer:
             )
             self.successors[l] = (s, out)
 
+        def set_default(self, s, out=None):
+            self.default = (s, out)
+
+        def get_succ(self, l):
+            return self.successors.get(l, self.default)
+
         def __hash__(self):
             return self.pe.__hash__()
 
@@ -31,6 +169,47 @@ class PrefixExpressionTransducer:
         self.states = {}
         self.init_state = None
         self.acc_state = None
+        # classes of letters that are indistinguishable by the PET
+        self.classes = []
+
+    def __getstate__(self):
+        # successors are stored by ids of states,
+        # so that pickling does not recurse along the paths in the PET
+        def succ(x):
+            return None if x is None else (x[0].id, x[1])
+
+        return {
+            "states": [
+                (
+                    s.id,
+                    s.pe,
+                    [(l, succ(x)) for l, x in s.successors.items()],
+                    succ(s.default),
+                )
+                for s in self.states.values()
+            ],
+            "init_state": self.init_state.id,
+            "acc_state": None if self.acc_state is None else self.acc_state.id,
+            "classes": self.classes,
+        }
+
+    def __setstate__(self, data):
+        self.__init__()
+        states = {}
+        for num, pe, _, _ in data["states"]:
+            state = PrefixExpressionTransducer.State(num, pe)
+            self.states[pe] = state
+            states[num] = state
+        for num, _, successors, default in data["states"]:
+            state = states[num]
+            for l, (s, out) in successors:
+                state.add_succ(l, states[s], out)
+            if default is not None:
+                state.set_default(states[default[0]], default[1])
+        self.init_state = states[data["init_state"]]
+        if data["acc_state"] is not None:
+            self.acc_state = states[data["acc_state"]]
+        self.classes = data["classes"]
 
     def new_state(self, pe):
         if pe in self.states:
@@ -43,10 +222,29 @@ class PrefixExpressionTransducer:
     def get(self, pe):
         return self.states.get(pe)
 
+    def edges(self, state):
+        """
+        Outgoing edges of `state` that differ from its default edge.
+        Returns a list of pairs (letters, (successor, output)),
+        letters with the same successor and output are put together.
+        """
+        edges = []
+        for cls in self.classes:
+            succ = state.successors[cls[0]]
+            if succ == state.default:
+                continue
+            for letters, s in edges:
+                if s == succ:
+                    letters.extend(cls)
+                    break
+            else:
+                edges.append((list(cls), succ))
+        return edges
+
     def accepts(self, word: list):
         state = self.init_state
         for w in word:
-            x = state.successors.get(w)
+            x = state.get_succ(w)
             if x is None:
                 return False
             state, _ = x
@@ -55,7 +253,7 @@ class PrefixExpressionTransducer:
     def trajectory(self, word: list):
         states = [self.init_state]
         for w in word:
-            x = states[-1].successors.get(w)
+            x = states[-1].get_succ(w)
             if x is None:
                 break
             state, _ = x
@@ -69,6 +267,9 @@ class PrefixExpressionTransducer:
             for l, x in s.successors.items():
                 succ, out = x
                 print(f"{s} -{l.pretty_str()}/{out}-> {succ}", file=fl)
+            if s.default:
+                succ, out = s.default
+                print(f"{s} -{OTHER.pretty_str()}/{out}-> {succ}", file=fl)
 
     def to_dot(self, reduced=True, fl=None):
         print("digraph PET {", file=fl)
@@ -84,14 +285,91 @@ class PrefixExpressionTransducer:
 
         print("00 -> 0", file=fl)
         for s in self.states.values():
-            for l, x in s.successors.items():
+            edges = [(", ".join(l.pretty_str() for l in letters), x) for letters, x in self.edges(s)]
+            if s.default:
+                edges.append((OTHER.pretty_str(), s.default))
+            for l, x in edges:
                 succ, out = x
                 if reduced and succ.pe.is_bot():
                     continue
-                print(f'{s.id} -> {succ.id} [label="{l.pretty_str()}/{out or ""}"]', file=fl)
+                print(f'{s.id} -> {succ.id} [label="{l}/{out or ""}"]', file=fl)
         print("}", file=fl)
 
-    def from_pe(PE: PrefixExpr, alphabet: list = None):
+    def minimized(self):
+        """
+        Return an equivalent PET with the minimal number of states.
+        States are merged using Moore's partition refinement: two states are
+        equivalent if both are accepting (rejecting) or neither is, and on
+        every class of letters (and on the default edge) they move to
+        equivalent states with the same output.
+        """
+        states = list(self.states.values())
+        if len(states) <= 1:
+            return self
+
+        edges = [cls[0] for cls in self.classes]
+
+        def out_key(out):
+            if not out:
+                return None
+            return tuple(
+                sorted((l.name, tuple(map(tuple, mstr))) for l, mstr in out.items())
+            )
+
+        def succs(s):
+            yield from (s.successors[l] for l in edges)
+            yield s.default
+
+        block = {s: (s.pe.is_empty(), s.pe.is_bot()) for s in states}
+        blocks_num = len(set(block.values()))
+        while True:
+            signature = {
+                s: (block[s],)
+                + tuple(
+                    (block[succ], out_key(out)) if succ else None
+                    for succ, out in (x or (None, None) for x in succs(s))
+                )
+                for s in states
+            }
+            # renumber the blocks, nesting the signatures would make
+            # them (and their hashing) grow with every round
+            ids = {}
+            block = {s: ids.setdefault(sig, len(ids)) for s, sig in signature.items()}
+            new_blocks_num = len(ids)
+            if new_blocks_num == blocks_num:
+                break
+            blocks_num = new_blocks_num
+
+        if blocks_num == len(states):
+            return self
+
+        # the state with the smallest id represents its block
+        pet = PrefixExpressionTransducer()
+        pet.classes = self.classes
+        new = {}
+        for s in sorted(states, key=lambda s: s.id):
+            if block[s] not in new:
+                new[block[s]] = pet.new_state(s.pe)
+        for s in states:
+            ns = new[block[s]]
+            if ns.pe is not s.pe:
+                continue
+            for l, (succ, out) in s.successors.items():
+                ns.add_succ(l, new[block[succ]], out)
+            if s.default:
+                succ, out = s.default
+                ns.set_default(new[block[succ]], out)
+
+        pet.init_state = new[block[self.init_state]]
+        if self.acc_state is not None:
+            pet.acc_state = new[block[self.acc_state]]
+        return pet
+
+    def from_pe(PE: PrefixExpr, alphabet: list = None, budget: PETBudget = None):
+        """
+        Build the PET for `PE` by exploring its derivatives breadth-first.
+        Raises `PETBudgetExceeded` if the construction exceeds `budget`.
+        """
         assert isinstance(PE, PrefixExpr), PE
 
         if alphabet is None:
@@ -102,22 +380,62 @@ class PrefixExpressionTransducer:
             pet.acc_state = pet.init_state
             return pet
 
+        pet.classes = partition_alphabet(PE, alphabet)
+        # letters of the alphabet that behave like OTHER are one more class,
+        # letters outside of the alphabet are ignored: the default edge
+        # of every state is a loop without output
+        in_classes = set(id(l) for cls in pet.classes for l in cls)
+        others = [l for l in alphabet if id(l) not in in_classes]
+        if others:
+            pet.classes.append(others)
+
+        def get_state(d):
+            state = pet.get(d)
+            if state is None:
+                state = pet.new_state(d)
+                assert state is not None
+                new_states.append(state)
+                if d.is_empty():
+                    assert pet.acc_state is None, (state, pet.acc_state)
+                    pet.acc_state = state
+            return state
+
+        if budget:
+            start_time = perf_counter()
+            start_steps = PrefixExpr.computed_derivatives
+
+            def check_budget():
+                states = len(pet.states)
+                steps = PrefixExpr.computed_derivatives - start_steps
+                time = perf_counter() - start_time
+                reason = None
+                if budget.max_states is not None and states > budget.max_states:
+                    reason = f"more than {budget.max_states} states"
+                elif budget.max_steps is not None and steps > budget.max_steps:
+                    reason = f"more than {budget.max_steps} derivatives"
+                elif budget.max_time is not None and time > budget.max_time:
+                    reason = f"more than {budget.max_time}s"
+                if reason:
+                    raise PETBudgetExceeded(PE, reason, states, steps, time)
+
         cur_states = [pet.init_state]
         while cur_states:
             new_states = []
 
             for cur_s in cur_states:
-                for l in alphabet:
-                    d, m = cur_s.pe.step(l)
-                    state = pet.get(d)
-                    if state is None:
-                        state = pet.new_state(d)
-                        assert state is not None
-                        new_states.append(state)
-                        if d.is_empty():
-                            assert pet.acc_state is None, (state, pet.acc_state)
-                            pet.acc_state = state
-                    cur_s.add_succ(l, state, m)
+                if budget:
+                    check_budget()
+                # derive only by one representative of each class of letters
+                for cls in pet.classes:
+                    d, m = cur_s.pe.step(cls[0])
+                    state = get_state(d)
+                    for l in cls:
+                        cur_s.add_succ(l, state, m)
+
+                cur_s.set_default(cur_s)
 
             cur_states = new_states
+
+        if budget:
+            check_budget()
         return pet
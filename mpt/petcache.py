@@ -0,0 +1,198 @@
+import pickle
+from collections import OrderedDict
+from hashlib import sha256
+from os import makedirs, replace, getpid
+from os.path import join as pathjoin, isfile
+from time import perf_counter
+
+from parser.element import Identifier
+from mpt.analysis import canonical_pe, rename_labels
+from mpt.mstring import MMap, MString
+from mpt.pet import PrefixExpressionTransducer
+
+# Bump this number whenever the construction of PETs (or their format)
+# changes. It is a part of the keys, so it invalidates all cached PETs.
+PET_VERSION = 3
+
+
+def relabel_pet(pet, rename):
+    """
+    Return a copy of `pet` with the labels in the PEs of states
+    and in the outputs renamed by `rename` (a dict name -> Identifier).
+    """
+
+    def ren(l):
+        return rename[l.name]
+
+    # edges share their outputs and the lowerings of PETs tell outputs
+    # apart by identity, so every output is renamed once
+    outs = {}
+
+    def out(o):
+        if not o:
+            return o
+        mm = outs.get(id(o))
+        if mm is None:
+            mm = MMap()
+            mm.data = {ren(l): MString(mstr) for l, mstr in o.items()}
+            outs[id(o)] = mm
+        return mm
+
+    new = PrefixExpressionTransducer()
+    new.classes = pet.classes
+    states = {}
+    for s in sorted(pet.states.values(), key=lambda s: s.id):
+        states[s] = new.new_state(rename_labels(s.pe, ren))
+    for s, ns in states.items():
+        for l, (succ, o) in s.successors.items():
+            ns.add_succ(l, states[succ], out(o))
+        if s.default is not None:
+            succ, o = s.default
+            ns.set_default(states[succ], out(o))
+    new.init_state = states[pet.init_state]
+    if pet.acc_state is not None:
+        new.acc_state = states[pet.acc_state]
+    return new
+
+
+class PETCache:
+    """
+    Persistent content-addressed cache of compiled (minimized) PETs.
+    A PET is stored in a file named by the hash of the text of the PE
+    with canonical labels, the alphabet used to build the PET, and
+    the PET version. PEs that differ only in the names of labels share
+    the entry: the stored PET has canonical labels, which are renamed
+    back to the labels of the PE when the PET is loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        makedirs(path, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        # time spent in loading PETs from the cache (hits)
+        # and building PETs that were not in the cache (misses)
+        self.load_time = 0.0
+        self.build_time = 0.0
+
+    def key(self, canon, alphabet):
+        text = f"{PET_VERSION}\n{canon!r}\n{alphabet!r}"
+        return sha256(text.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return pathjoin(self.path, f"{key}.pet")
+
+    def has(self, pe, alphabet):
+        return isfile(self._path(self.key(canonical_pe(pe)[0], alphabet)))
+
+    def _load(self, canon, alphabet):
+        try:
+            with open(self._path(self.key(canon, alphabet)), "rb") as fl:
+                version, pet = pickle.load(fl)
+        except Exception:
+            # missing, corrupted or foreign entry, it is going to be rebuilt
+            return None
+        if version != PET_VERSION or not isinstance(pet, PrefixExpressionTransducer):
+            return None
+        return pet
+
+    def _store(self, canon, alphabet, pet):
+        path = self._path(self.key(canon, alphabet))
+        tmp = f"{path}.{getpid()}.tmp"
+        with open(tmp, "wb") as fl:
+            pickle.dump((PET_VERSION, pet), fl, protocol=pickle.HIGHEST_PROTOCOL)
+        # other compilations may use the cache concurrently
+        replace(tmp, path)
+
+    def get(self, pe, alphabet):
+        """
+        Return the cached PET for `pe` over `alphabet` or None if it is not cached.
+        """
+        start = perf_counter()
+        canon, labels = canonical_pe(pe)
+        pet = self._load(canon, alphabet)
+        if pet is None:
+            return None
+        if labels:
+            pet = relabel_pet(pet, {f"#{i}": Identifier(l) for i, l in enumerate(labels)})
+        self.hits += 1
+        self.load_time += perf_counter() - start
+        return pet
+
+    def put(self, pe, alphabet, pet):
+        canon, labels = canonical_pe(pe)
+        if labels:
+            pet = relabel_pet(pet, {l: Identifier(f"#{i}") for i, l in enumerate(labels)})
+        self._store(canon, alphabet, pet)
+
+    def build(self, pe, alphabet, build_fn):
+        """
+        Get the PET for `pe` from the cache, or build it with
+        `build_fn()` and store it into the cache.
+        """
+        pet = self.get(pe, alphabet)
+        if pet is not None:
+            return pet
+
+        start = perf_counter()
+        pet = build_fn()
+        self.build_time += perf_counter() - start
+        self.misses += 1
+        self.put(pe, alphabet, pet)
+        return pet
+
+    def report(self, fl=None):
+        print(
+            f"PET cache ({self.path}): {self.hits} hits (loaded in {self.load_time:.3f}s), "
+            f"{self.misses} misses (built in {self.build_time:.3f}s)",
+            file=fl,
+        )
+
+
+class MemoryPETCache(PETCache):
+    """
+    Cache of compiled PETs that lives only in the memory of the process.
+    Prefix expressions and atoms are interned, so PETs can be indexed by
+    the identity of the canonical PE and of the letters of the alphabet.
+    The stored (canonical) PET keeps them alive, so the identities
+    are not reused while the entry exists. At most `max_entries` PETs
+    are kept (or all of them if it is None), the least recently used
+    ones are dropped first, so long-running processes (`--serve`,
+    `--watch`) do not accumulate the PETs of all compiled MPTs.
+    """
+
+    MAX_ENTRIES = 4096
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.path = None
+        self.pets = OrderedDict()
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+        self.build_time = 0.0
+
+    def key(self, canon, alphabet):
+        return (id(canon), tuple(map(id, alphabet)))
+
+    def has(self, pe, alphabet):
+        return self.key(canonical_pe(pe)[0], alphabet) in self.pets
+
+    def _load(self, canon, alphabet):
+        key = self.key(canon, alphabet)
+        entry = self.pets.get(key)
+        if entry is None:
+            return None
+        self.pets.move_to_end(key)
+        return entry[1]
+
+    def _store(self, canon, alphabet, pet):
+        key = self.key(canon, alphabet)
+        # keep the canonical PE alive together with its PET
+        self.pets[key] = (canon, pet)
+        self.pets.move_to_end(key)
+        if self.max_entries is not None:
+            while len(self.pets) > self.max_entries:
+                self.pets.popitem(last=False)
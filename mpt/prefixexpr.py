@@ -1,14 +1,97 @@
+from weakref import WeakValueDictionary
+
 from mpt.mstring import MMap
 from parser.element import Identifier
-from copy import deepcopy
+
+# All living prefix expressions. Prefix expressions are hash-consed:
+# constructing an expression that is structurally identical to an existing one
+# returns the existing object, so sub-expressions are shared and can be
+# compared by identity. The references are weak, so that the expressions
+# of finished compilations (e.g., in the compile server) are freed.
+# The keys refer to sub-expressions by their ids, which is safe because
+# an expression keeps its sub-expressions alive.
+_INTERNED = WeakValueDictionary()
+
+
+def _intern_key(val):
+    if isinstance(val, PrefixExpr):
+        # sub-expressions are interned already
+        return id(val)
+    if isinstance(val, tuple):
+        return tuple(map(_intern_key, val))
+    if isinstance(val, Identifier):
+        return ("ID", val.name)
+    return val
 
 
 class PrefixExpr:
+    """
+    Base class of prefix expressions. Prefix expressions are immutable
+    and interned, their hashes are computed only once and the results of
+    `step` are memoized per (expression, atom).
+    """
+
+    __slots__ = ("_hash", "_derivs", "__weakref__")
+    # the number of derivatives computed so far (not taken from the memo),
+    # the compiler reports it when profiling
+    computed_derivatives = 0
+    # names of the attributes that define the expression (in the order
+    # of constructor arguments)
+    _fields = ()
+
+    def __new__(cls, *args, **kwargs):
+        args = cls._canonical_args(*args, **kwargs)
+        key = (cls,) + tuple(map(_intern_key, args))
+        expr = _INTERNED.get(key)
+        if expr is None:
+            expr = object.__new__(cls)
+            for name, val in zip(cls._fields, args):
+                object.__setattr__(expr, name, val)
+            object.__setattr__(expr, "_derivs", {})
+            object.__setattr__(expr, "_hash", expr._compute_hash())
+            _INTERNED[key] = expr
+        return expr
+
+    @classmethod
+    def _canonical_args(cls, *args):
+        return args
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Prefix expressions are immutable: {self}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Prefix expressions are immutable: {self}")
+
+    def __reduce__(self):
+        # unpickling goes through the constructor, so it interns the expression
+        return type(self), tuple(getattr(self, f) for f in self._fields)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
     def derivation(self, a):
         return self.step(a)[0]
 
     def step(self, a, p="p"):
-        assert isinstance(a, PrefixExpr), a
+        """
+        Derive the expression by the atom `a`. Returns the pair (derivative, output).
+        The result is shared between all callers and must not be modified.
+        """
+        assert isinstance(a, Atom), a
+        # atoms are interned, so they are identified by their id,
+        # the memo keeps the atom alive so that its id is not reused
+        key = (id(a), p)
+        memo = self._derivs.get(key)
+        if memo is None:
+            memo = (a, self._step(a, p))
+            self._derivs[key] = memo
+            PrefixExpr.computed_derivatives += 1
+        return memo[1]
+
+    def _step(self, a, p):
         raise NotImplementedError("Child must override")
 
     def is_empty(self):
@@ -18,29 +101,52 @@ class PrefixExpr:
         return False
 
     def copy(self):
-        return deepcopy(self)
+        return self
 
     def alphabet(self):
         return []
 
-    def __hash__(self):
+    def children(self):
+        """
+        The direct sub-expressions of this expression.
+        """
+        for f in self._fields:
+            val = getattr(self, f)
+            if isinstance(val, PrefixExpr):
+                yield val
+            elif isinstance(val, tuple):
+                yield from (v for v in val if isinstance(v, PrefixExpr))
+
+    def predicates(self):
+        """
+        Tuples of atoms such that the derivatives of this expression by a
+        letter depend only on which of the tuples contain an atom matching
+        the letter. Letters that match the same tuples are indistinguishable.
+        """
+        return []
+
+    def _compute_hash(self):
         return str(self).__hash__()
 
+    def __hash__(self):
+        return self._hash
+
     # raise NotImplementedError(f"Child must override: in {type(self)}")
 
 
 class Bot(PrefixExpr):
+    __slots__ = ()
+
     def pretty_str(self):
         return "⊥"
 
-    def step(self, a, p="p"):
+    def _step(self, a, p):
         return self, None
 
     def __eq__(self, rhs):
         return isinstance(rhs, Bot)
 
-    def __hash__(self):
-        return str(self).__hash__()
+    __hash__ = PrefixExpr.__hash__
 
     def is_bot(self):
         return True
@@ -54,7 +160,9 @@ BOT = Bot()
 
 
 class Empty(PrefixExpr):
-    def step(self, a, p="p"):
+    __slots__ = ()
+
+    def _step(self, a, p):
         return BOT, None
 
     def pretty_str(self):
@@ -63,8 +171,7 @@ class Empty(PrefixExpr):
     def __eq__(self, rhs):
         return isinstance(rhs, Empty)
 
-    def __hash__(self):
-        return str(self).__hash__()
+    __hash__ = PrefixExpr.__hash__
 
     def is_empty(self):
         return True
@@ -81,10 +188,10 @@ class Atom(PrefixExpr):
     An atom or `letter` of PEs.
     """
 
-    def __init__(self, val):
-        self.value = val
+    __slots__ = ("value",)
+    _fields = ("value",)
 
-    def step(self, a, p="p"):
+    def _step(self, a, p):
         assert isinstance(a, Atom), a
         if a == self:
             return EMPTY, None
@@ -98,7 +205,10 @@ class Atom(PrefixExpr):
     def alphabet(self):
         return [self]
 
-    def __hash__(self):
+    def predicates(self):
+        return [(self,)]
+
+    def _compute_hash(self):
         return self.value.__hash__()
 
     def __eq__(self, other):
@@ -106,6 +216,8 @@ class Atom(PrefixExpr):
             return other.is_any()
         return self.value == other.value
 
+    __hash__ = PrefixExpr.__hash__
+
     def __repr__(self):
         return f"Atom({self.value})"
 
@@ -115,10 +227,13 @@ class Event(Atom):
     Specialization of Atom -- an event.
     """
 
-    def __init__(self, val, params=None):
-        assert params is None or isinstance(params, list)
-        super().__init__(val)
-        self.params = params or []
+    __slots__ = ("params",)
+    _fields = ("value", "params")
+
+    @classmethod
+    def _canonical_args(cls, val, params=None):
+        assert params is None or isinstance(params, (list, tuple)), params
+        return val, tuple(params or ())
 
     def pretty_str(self):
         if self.params:
@@ -130,9 +245,11 @@ class Event(Atom):
             return other.is_any()
         return self.value == other.value and self.params == other.params
 
-    def __hash__(self):
+    def _compute_hash(self):
         return str(self).__hash__()
 
+    __hash__ = PrefixExpr.__hash__
+
     def __repr__(self):
         return f"Event({self.value}: {', '.join(map(str, self.params))})"
 
@@ -142,11 +259,15 @@ class SpecialAtom(Atom):
     Special atoms: `end of trace` and `any atom (that makes sense in the context)`
     """
 
+    __slots__ = ()
+
     def pretty_str(self):
         if self.value == "ANY":
             return "_"
         if self.value == "END":
             return "$"
+        if self.value == "OTHER":
+            return "*"
         return super().pretty_str()
 
     def alphabet(self):
@@ -158,11 +279,20 @@ class SpecialAtom(Atom):
     def is_end(self):
         return self.value == "END"
 
+    def is_other(self):
+        return self.value == "OTHER"
+
     def __eq__(self, other):
+        if self.is_other():
+            return isinstance(other, SpecialAtom) and other.is_any()
         return isinstance(other, Atom)
 
-    def __hash__(self):
-        return self.value.__hash__()
+    __hash__ = PrefixExpr.__hash__
+
+
+# The letter that stands for all events that are not in the alphabet
+# of a PE, i.e., events that are matched only by `_`
+OTHER = SpecialAtom("OTHER")
 
 
 class Star(PrefixExpr):
@@ -171,26 +301,27 @@ class Star(PrefixExpr):
     from LTL but with the shortest-match semantics.
     """
 
-    def __init__(self, a, end):
-        self.a = a
-        self.end = end
+    __slots__ = ("a", "end")
+    _fields = ("a", "end")
 
-    def step(self, a, p="p"):
+    def _step(self, a, p):
         assert isinstance(a, Atom), a
         ending, m = self.end.step(a, p)
         if ending.is_empty():
             return EMPTY, m
-        lhs = self.a
         d, m = self.a.step(a, p)
         if d.is_empty():
-            return self.copy(), m
+            return self, m
         if d.is_bot():
             return BOT, None
-        return Seq([d, self.copy()]), m
+        return mk_seq((d, self)), m
 
     def alphabet(self):
         return self.a.alphabet() + self.end.alphabet()
 
+    def predicates(self):
+        return self.a.predicates() + self.end.predicates()
+
     def pretty_str(self):
         lhs = self.a.pretty_str()
         if isinstance(self.a, Star):
@@ -198,21 +329,29 @@ class Star(PrefixExpr):
         return f"{lhs}*{self.end.pretty_str()}"
 
     def __eq__(self, rhs):
-        return isinstance(rhs, Star) and self.end == rhs.end and self.a == rhs.a
+        return self is rhs or (
+            isinstance(rhs, Star) and self.end == rhs.end and self.a == rhs.a
+        )
 
-    def __hash__(self):
-        return str(self).__hash__()
+    def _compute_hash(self):
+        return ("Star", self.a._hash, self.end._hash).__hash__()
+
+    __hash__ = PrefixExpr.__hash__
 
     def __repr__(self):
         return f"Star({self.a}, {self.end})"
 
 
 class Choice(PrefixExpr):
-    def __init__(self, elems):
-        assert isinstance(elems, list), elems
-        self.elems = elems
+    __slots__ = ("elems",)
+    _fields = ("elems",)
 
-    def step(self, a, p="p"):
+    @classmethod
+    def _canonical_args(cls, elems):
+        assert isinstance(elems, (list, tuple)), elems
+        return (tuple(elems),)
+
+    def _step(self, a, p):
         # TODO: refactor
         assert isinstance(a, Atom), a
         new_elems = []
@@ -228,19 +367,25 @@ class Choice(PrefixExpr):
             return BOT, None
         if any(map(lambda e: e.is_empty(), new_elems)):
             return EMPTY, mm or None
-        if len(new_elems) == 1:
-            return new_elems[0], mm or None
-        return Choice(new_elems), mm or None
+        return mk_choice(new_elems), mm or None
 
     def __eq__(self, rhs):
-        return isinstance(rhs, Choice) and self.elems == rhs.elems
+        return self is rhs or (isinstance(rhs, Choice) and self.elems == rhs.elems)
 
-    def __hash__(self):
-        return str(self).__hash__()
+    def _compute_hash(self):
+        return (("Choice",) + tuple(e._hash for e in self.elems)).__hash__()
+
+    __hash__ = PrefixExpr.__hash__
 
     def alphabet(self):
         return [x for e in self.elems for x in e.alphabet()]
 
+    def predicates(self):
+        # a choice between atoms matches or not as a whole
+        if all(map(lambda e: isinstance(e, Atom), self.elems)):
+            return [self.elems]
+        return [x for e in self.elems for x in e.predicates()]
+
     def pretty_str(self):
         assert len(self.elems) > 1, self
         return f"{{{'+'.join((s.pretty_str() for s in self.elems))}}}"
@@ -250,11 +395,15 @@ class Choice(PrefixExpr):
 
 
 class Seq(PrefixExpr):
-    def __init__(self, elems):
-        assert isinstance(elems, list), elems
-        self.elems = elems
+    __slots__ = ("elems",)
+    _fields = ("elems",)
 
-    def step(self, a, p="p"):
+    @classmethod
+    def _canonical_args(cls, elems):
+        assert isinstance(elems, (list, tuple)), elems
+        return (tuple(elems),)
+
+    def _step(self, a, p):
         assert isinstance(a, Atom), a
         elems_len = len(self.elems)
         assert elems_len > 0
@@ -271,17 +420,22 @@ class Seq(PrefixExpr):
                 return self.elems[1], m
             assert elems_len > 2
             return Seq(self.elems[1:]), m
-        return Seq([d] + self.elems[1:]), m
+        return mk_seq((d,) + self.elems[1:]), m
 
     def __eq__(self, rhs):
-        return isinstance(rhs, Seq) and self.elems == rhs.elems
+        return self is rhs or (isinstance(rhs, Seq) and self.elems == rhs.elems)
 
-    def __hash__(self):
-        return str(self).__hash__()
+    def _compute_hash(self):
+        return (("Seq",) + tuple(e._hash for e in self.elems)).__hash__()
+
+    __hash__ = PrefixExpr.__hash__
 
     def alphabet(self):
         return [x for e in self.elems for x in e.alphabet()]
 
+    def predicates(self):
+        return [x for e in self.elems for x in e.predicates()]
+
     def pretty_str(self):
         if len(self.elems) == 1:
             return self.elems[0].pretty_str()
@@ -291,13 +445,61 @@ class Seq(PrefixExpr):
         return f"Seq({'.'.join(map(str, self.elems))})"
 
 
+def mk_choice(elems):
+    """
+    Smart constructor of choices. Nested choices are flattened, ⊥ branches
+    dropped, duplicate branches removed and the branches are sorted, so
+    that choices equal up to associativity, commutativity and idempotence
+    are the same (interned) expression. Labeled sub-expressions are kept
+    as they are, so two branches with different labels are never merged.
+    """
+    flat = {}
+    for e in elems:
+        for x in e.elems if isinstance(e, Choice) else (e,):
+            if not x.is_bot():
+                # expressions are interned, so duplicates are identical
+                flat[id(x)] = x
+
+    if not flat:
+        return BOT
+    if len(flat) == 1:
+        return next(iter(flat.values()))
+    return Choice(sorted(flat.values(), key=repr))
+
+
+def mk_seq(elems):
+    """
+    Smart constructor of sequences. Nested sequences are flattened and
+    ε elements dropped. A sequence with ⊥ is ⊥.
+    """
+    flat = []
+    for e in elems:
+        if e.is_bot():
+            return BOT
+        if e.is_empty():
+            continue
+        if isinstance(e, Seq):
+            flat.extend(e.elems)
+        else:
+            flat.append(e)
+
+    if not flat:
+        return EMPTY
+    if len(flat) == 1:
+        return flat[0]
+    return Seq(flat)
+
+
 class NamedGroup(PrefixExpr):
-    def __init__(self, elem, name=None):
+    __slots__ = ("elem", "name")
+    _fields = ("elem", "name")
+
+    @classmethod
+    def _canonical_args(cls, elem, name=None):
         assert name is None or isinstance(name, Identifier), name
-        self.name = name
-        self.elem = elem
+        return elem, name
 
-    def step(self, a, p="p"):
+    def _step(self, a, p):
         assert isinstance(a, Atom), a
         assert self.name
         assert self.elem
@@ -308,22 +510,30 @@ class NamedGroup(PrefixExpr):
         if d.is_bot():
             return BOT, None
 
-        if m is None:
-            m = MMap()
+        # `m` is a memoized result of the step of `elem`, do not modify it
+        m = MMap() if m is None else m.copy()
         if d.is_empty():
             return d, m.append(self.name, (p, p))
         return NamedGroupDeriv(d, self.name), m.append(self.name, (p, None))
 
     def __eq__(self, rhs):
-        return (
+        return self is rhs or (
             isinstance(rhs, NamedGroup)
             and self.name == rhs.name
             and self.elem == rhs.elem
         )
 
+    def _compute_hash(self):
+        return (type(self).__name__, self.name, self.elem._hash).__hash__()
+
+    __hash__ = PrefixExpr.__hash__
+
     def alphabet(self):
         return [x for x in self.elem.alphabet()]
 
+    def predicates(self):
+        return self.elem.predicates()
+
     def pretty_str(self):
         inner = self.elem.pretty_str()
         if inner[0] == "{" and inner[-1] == "}":
@@ -340,8 +550,7 @@ class NamedGroupDeriv(NamedGroup):
     Named group that is being derived -- to keep track about the names
     """
 
-    def __init__(self, elem, name=None):
-        super().__init__(elem, name)
+    __slots__ = ()
 
     def pretty_str(self):
         inner = self.elem.pretty_str()
@@ -350,7 +559,7 @@ class NamedGroupDeriv(NamedGroup):
         assert self.name, self
         return f"{self.name.name}'@{{{inner}}}"
 
-    def step(self, a, p="p"):
+    def _step(self, a, p):
         assert isinstance(a, Atom), a
         assert self.name
         assert self.elem
@@ -361,18 +570,19 @@ class NamedGroupDeriv(NamedGroup):
         if d.is_bot():
             return BOT, None
 
-        if m is None:
-            m = MMap()
         if d.is_empty():
+            m = MMap() if m is None else m.copy()
             return d, m.append(self.name, (None, p))
         return NamedGroupDeriv(d, self.name), m or None
 
     def __eq__(self, rhs):
-        return (
+        return self is rhs or (
             isinstance(rhs, NamedGroupDeriv)
             and self.name == rhs.name
             and self.elem == rhs.elem
         )
 
+    __hash__ = PrefixExpr.__hash__
+
     def __repr__(self):
         return f"NamedGroupDeriv({self.name}, {self.elem})"
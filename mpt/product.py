@@ -0,0 +1,129 @@
+"""
+The product of the PETs of the outgoing transitions of an MPT state on one
+trace. All these PETs start at the same position of the trace and read it
+in lock-step, so the product reads every event once instead of once for
+every transition.
+"""
+
+
+class ProductEdge:
+    """
+    An edge of the product: the successor, the outputs of the components
+    (a list of pairs (component, output)) and the components that accepted
+    and rejected on the edge.
+    """
+
+    def __init__(self, succ, outputs, accepted, rejected):
+        self.succ = succ
+        self.outputs = outputs
+        self.accepted = accepted
+        self.rejected = rejected
+
+    def key(self):
+        return (
+            self.succ.id,
+            tuple((k, id(out)) for k, out in self.outputs),
+            tuple(self.accepted),
+            tuple(self.rejected),
+        )
+
+
+class ProductState:
+    def __init__(self, num, states):
+        self.id = num
+        # the states of the components, None for finished components
+        self.states = states
+        # letter -> `ProductEdge`, and the edge on the other letters
+        self.successors = {}
+        self.default = None
+
+    def is_final(self):
+        return all(s is None for s in self.states)
+
+    def __repr__(self):
+        return f"<{self.id} | {', '.join('-' if s is None else str(s.id) for s in self.states)}>"
+
+
+class ProductPET:
+    """
+    The product of `pets`. A component is finished once it accepts or
+    rejects, finished components do not read more events.
+    Raises `ValueError` if the product has more than `max_states` states.
+    """
+
+    def __init__(self, pets, max_states=None):
+        self.pets = pets
+        self.states = {}
+        self.letters = []
+        # atoms are interned, compare them by identity: `==` of atoms
+        # is matching (e.g., the end of trace equals any event)
+        seen = set()
+        for pet in pets:
+            for l in pet.init_state.pe.alphabet():
+                if id(l) not in seen:
+                    seen.add(id(l))
+                    self.letters.append(l)
+
+        self.init_state = self._get(tuple(pet.init_state for pet in pets))
+        queue, seen = [self.init_state], {self.init_state.id}
+        while queue:
+            state = queue.pop()
+            for l in self.letters:
+                state.successors[l] = self._edge(state, l)
+            state.default = self._edge(state, None)
+            for edge in list(state.successors.values()) + [state.default]:
+                if edge.succ.id not in seen:
+                    seen.add(edge.succ.id)
+                    queue.append(edge.succ)
+            if max_states is not None and len(self.states) > max_states:
+                raise ValueError(f"the product has more than {max_states} states")
+
+    def _get(self, states):
+        state = self.states.get(states)
+        if state is None:
+            state = ProductState(len(self.states), states)
+            self.states[states] = state
+        return state
+
+    def _edge(self, state, l):
+        succs, outputs, accepted, rejected = [], [], [], []
+        for k, s in enumerate(state.states):
+            if s is None:
+                succs.append(None)
+                continue
+            if s.pe.is_empty() or s.pe.is_bot():
+                # like in the PET, the accepting state does not read more
+                rejected.append(k)
+                succs.append(None)
+                continue
+            succ, out = s.default if l is None else s.get_succ(l)
+            if out:
+                outputs.append((k, out))
+            if succ.pe.is_empty():
+                accepted.append(k)
+                succ = None
+            elif succ.pe.is_bot():
+                rejected.append(k)
+                succ = None
+            succs.append(succ)
+        return ProductEdge(self._get(tuple(succs)), outputs, accepted, rejected)
+
+    def edges(self, state):
+        """
+        Outgoing edges of `state` that differ from its default edge.
+        Returns a list of pairs (letters, `ProductEdge`),
+        letters with the same edge are put together.
+        """
+        edges = []
+        default = state.default.key()
+        for l in self.letters:
+            edge = state.successors[l]
+            if edge.key() == default:
+                continue
+            for letters, e in edges:
+                if e.key() == edge.key():
+                    letters.append(l)
+                    break
+            else:
+                edges.append(([l], edge))
+        return edges
@@ -0,0 +1,244 @@
+"""
+MPTs compiled into tables. The tables are written into a compact binary
+file (`mptc --export-tables`) that the generic monitor (`runtime/`)
+loads at startup, so a new property does not need a new C++ build.
+
+All numbers are little-endian, `u32` unless said otherwise, and
+`NONE` (0xffffffff) marks a missing index. The file is:
+
+    "MPTT" version flags           flags: 1 = symmetry, 2 = reflexivity
+    kinds:   n, n * string         names of events, string = length, bytes
+    traces:  n, n * string         input traces
+    labels:  n, n * string
+    states:  n, init
+    pets:    n, n * (states kinds_num init acc
+                     bot[states] as u8
+                     succ[states * kinds_num] action[states * kinds_num])
+    actions: n, n * (m, m * (label, start as u8, end as u8))
+    conds:   n, n * (m, m * op)
+    transitions: n, n * (start end pet[traces] cond
+                         m, m * output as u8)
+
+Codes of kinds of events are the indices into `kinds`, then END and OTHER
+(events that are not in `kinds`), so `kinds_num = len(kinds) + 2`.
+`succ` and `action` are indexed by `state * kinds_num + code`, succ NONE
+means no successor (no match) and action 0 means no output. An action is a list of letters of m-strings:
+`start`/`end` are 1 if the letter starts/ends at the current position
+and 0 if it is left open (BOT). Outputs of transitions are 0 (false),
+1 (true), or 2 (anything else). Conditions are postfix code, see `OP_*`.
+"""
+
+import struct
+
+from mpt.prefixexpr import SpecialAtom, Event
+from mpt.analysis import live_pes
+from parser.expr import CompareExpr, SubWord, Label, ConstExpr, And, Or
+
+MAGIC = b"MPTT"
+VERSION = 1
+NONE = 0xFFFFFFFF
+
+FLAG_SYMMETRY = 1
+FLAG_REFLEXIVITY = 2
+
+# operations of conditions, they work on a stack of values
+OP_TRUE = 0  # push true
+OP_FALSE = 1  # push false
+OP_SUBWORD = 2  # (trace, label), push the sub-word of the trace matched by the label
+OP_LABEL = 3  # (label), push the m-string of the label
+OP_EQ = 4  # pop two values, push whether they are equal
+OP_NE = 5  # pop two values, push whether they differ
+OP_AND = 6  # pop two booleans, push their conjunction
+OP_OR = 7  # pop two booleans, push their disjunction
+
+
+def pet_letters(pet, kinds, end):
+    """
+    Map codes of kinds of events to the letters of `pet`. `kinds` maps
+    names of events to their codes and `end` is the code of END.
+    Codes that are not in the result take the default edges.
+    """
+    letters = {}
+    for l in pet.init_state.pe.alphabet():
+        if isinstance(l, SpecialAtom):
+            if l.is_end():
+                letters[end] = l
+            continue
+        if isinstance(l, Event) and l.params:
+            raise NotImplementedError(f"Parameters binding not supported yet: {l}")
+        code = kinds.get(l.value.name)
+        if code is not None:
+            letters[code] = l
+    return letters
+
+
+def lower_pet(pet, kinds, kinds_num, end, action_id):
+    """
+    Lower `pet` into dense tables indexed by `state * kinds_num + code`.
+    `action_id` maps the outputs of edges to their indices (0 is no output).
+    Returns the lists (succ, action, bot), succ is NONE where the state
+    has no successor.
+    """
+    letters = pet_letters(pet, kinds, end)
+    states_num = len(pet.states)
+    succ = [0] * (states_num * kinds_num)
+    action = [0] * (states_num * kinds_num)
+    bot = [False] * states_num
+    for s in pet.states.values():
+        bot[s.id] = s.pe.is_bot()
+        for code in range(kinds_num):
+            l = letters.get(code)
+            edge = s.default if l is None else s.get_succ(l)
+            if edge is None:
+                # the state has no successor, e.g., the state of a PE
+                # that matches only ε, no longer prefix can match
+                succ[s.id * kinds_num + code] = NONE
+                continue
+            nxt, out = edge
+            succ[s.id * kinds_num + code] = nxt.id
+            if out:
+                action[s.id * kinds_num + code] = action_id(out)
+    return succ, action, bot
+
+
+class MPTTables:
+    """
+    The tables of `mpt`. `get_pet(pe)` returns the (minimized) PET of `pe`.
+    """
+
+    def __init__(self, mpt, get_pet, reduction=()):
+        self.flags = (FLAG_SYMMETRY if "symmetry" in reduction else 0) | (
+            FLAG_REFLEXIVITY if "reflexivity" in reduction else 0
+        )
+        self.kinds = [ev.name.name for ev in mpt.alphabet]
+        self.kinds_num = len(self.kinds) + 2
+        self.traces = [decl.name for decl in mpt.traces_in]
+        self.labels = []
+        self.states = sorted(
+            mpt.states, key=lambda s: (s is not mpt.init_state, s.name)
+        )
+        self.pets = []
+        # the outputs of PETs, 0 is no output
+        self.actions = [None]
+        self.conds = []
+        self.transitions = []
+
+        kinds = {name: code for code, name in enumerate(self.kinds)}
+        end = len(self.kinds)
+        action_ids = {}
+        pet_ids = {}
+
+        def action_id(out):
+            if id(out) not in action_ids:
+                action_ids[id(out)] = len(self.actions)
+                self.actions.append(
+                    [(self.label_id(l), s, e) for l, letters in out.items() for s, e in letters]
+                )
+            return action_ids[id(out)]
+
+        states = {s: n for n, s in enumerate(self.states)}
+        for t in mpt.transitions:
+            pets = []
+            pes = live_pes(t)
+            for trace in self.traces:
+                pe = pes.get(trace)
+                if pe is None:
+                    pets.append(NONE)
+                    continue
+                if pe not in pet_ids:
+                    pet = get_pet(pe)
+                    pet_ids[pe] = len(self.pets)
+                    self.pets.append(
+                        (pet, lower_pet(pet, kinds, self.kinds_num, end, action_id))
+                    )
+                pets.append(pet_ids[pe])
+
+            cond = NONE
+            if t.cond is not None:
+                cond = len(self.conds)
+                self.conds.append(self.compile_cond(t.cond))
+
+            outputs = [
+                int(o.value) if isinstance(o.value, bool) else 2 for o in t.output
+            ]
+            self.transitions.append((states[t.start], states[t.end], pets, cond, outputs))
+
+    def label_id(self, name):
+        if name.name not in self.labels:
+            self.labels.append(name.name)
+        return self.labels.index(name.name)
+
+    def compile_cond(self, cond):
+        code = []
+
+        def compile(e):
+            if isinstance(e, CompareExpr) and e.comparison in ("==", "!="):
+                compile(e.lhs)
+                compile(e.rhs)
+                code.append(OP_EQ if e.comparison == "==" else OP_NE)
+            elif isinstance(e, (And, Or)):
+                compile(e.lhs)
+                compile(e.rhs)
+                code.append(OP_AND if isinstance(e, And) else OP_OR)
+            elif isinstance(e, SubWord):
+                code.extend((OP_SUBWORD, self.traces.index(e.lhs), self.label_id(e.label.name)))
+            elif isinstance(e, Label):
+                code.extend((OP_LABEL, self.label_id(e.name)))
+            elif isinstance(e, ConstExpr) and isinstance(e.value, bool):
+                code.append(OP_TRUE if e.value else OP_FALSE)
+            else:
+                raise NotImplementedError(f"Unhandled condition: {e}")
+
+        compile(cond)
+        return code
+
+    def to_bytes(self):
+        out = bytearray(MAGIC)
+
+        def u32(*xs):
+            out.extend(struct.pack(f"<{len(xs)}I", *xs))
+
+        def u8(*xs):
+            out.extend(struct.pack(f"<{len(xs)}B", *xs))
+
+        def strings(xs):
+            u32(len(xs))
+            for x in xs:
+                x = x.encode("utf-8")
+                u32(len(x))
+                out.extend(x)
+
+        u32(VERSION, self.flags)
+        strings(self.kinds)
+        strings([t.name for t in self.traces])
+        strings(self.labels)
+        u32(len(self.states), 0)
+
+        u32(len(self.pets))
+        for pet, (succ, action, bot) in self.pets:
+            acc = NONE if pet.acc_state is None else pet.acc_state.id
+            u32(len(pet.states), self.kinds_num, pet.init_state.id, acc)
+            u8(*bot)
+            u32(*succ)
+            u32(*action)
+
+        u32(len(self.actions) - 1)
+        for letters in self.actions[1:]:
+            u32(len(letters))
+            for label, s, e in letters:
+                u32(label)
+                u8(s is not None, e is not None)
+
+        u32(len(self.conds))
+        for code in self.conds:
+            u32(len(code), *code)
+
+        u32(len(self.transitions))
+        for start, end, pets, cond, outputs in self.transitions:
+            u32(start, end, *pets, cond, len(outputs))
+            u8(*outputs)
+        return bytes(out)
+
+    def write(self, path):
+        with open(path, "wb") as fl:
+            fl.write(self.to_bytes())
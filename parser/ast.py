@@ -1,3 +1,4 @@
+from functools import reduce
 from sys import stderr
 
 from mpt.mpt import MPT
@@ -7,6 +8,7 @@ from .expr import (
     CompareExpr,
     And,
     Or,
+    negate,
     Label,
     SubWord,
     MPE,
@@ -94,7 +96,7 @@ class ProcessPE(BaseTransformer):
         return items[0]
 
     def choiceone(self, items):
-        assert len(items) == 2, items
+        assert len(items) >= 2, items
         return Choice(items)
 
     def until(self, items):
@@ -143,14 +145,21 @@ class ProcessExpr(BaseTransformer):
         return CompareExpr(">", items[0].children[0], items[1].children[0])
 
     def land(self, items):
-        if len(items) == 1:
-            return items[0]
-        return And(items[0], items[1])
+        # `a && b && c` is `(a && b) && c`
+        return reduce(And, items)
 
     def lor(self, items):
-        if len(items) == 1:
-            return items[0]
-        return Or(items[0], items[1])
+        return reduce(Or, items)
+
+    def lnot(self, items):
+        assert len(items) == 1, items
+        return negate(items[0])
+
+    def ltrue(self, items):
+        return ConstExpr(True, BoolType())
+
+    def lfalse(self, items):
+        return ConstExpr(False, BoolType())
 
     def constexpr(self, items):
         assert isinstance(items[0], ConstExpr), items
@@ -190,6 +199,16 @@ class ProcessAST(BaseTransformer):
 
         self.mpt = MPT()
 
+    def reset(self):
+        """
+        Forget everything from the previous parse. The dictionaries
+        are cleared in place, because they are shared with `ProcessPE`.
+        """
+        self.decls.clear()
+        self.eventdecls.clear()
+        self.usertypes.clear()
+        self.mpt = MPT()
+
     def initstate(self, items):
         self.mpt.init_state = items[0]
         return items
@@ -214,6 +233,12 @@ class ProcessAST(BaseTransformer):
         self.mpt.transitions = items
         return items
 
+    def mptdef(self, items):
+        # the name of the MPT is optional
+        if isinstance(items[0], Identifier):
+            self.mpt.name = items[0].name
+        return items
+
     def eventdecl(self, items):
         fields = []
         if items[0].data == "name":
@@ -291,7 +316,7 @@ class ProcessAST(BaseTransformer):
 
     def boolexpr(self, items):
         assert len(items) == 1, items
-        assert isinstance(items[0], BoolExpr)
+        assert isinstance(items[0], (BoolExpr, ConstExpr))
         return items[0]
 
     def typeannot(self, items):
@@ -334,22 +359,33 @@ def prnode(lvl, node, *args):
     print(" " * lvl * 2, node)
 
 
-def transform_ast(lark_ast):
+def ast_transformer():
+    """
+    Create the transformer that turns the Lark tree into our AST. The
+    returned object is the (base) `ProcessAST` that collects the MPT.
+    It can be passed to Lark to be applied inline during parsing.
+    """
     base = ProcessAST()
-    T = merge_transformers(
+    return merge_transformers(
         base,
         comm=ProcessAST(),
         types=ProcessTypes(),
         expr=ProcessExpr(),
         prefixexpr=ProcessPE(base.eventdecls),
     )
-    ast = T.transform(lark_ast)
 
+
+def finish_ast(T, ast):
     # print_ast:
     # visit_ast(ast, 0, prnode)
-    finish_mpt(base.mpt, base.eventdecls)
-    # base.mpt.dump()
-    return ast, base.mpt
+    finish_mpt(T.mpt, T.eventdecls)
+    # T.mpt.dump()
+    return ast, T.mpt
+
+
+def transform_ast(lark_ast):
+    T = ast_transformer()
+    return finish_ast(T, T.transform(lark_ast))
 
 
 def finish_mpt(mpt, eventdecls):
@@ -360,4 +396,4 @@ def finish_mpt(mpt, eventdecls):
         mpt.delta.setdefault(t.start, []).append(t)
 
     for evname, ev in eventdecls.items():
-        mpt.alphabet.add(ev)
+        mpt.alphabet.append(ev)
@@ -126,6 +126,24 @@ class Or(BoolExpr):
         return f"Or({self.lhs} || {self.rhs})"
 
 
+def negate(e):
+    """
+    The negation of the condition `e`. It is pushed down to comparisons and
+    constants (by De Morgan's laws), so conditions need no node for negation.
+    """
+    if isinstance(e, CompareExpr):
+        if e.comparison not in ("==", "!="):
+            raise NotImplementedError(f"Negation of {e} not supported")
+        return CompareExpr("!=" if e.comparison == "==" else "==", e.lhs, e.rhs)
+    if isinstance(e, And):
+        return Or(negate(e.lhs), negate(e.rhs))
+    if isinstance(e, Or):
+        return And(negate(e.lhs), negate(e.rhs))
+    if isinstance(e, ConstExpr) and isinstance(e.value, bool):
+        return ConstExpr(not e.value, e.type)
+    raise NotImplementedError(f"Negation of {e} not supported")
+
+
 class MPE(Element):
     def __init__(self, exprmap):
         super().__init__()
@@ -139,5 +157,7 @@ class MPE(Element):
 
 
 class EventVar(Atom):
+    __slots__ = ()
+
     def __repr__(self):
         return f"EventVar({self.value})"
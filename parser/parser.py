@@ -5,45 +5,57 @@ from os.path import islink, dirname
 
 from lark import Lark, logger
 
-from .ast import transform_ast
+from .ast import ast_transformer, finish_ast
 
 grammars_dir = dirname(readlink(__file__) if islink(__file__) else __file__)
 grammars_dir = f"{grammars_dir}/grammars"
 
 
 class LarkParser:
-    def __init__(self, debug=False):
+    """
+    LALR parser of MPT files. The analysis of the grammar is cached
+    (by default in the temporary directory, see `cache` of `Lark`),
+    so only the first instantiation pays for building the tables.
+    """
+
+    def __init__(self, debug=False, transformer=None, cache=True):
         self._parser = Lark.open(
             "grammars/grammar.lark",
             rel_to=__file__,
             import_paths=[grammars_dir],
+            parser="lalr",
+            transformer=transformer,
+            cache=cache,
             debug=debug,
         )
         if debug:
             logger.setLevel(logging.DEBUG)
 
     def parse_path(self, path):
-        return self._parser.parse((open(path).read()))
+        with open(path) as f:
+            return self.parse_file(f)
 
     def parse_file(self, f):
-        return self._parser.parse(f.read())
+        return self.parse_text(f.read())
 
     def parse_text(self, text):
         return self._parser.parse(text)
 
 
 class Parser(LarkParser):
-    def __init__(self, debug=False):
-        super().__init__(debug)
-
-    def parse_file(self, f):
-        return transform_ast(super().parse_file(f))
+    """
+    Parser that returns the pair `(ast, mpt)`. The AST is built inline
+    while parsing, there is no intermediate Lark tree.
+    The parser can be used repeatedly.
+    """
 
-    def parse_path(self, path):
-        return transform_ast(super().parse_path(path))
+    def __init__(self, debug=False, cache=True):
+        self._transformer = ast_transformer()
+        super().__init__(debug, transformer=self._transformer, cache=cache)
 
     def parse_text(self, text):
-        return transform_ast(super().parse_text(text))
+        self._transformer.reset()
+        return finish_ast(self._transformer, super().parse_text(text))
 
 
 def main():
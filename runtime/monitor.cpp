@@ -0,0 +1,329 @@
+// Generic monitor that interprets MPT tables exported by
+// `mptc --export-tables`, so that a new property does not need a C++ build.
+//
+//   mpt-runtime [--exit-on-error] TABLES TRACE...
+//
+// Every TRACE is a text file with one event per line: the name of the kind
+// of the event followed by its fields, separated by white space. Events are
+// equal if they have the same kind and fields. Empty lines and lines that
+// start with '#' are skipped. The monitor follows the semantics of the
+// generated monitors on complete traces (see mpt/interpreter.py).
+
+#include <algorithm>
+#include <cstring>
+#include <fstream>
+#include <iostream>
+#include <sstream>
+#include <unordered_map>
+
+#include "tables.h"
+
+struct Trace {
+  std::string name;
+  // codes of kinds and ids of events, END is the last event
+  std::vector<uint32_t> kinds;
+  std::vector<uint32_t> ids;
+};
+
+class Events {
+  std::unordered_map<std::string, uint32_t> _kinds;
+  std::unordered_map<std::string, uint32_t> _ids;
+  const MPTTables &_tables;
+
+public:
+  Events(const MPTTables &tables) : _tables(tables) {
+    for (uint32_t i = 0; i < tables.kinds.size(); ++i)
+      _kinds[tables.kinds[i]] = i;
+  }
+
+  uint32_t id(const std::string &ev) {
+    return _ids.emplace(ev, _ids.size()).first->second;
+  }
+
+  bool read(const char *path, Trace &trace) {
+    std::ifstream fl(path);
+    if (!fl)
+      return false;
+    trace.name = path;
+    std::string line, word;
+    while (std::getline(fl, line)) {
+      std::istringstream words(line);
+      std::string kind, ev;
+      if (!(words >> kind) || kind[0] == '#')
+        continue;
+      ev = kind;
+      while (words >> word)
+        ev += ' ' + word;
+      auto it = _kinds.find(kind);
+      trace.kinds.push_back(it == _kinds.end() ? _tables.otherKind()
+                                               : it->second);
+      trace.ids.push_back(id(ev));
+    }
+    trace.kinds.push_back(_tables.endKind());
+    trace.ids.push_back(id("$"));
+    return true;
+  }
+};
+
+struct Letter {
+  static const size_t BOT = ~static_cast<size_t>(0);
+  size_t start;
+  size_t end;
+  bool operator==(const Letter &rhs) const {
+    return start == rhs.start && end == rhs.end;
+  }
+};
+
+using MString = std::vector<Letter>;
+
+static const size_t NO_MATCH = ~static_cast<size_t>(0);
+
+struct Value {
+  bool boolean{false};
+  // sub-words are sequences of ids of events, m-strings are flattened letters
+  std::vector<size_t> seq;
+  bool operator==(const Value &rhs) const {
+    return boolean == rhs.boolean && seq == rhs.seq;
+  }
+};
+
+class Monitor {
+  const MPTTables &_tables;
+  // m-strings of labels on traces, indexed by trace * labels + label
+  std::vector<MString> _mstrings;
+  std::vector<Value> _stack;
+
+  // run the PET from `start`, returns the length of the match or NO_MATCH
+  size_t runPE(const PETTable &pet, const Trace &trace, size_t start,
+               MString *mstrings) {
+    uint32_t state = pet.init;
+    const size_t K = pet.kinds_num;
+    for (size_t pos = start; pos < trace.kinds.size(); ++pos) {
+      const size_t idx = state * K + trace.kinds[pos];
+      if (uint32_t a = pet.action[idx]) {
+        for (const auto &l : _tables.actions[a]) {
+          MString &M = mstrings[l.label];
+          if (l.start) {
+            if (!M.empty() && M.back().end != Letter::BOT &&
+                M.back().end + 1 == pos) {
+              // the letter abuts the last one, extend the last letter
+              M.back().end = l.end ? pos : Letter::BOT;
+            } else {
+              M.push_back({pos, l.end ? pos : Letter::BOT});
+            }
+          } else {
+            M.back().end = pos;
+          }
+        }
+      }
+      state = pet.succ[idx];
+      // no successor, no longer prefix matches
+      if (state == NONE)
+        return NO_MATCH;
+      if (state == pet.acc)
+        return pos + 1 - start;
+      if (pet.bot[state])
+        return NO_MATCH;
+    }
+    return NO_MATCH;
+  }
+
+  bool cond(const std::vector<uint32_t> &code,
+            const std::vector<const Trace *> &traces) {
+    const size_t L = _tables.labels.size();
+    _stack.clear();
+    for (size_t i = 0; i < code.size(); ++i) {
+      switch (code[i]) {
+      case OP_TRUE:
+      case OP_FALSE:
+        _stack.emplace_back();
+        _stack.back().boolean = code[i] == OP_TRUE;
+        break;
+      case OP_SUBWORD: {
+        const uint32_t t = code[++i], l = code[++i];
+        _stack.emplace_back();
+        for (const auto &letter : _mstrings[t * L + l]) {
+          // a letter that is not closed yet spans until the end of the trace
+          const auto &ids = traces[t]->ids;
+          const size_t end = std::min(letter.end, ids.size() - 1);
+          _stack.back().seq.insert(_stack.back().seq.end(),
+                                   ids.begin() + letter.start,
+                                   ids.begin() + end + 1);
+        }
+        break;
+      }
+      case OP_LABEL: {
+        const uint32_t l = code[++i];
+        _stack.emplace_back();
+        for (size_t t = 0; t < traces.size(); ++t) {
+          if (_mstrings[t * L + l].empty())
+            continue;
+          for (const auto &letter : _mstrings[t * L + l]) {
+            _stack.back().seq.push_back(letter.start);
+            _stack.back().seq.push_back(letter.end);
+          }
+          break;
+        }
+        break;
+      }
+      default: {
+        Value rhs = std::move(_stack.back());
+        _stack.pop_back();
+        Value &lhs = _stack.back();
+        switch (code[i]) {
+        case OP_EQ:
+          lhs.boolean = lhs == rhs;
+          break;
+        case OP_NE:
+          lhs.boolean = !(lhs == rhs);
+          break;
+        case OP_AND:
+          lhs.boolean = lhs.boolean && rhs.boolean;
+          break;
+        case OP_OR:
+          lhs.boolean = lhs.boolean || rhs.boolean;
+          break;
+        }
+        lhs.seq.clear();
+      }
+      }
+    }
+    return _stack.back().boolean;
+  }
+
+  // evaluate the MPE (and the condition) of `t`, returns the lengths
+  // of the match on traces or false if it does not match
+  bool match(const TransitionTable &t, const std::vector<const Trace *> &traces,
+             const std::vector<size_t> &pos, std::vector<size_t> &lengths) {
+    const size_t L = _tables.labels.size();
+    for (auto &M : _mstrings)
+      M.clear();
+    for (size_t k = 0; k < traces.size(); ++k) {
+      if (t.pets[k] == NONE) {
+        lengths[k] = 0;
+        continue;
+      }
+      lengths[k] = runPE(_tables.pets[t.pets[k]], *traces[k], pos[k],
+                         &_mstrings[k * L]);
+      if (lengths[k] == NO_MATCH)
+        return false;
+    }
+    return t.cond == NONE || cond(_tables.conds[t.cond], traces);
+  }
+
+public:
+  Monitor(const MPTTables &tables)
+      : _tables(tables),
+        _mstrings(tables.traces.size() * tables.labels.size()) {}
+
+  // run the MPT on the tuple of traces, returns false if the MPT
+  // output `false` (the property is violated)
+  bool run(const std::vector<const Trace *> &traces) {
+    const size_t K = traces.size();
+    std::vector<size_t> pos(K, 0), lengths(K), best_lengths(K);
+    uint32_t state = _tables.init;
+    while (true) {
+      const TransitionTable *best = nullptr;
+      size_t best_round = NO_MATCH;
+      for (uint32_t n : _tables.delta[state]) {
+        const auto &t = _tables.transitions[n];
+        if (!match(t, traces, pos, lengths))
+          continue;
+        // the MPE matched in this step of the lock-step evaluation
+        size_t round = *std::max_element(lengths.begin(), lengths.end());
+        if (round < best_round) {
+          best = &t;
+          best_round = round;
+          best_lengths = lengths;
+        }
+      }
+      if (!best)
+        return true;
+      for (auto o : best->outputs) {
+        if (o == 0)
+          return false;
+      }
+      for (size_t k = 0; k < K; ++k)
+        pos[k] += best_lengths[k];
+      state = best->end;
+    }
+  }
+};
+
+// call `fn` on the tuples of `n` traces of length `arity`
+template <typename Fn>
+static bool forTuples(size_t n, size_t arity, uint32_t flags, Fn fn) {
+  std::vector<size_t> tuple(arity, 0);
+  while (true) {
+    bool reflexive = arity > 1 && std::all_of(tuple.begin(), tuple.end(),
+                                              [&](size_t i) { return i == tuple[0]; });
+    if (!(reflexive && (flags & FLAG_REFLEXIVITY))) {
+      if (!fn(tuple))
+        return false;
+    }
+
+    // the next tuple, with symmetry only non-decreasing tuples
+    size_t k = arity;
+    while (k > 0 && tuple[k - 1] + 1 == n)
+      --k;
+    if (k == 0)
+      return true;
+    ++tuple[k - 1];
+    for (size_t j = k; j < arity; ++j)
+      tuple[j] = (flags & FLAG_SYMMETRY) ? tuple[k - 1] : 0;
+  }
+}
+
+int main(int argc, char *argv[]) {
+  bool exit_on_error = false;
+  int arg = 1;
+  if (arg < argc && strcmp(argv[arg], "--exit-on-error") == 0) {
+    exit_on_error = true;
+    ++arg;
+  }
+  if (argc - arg < 1) {
+    std::cerr << "usage: " << argv[0] << " [--exit-on-error] TABLES TRACE...\n";
+    return 2;
+  }
+
+  MPTTables tables;
+  std::string err;
+  if (!tables.load(argv[arg], err)) {
+    std::cerr << "error: " << argv[arg] << ": " << err << "\n";
+    return 2;
+  }
+
+  Events events(tables);
+  std::vector<Trace> traces(argc - arg - 1);
+  for (size_t i = 0; i < traces.size(); ++i) {
+    if (!events.read(argv[arg + 1 + i], traces[i])) {
+      std::cerr << "error: cannot read " << argv[arg + 1 + i] << "\n";
+      return 2;
+    }
+  }
+
+  Monitor monitor(tables);
+  size_t tuples_num = 0, violations = 0;
+  std::vector<const Trace *> tuple(tables.traces.size());
+  if (!traces.empty()) {
+    forTuples(traces.size(), tuple.size(), tables.flags,
+              [&](const std::vector<size_t> &idx) {
+                for (size_t k = 0; k < idx.size(); ++k)
+                  tuple[k] = &traces[idx[k]];
+                ++tuples_num;
+                if (monitor.run(tuple))
+                  return true;
+                ++violations;
+                std::cout << "Violation:";
+                for (auto *t : tuple)
+                  std::cout << " " << t->name;
+                std::cout << "\n";
+                return !exit_on_error;
+              });
+  }
+
+  std::cout << "Traces #: " << traces.size() << "\n";
+  std::cout << "Tuples #: " << tuples_num << ", violations: " << violations
+            << "\n";
+  return violations > 0;
+}
@@ -0,0 +1,204 @@
+#include <cstring>
+#include <fstream>
+#include <iterator>
+
+#include "tables.h"
+
+namespace {
+
+class Reader {
+  const std::vector<char> &_data;
+  size_t _pos{0};
+
+public:
+  bool ok{true};
+
+  Reader(const std::vector<char> &data) : _data(data) {}
+
+  bool atEnd() const { return _pos == _data.size(); }
+
+  void bytes(void *dst, size_t n) {
+    if (!ok || _data.size() - _pos < n) {
+      ok = false;
+      memset(dst, 0, n);
+      return;
+    }
+    memcpy(dst, _data.data() + _pos, n);
+    _pos += n;
+  }
+
+  // the format is little-endian, like the machines we run on
+  uint32_t u32() {
+    uint32_t x;
+    bytes(&x, sizeof(x));
+    return x;
+  }
+
+  uint8_t u8() {
+    uint8_t x;
+    bytes(&x, sizeof(x));
+    return x;
+  }
+
+  // the number of items that follow, each taking at least `item_size` bytes
+  uint32_t count(size_t item_size = 1) {
+    uint32_t n = u32();
+    if (ok && (_data.size() - _pos) / item_size < n) {
+      ok = false;
+      return 0;
+    }
+    return n;
+  }
+
+  std::string string() {
+    uint32_t n = count();
+    std::string s(n, '\0');
+    bytes(s.data(), n);
+    return s;
+  }
+
+  std::vector<std::string> strings() {
+    std::vector<std::string> xs(count(4));
+    for (auto &x : xs)
+      x = string();
+    return xs;
+  }
+
+  template <typename Ty> void array(std::vector<Ty> &xs, size_t n) {
+    xs.resize(ok ? n : 0);
+    for (auto &x : xs)
+      x = sizeof(Ty) == 1 ? u8() : u32();
+  }
+};
+
+// check that the operands are valid and the stack does not underflow
+bool checkCond(const std::vector<uint32_t> &code, size_t traces_num,
+               size_t labels_num) {
+  size_t depth = 0;
+  for (size_t i = 0; i < code.size(); ++i) {
+    switch (code[i]) {
+    case OP_TRUE:
+    case OP_FALSE:
+      ++depth;
+      break;
+    case OP_SUBWORD:
+      if (i + 2 >= code.size() || code[i + 1] >= traces_num ||
+          code[i + 2] >= labels_num)
+        return false;
+      i += 2;
+      ++depth;
+      break;
+    case OP_LABEL:
+      if (i + 1 >= code.size() || code[i + 1] >= labels_num)
+        return false;
+      i += 1;
+      ++depth;
+      break;
+    case OP_EQ:
+    case OP_NE:
+    case OP_AND:
+    case OP_OR:
+      if (depth < 2)
+        return false;
+      --depth;
+      break;
+    default:
+      return false;
+    }
+  }
+  return depth == 1;
+}
+
+} // namespace
+
+bool MPTTables::load(const char *path, std::string &err) {
+  std::ifstream fl(path, std::ios::binary);
+  if (!fl) {
+    err = std::string("cannot open ") + path;
+    return false;
+  }
+  std::vector<char> data((std::istreambuf_iterator<char>(fl)),
+                         std::istreambuf_iterator<char>());
+
+  Reader rd(data);
+  char magic[4];
+  rd.bytes(magic, 4);
+  if (!rd.ok || memcmp(magic, "MPTT", 4) != 0) {
+    err = "not a file with MPT tables";
+    return false;
+  }
+  if (rd.u32() != TABLES_VERSION) {
+    err = "unsupported version of MPT tables, re-export them with this mptc";
+    return false;
+  }
+
+  flags = rd.u32();
+  kinds = rd.strings();
+  traces = rd.strings();
+  labels = rd.strings();
+  states_num = rd.u32();
+  init = rd.u32();
+
+  pets.resize(rd.count(16));
+  for (auto &pet : pets) {
+    pet.states = rd.u32();
+    pet.kinds_num = rd.u32();
+    pet.init = rd.u32();
+    pet.acc = rd.u32();
+    if (pet.kinds_num != kinds.size() + 2 || pet.init >= pet.states ||
+        (pet.acc != NONE && pet.acc >= pet.states)) {
+      rd.ok = false;
+      break;
+    }
+    rd.array(pet.bot, pet.states);
+    rd.array(pet.succ, size_t(pet.states) * pet.kinds_num);
+    rd.array(pet.action, size_t(pet.states) * pet.kinds_num);
+    for (auto s : pet.succ)
+      rd.ok &= s == NONE || s < pet.states;
+  }
+
+  actions.resize(1);
+  actions.resize(rd.count(4) + 1);
+  for (size_t i = 1; i < actions.size() && rd.ok; ++i) {
+    actions[i].resize(rd.count(6));
+    for (auto &l : actions[i]) {
+      l.label = rd.u32();
+      l.start = rd.u8();
+      l.end = rd.u8();
+      rd.ok &= l.label < labels.size();
+    }
+  }
+  for (auto &pet : pets)
+    for (auto a : pet.action)
+      rd.ok &= a < actions.size();
+
+  conds.resize(rd.count(4));
+  for (auto &code : conds) {
+    rd.array(code, rd.count(4));
+    if (!checkCond(code, traces.size(), labels.size()))
+      rd.ok = false;
+  }
+
+  transitions.resize(rd.count(12));
+  delta.assign(states_num, {});
+  for (uint32_t i = 0; i < transitions.size() && rd.ok; ++i) {
+    auto &t = transitions[i];
+    t.start = rd.u32();
+    t.end = rd.u32();
+    rd.array(t.pets, traces.size());
+    t.cond = rd.u32();
+    rd.array(t.outputs, rd.count());
+    rd.ok &= t.start < states_num && t.end < states_num &&
+             (t.cond == NONE || t.cond < conds.size());
+    for (auto p : t.pets)
+      rd.ok &= p == NONE || p < pets.size();
+    if (rd.ok)
+      delta[t.start].push_back(i);
+  }
+
+  if (!rd.ok || !rd.atEnd() || init >= states_num) {
+    err = "malformed MPT tables";
+    return false;
+  }
+  return true;
+}
@@ -0,0 +1,79 @@
+#ifndef MPT_RUNTIME_TABLES_H_
+#define MPT_RUNTIME_TABLES_H_
+
+#include <cstdint>
+#include <string>
+#include <vector>
+
+// Tables of a compiled MPT as exported by `mptc --export-tables`,
+// see mpt/tables.py for the format.
+
+static const uint32_t TABLES_VERSION = 1;
+static const uint32_t NONE = ~static_cast<uint32_t>(0);
+
+enum TablesFlags : uint32_t {
+  FLAG_SYMMETRY = 1,
+  FLAG_REFLEXIVITY = 2,
+};
+
+enum CondOp : uint32_t {
+  OP_TRUE,
+  OP_FALSE,
+  OP_SUBWORD,
+  OP_LABEL,
+  OP_EQ,
+  OP_NE,
+  OP_AND,
+  OP_OR,
+};
+
+struct PETTable {
+  uint32_t states;
+  uint32_t kinds_num;
+  uint32_t init;
+  uint32_t acc;
+  std::vector<uint8_t> bot;
+  // indexed by state * kinds_num + code, succ is NONE if there is no successor
+  std::vector<uint32_t> succ;
+  std::vector<uint32_t> action;
+};
+
+struct ActionLetter {
+  uint32_t label;
+  bool start;
+  bool end;
+};
+
+struct TransitionTable {
+  uint32_t start;
+  uint32_t end;
+  // PET for each trace, NONE if the MPE has no PE for the trace
+  std::vector<uint32_t> pets;
+  uint32_t cond;
+  // 0 is false, 1 is true, 2 is anything else
+  std::vector<uint8_t> outputs;
+};
+
+struct MPTTables {
+  uint32_t flags{0};
+  std::vector<std::string> kinds;
+  std::vector<std::string> traces;
+  std::vector<std::string> labels;
+  uint32_t states_num{0};
+  uint32_t init{0};
+  std::vector<PETTable> pets;
+  // action 0 is no action
+  std::vector<std::vector<ActionLetter>> actions;
+  std::vector<std::vector<uint32_t>> conds;
+  std::vector<TransitionTable> transitions;
+  // indices of outgoing transitions of states, in the order of the MPT
+  std::vector<std::vector<uint32_t>> delta;
+
+  uint32_t endKind() const { return kinds.size(); }
+  uint32_t otherKind() const { return kinds.size() + 1; }
+
+  // load the tables from `path`, returns false and sets `err` on errors
+  bool load(const char *path, std::string &err);
+};
+
+#endif
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import sys
+from os import readlink
+from os.path import islink, dirname, abspath
+
+self_path = abspath(dirname(readlink(__file__) if islink(__file__) else __file__))
+sys.path.insert(0, abspath(f"{self_path}/.."))
+
+from parser.parser import Parser
+from mpt.analysis import detect_reductions, live_pes, label_bounds
+from mpt.pet import PrefixExpressionTransducer
+
+with open(f"{self_path}/OD/od.mpt") as fl:
+    OD = fl.read()
+
+# (a change of the OD property, the reductions that must be detected)
+VARIANTS = [
+    ((), ["symmetry", "reflexivity"]),
+    # the PEs on t1 and t2 differ
+    (("t2: _*e2@{OutputL + $};", "t2: _*e2@{OutputL};"), []),
+    # the labels may have any names
+    (("t2: _*e2@{InputL + OutputL};\n    cond: t1[e1] == t2[e2];",
+      "t2: _*f@{InputL + OutputL};\n    cond: t2[f] == t1[e1];"), ["symmetry", "reflexivity"]),
+    # the violation is reported also on a single trace
+    (("cond: t1[e1] != t2[e2];\n    out: false;",
+      "cond: t1[e1] == t2[e2];\n    out: false;"), ["symmetry"]),
+]
+
+parser = Parser()
+for change, expected in VARIANTS:
+    text = OD.replace(*change) if change else OD
+    assert not change or text != OD, change
+    _, mpt = parser.parse_text(text)
+    reductions = detect_reductions(mpt)
+    assert reductions == expected, (change, reductions, expected)
+
+# liveness of labels: `e2` is not read by the condition of q0 -> q1
+_, mpt = parser.parse_text(OD.replace("cond: t1[e1] != t2[e2];\n    out: false;",
+                                      "cond: t1[e1] != t1[e1];\n    out: false;"))
+for t in mpt.transitions:
+    pes = live_pes(t)
+    for trace, pe in t.mpe.exprs.items():
+        if t.end.name == "q1" and trace.name == "t2":
+            assert pes[trace].pretty_str() == "_*{OutputL+$}", pes[trace].pretty_str()
+            pet = PrefixExpressionTransducer.from_pe(pes[trace], pes[trace].alphabet())
+            for s in pet.states.values():
+                for _, (_, out) in s.successors.items():
+                    assert not out, out
+        else:
+            # nothing is stripped, the PE is the same object
+            assert pes[trace] is pe, (pes[trace], pe)
+
+# bounds of labels: the m-strings of `e1` and `e2` have a single letter
+# that spans one event
+for t in mpt.transitions:
+    for trace, pe in t.mpe.exprs.items():
+        pet = PrefixExpressionTransducer.from_pe(pe, pe.alphabet())
+        for label, bound in label_bounds(pet).items():
+            assert bound.letters == 1 and bound.single_event, (pe.pretty_str(), label, bound)
+
+# a label on a cycle is unbounded
+_, mpt = parser.parse_text(OD.replace("t1: _*e1@{InputL + OutputL};", "t1: {e1@{InputL + OutputL}}*$;"))
+pe = next(pe for t in mpt.transitions for tr, pe in t.mpe.exprs.items() if "e1" in pe.pretty_str())
+bound = label_bounds(PrefixExpressionTransducer.from_pe(pe, pe.alphabet()))["e1"]
+assert bound.letters is None and not bound.single_event, bound
+
+print(f"Tested {len(VARIANTS)} MPTs")
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import sys
+from os import readlink
+from os.path import islink, dirname, abspath
+
+self_path = abspath(dirname(readlink(__file__) if islink(__file__) else __file__))
+sys.path.insert(0, abspath(f"{self_path}/.."))
+
+from codegen.api import compile_mpt
+
+with open(f"{self_path}/OD/od-conds.mpt") as fl:
+    OD_CONDS = fl.read()
+
+exitval = 0
+
+# operands of conjunctions and disjunctions are evaluated from the cheapest,
+# the monitor is compiled and run by the OD tests (OD/CMakeLists.txt)
+mpes = compile_mpt(OD_CONDS)["mpes.h"]
+for expected in (
+    "return ((true || !__mstring_equal(pe_t1.mstr_e1, pe_t2.mstr_e2))"
+    " && __subword_compare_single(t1, pe_t1.mstr_e1, t2, pe_t2.mstr_e2));",
+    "return (false || !__subword_compare_single(t1, pe_t1.mstr_e1, t2, pe_t2.mstr_e2));",
+    "return (!__subword_compare_single(t1, pe_t1.mstr_e1, t2, pe_t2.mstr_e2)"
+    " && (__mstring_equal(pe_t1.mstr_e1, pe_t2.mstr_e2) || !__mstring_equal(pe_t1.mstr_e1, pe_t2.mstr_e2)));",
+):
+    if expected not in mpes:
+        print(f"-- Missing condition: {expected}")
+        exitval = 1
+
+# conditions that cannot be compiled are reported
+UNHANDLED = [
+    "t1[e1] == InputL(addr, 1)",
+    "e1 == nil",
+]
+for cond in UNHANDLED:
+    text = OD_CONDS.replace("cond: !(t1[e1] == t2[e2]) || false;", f"cond: {cond};")
+    assert text != OD_CONDS
+    try:
+        compile_mpt(text)
+        print(f"-- Compiling the condition {cond} should fail")
+        exitval = 1
+    except NotImplementedError as e:
+        if "Unhandled condition" not in str(e):
+            print(f"-- Wrong error for the condition {cond}: {e}")
+            exitval = 1
+
+print(f"Tested {len(UNHANDLED) + 3} conditions")
+exit(exitval)
@@ -17,9 +17,9 @@ PATTERNS = [
     ("a*b", ["a"], "a*b"),
     ("b*a", ["a"], "ε"),
     ("b*c", ["a"], "⊥"),
-    ("{{a*b}*c}*d", ["a"], "{{a*b.{a*b}*c}.{{a*b}*c}*d}"),
+    ("{{a*b}*c}*d", ["a"], "{a*b.{a*b}*c.{{a*b}*c}*d}"),
     ("{{a*b}*c}*d", ["a", "b"], "{{a*b}*c.{{a*b}*c}*d}"),
-    ("{{a*b}*c}*d", ["a", "b", "a"], "{{a*b.{a*b}*c}.{{a*b}*c}*d}"),
+    ("{{a*b}*c}*d", ["a", "b", "a"], "{a*b.{a*b}*c.{{a*b}*c}*d}"),
     ("{{a*b}*c}*d", ["a", "b", "b"], "{{a*b}*c.{{a*b}*c}*d}"),
     ("{{a*b}*c}*d", ["a", "b", "c"], "{{a*b}*c}*d"),
     ("{{a*b}*c}*d", ["a", "b", "c", "c"], "{{a*b}*c}*d"),
@@ -29,6 +29,10 @@ PATTERNS = [
     ("a*b + b.a + a.b + c", ["a", "b"], "ε"),
     ("a*b + b.a + a.b + c", ["a", "a"], "a*b"),
     ("l1@{a*b} + l2@{b.a} + l3@{a.b} + l4@c", ["a", "a"], "l1'@{a*b}"),
+    # choices are normalized up to associativity, commutativity and idempotence
+    ("a.c + a.b + a.c", ["a"], "{b+c}"),
+    ("{a.c + a.b} + {a.b + a.c}", ["a"], "{b+c}"),
+    ("l1@{a.c} + l2@{a.c}", ["a"], "{l1'@{c}+l2'@{c}}"),
 ]
 
 grammars_dir = abspath(f"{self_path}/../parser/grammars/")
@@ -67,5 +71,16 @@ for n, pattern in enumerate(PATTERNS):
         print(f"  Expected: {pattern[2]}")
         exitval = 1
 
+# prefix expressions are interned and their derivatives are memoized
+for pattern in PATTERNS:
+    pe = parse(pattern[0])
+    letter = parse(pattern[1][0])
+    if pe is not parse(pattern[0]):
+        print(f"  -- Expression not interned: {pattern[0]}")
+        exitval = 1
+    if pe.step(letter) is not pe.step(letter):
+        print(f"  -- Derivative not memoized: {pattern[1][0]}/({pattern[0]})")
+        exitval = 1
+
 print(f"Tested {n+1} patterns")
 exit(exitval)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import re
+import sys
+from glob import glob
+from os import readlink
+from os.path import islink, dirname, abspath, basename
+
+self_path = abspath(dirname(readlink(__file__) if islink(__file__) else __file__))
+sys.path.insert(0, abspath(f"{self_path}/.."))
+
+from parser.parser import Parser
+from mpt.interpreter import MPTInterpreter
+from mpt.mstring import MString
+
+
+def read_traces(path):
+    """
+    Read the traces from the inputs of the OD test (`OD/inputs-*.cpp`).
+    """
+    with open(path) as fl:
+        src = fl.read()
+    src = src[src.index("streams[]") : src.index("bool InputStream")]
+    traces = []
+    for block in src.split("},"):
+        events = re.findall(r"Event_(\w+)\((\d+), addr, (-?\d+)\)", block)
+        if events:
+            traces.append([(kind, 0, int(x)) for kind, _, x in events])
+    return traces
+
+
+_, mpt = Parser().parse_path(f"{self_path}/OD/od.mpt")
+interpreter = MPTInterpreter(mpt)
+
+inputs = sorted(glob(f"{self_path}/OD/inputs-*.cpp"))
+assert inputs
+for path in inputs:
+    traces = read_traces(path)
+    expected = basename(path).startswith("inputs-true")
+    for reduction in [(), ("reflexivity",), ("reflexivity", "symmetry")]:
+        result = interpreter.run(traces, reduction)
+        assert (not result.violations()) == expected, (path, reduction, result.violations())
+
+# equivalent conditions give the same results
+with open(f"{self_path}/OD/od.mpt") as fl:
+    OD = fl.read()
+for cond in ["!(t1[e1] != t2[e2]) && true", "false || t1[e1] == t2[e2] && (e1 == e1 || e1 != e2)"]:
+    _, variant = Parser().parse_text(OD.replace("cond: t1[e1] == t2[e2];", f"cond: {cond};"))
+    assert variant.transitions[0].cond.pretty_str() != mpt.transitions[0].cond.pretty_str()
+    for path in inputs:
+        traces = read_traces(path)
+        expected = basename(path).startswith("inputs-true")
+        result = MPTInterpreter(variant).run(traces)
+        assert (not result.violations()) == expected, (cond, path, result.violations())
+
+# letters that abut the last letter extend it
+mstr = MString()
+mstr.append([[0, 0]])
+mstr.append([[1, 1]])
+mstr.append([[2, None]])
+mstr.append([[None, 4]])
+mstr.append([[6, 6]])
+mstr.append([[7, None]])
+assert mstr == [[0, 4], [6, None]], mstr
+mstr.append([[None, 9]])
+assert mstr == [[0, 4], [6, 9]], mstr
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import sys
+from os import readlink
+from os.path import islink, dirname, abspath
+
+self_path = abspath(dirname(readlink(__file__) if islink(__file__) else __file__))
+sys.path.insert(0, abspath(f"{self_path}/.."))
+
+from codegen.codegen import OutputFile
+
+exitval = 0
+committed = []
+
+
+def new_file():
+    fl = OutputFile(committed.append)
+    fl.write("generated")
+    return fl
+
+
+# a generated file is written when it is closed or left normally
+with new_file():
+    pass
+new_file().close()
+if committed != ["generated", "generated"]:
+    print(f"-- Closed files were not written: {committed}")
+    exitval = 1
+
+# a partially generated file is never written, e.g., by a failed
+# incremental compilation which keeps the files of the previous one
+committed.clear()
+try:
+    with new_file():
+        raise RuntimeError("failed generation")
+except RuntimeError:
+    pass
+fl = new_file()
+del fl
+if committed:
+    print(f"-- Partially generated files were written: {committed}")
+    exitval = 1
+
+print("Tested 4 files")
+exit(exitval)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import sys
+from os import readlink
+from os.path import islink, dirname, abspath
+from tempfile import TemporaryDirectory
+
+self_path = abspath(dirname(readlink(__file__) if islink(__file__) else __file__))
+sys.path.insert(0, abspath(f"{self_path}/.."))
+
+from codegen.api import Compiler
+
+exitval = 0
+
+# the PET cache does not change the generated code, neither when
+# it is cold nor when it is warm (outputs of edges stay shared)
+OPTIONS = [
+    {},
+    {"fuse_transitions": True},
+    {"pe_backend": "table"},
+    {"fuse_transitions": True, "pe_backend": "table"},
+]
+for mpt in ("od.mpt", "od-conds.mpt"):
+    with open(f"{self_path}/OD/{mpt}") as fl:
+        text = fl.read()
+    for options in OPTIONS:
+        expected = Compiler(options).compile(text)
+        with TemporaryDirectory() as cache_dir:
+            for run in ("cold", "warm"):
+                # a new compiler does not have the PETs in memory
+                files = Compiler({**options, "pet_cache": cache_dir}).compile(text)
+                for name in sorted(set(files) | set(expected)):
+                    if files.get(name) != expected.get(name):
+                        print(f"-- {mpt} {options}: {name} differs with a {run} PET cache")
+                        exitval = 1
+
+# the PETs kept in memory by a (long-running) compiler are bounded,
+# dropping PETs does not change the generated code either
+compiler = Compiler()
+compiler.pet_cache.max_entries = 2
+for mpt in ("od.mpt", "od-conds.mpt", "od.mpt"):
+    with open(f"{self_path}/OD/{mpt}") as fl:
+        text = fl.read()
+    files = compiler.compile(text)
+    if len(compiler.pet_cache.pets) > 2:
+        print(f"-- The compiler keeps {len(compiler.pet_cache.pets)} PETs, expected at most 2")
+        exitval = 1
+    if files != Compiler().compile(text):
+        print(f"-- {mpt}: the generated code differs with a bounded PET cache")
+        exitval = 1
+
+print(f"Tested {2 * len(OPTIONS) + 3} compilations")
+exit(exitval)
@@ -1,15 +1,20 @@
 #!/usr/bin/env python3
 
 import sys
+import pickle
 from os import readlink
 from os.path import islink, dirname, abspath
+from tempfile import TemporaryDirectory
 from lark import Lark
 
 self_path = abspath(dirname(readlink(__file__) if islink(__file__) else __file__))
 sys.path.insert(0, abspath(f"{self_path}/.."))
 
 from parser.ast import ProcessPE, visit_ast
-from mpt.pet import PrefixExpressionTransducer
+from mpt.pet import PrefixExpressionTransducer, PETBudget, PETBudgetExceeded
+from mpt.product import ProductPET
+from mpt.petcache import PETCache, MemoryPETCache, PET_VERSION
+from mpt.analysis import canonical_pe
 
 PATTERNS = [
     ("a + b", ["a", "b"], ["aa", "ab", "c"]),
@@ -50,6 +55,10 @@ for n, pattern in enumerate(PATTERNS):
         alphabet = list(set(atoms + pe.alphabet()))
         # print(pe.pretty_str(), [a.pretty_str() for a in alphabet])
         pet = PrefixExpressionTransducer.from_pe(pe, alphabet)
+        if not pet.minimized().accepts(atoms):
+            print("---", pattern[0], "---")
+            print("Minimized PET should accept: ", word)
+            exitval = 1
         if not pet.accepts(atoms):
             print("---", pattern[0], "---")
             pet.dump()
@@ -57,10 +66,15 @@ for n, pattern in enumerate(PATTERNS):
             print("Should accept: ", word)
             print(f"Trajectory: {pet.trajectory(atoms)}")
             print("------")
+            exitval = 1
     for word in pattern[2]:
         atoms = [parse(l) for l in word]
         alphabet = list(set(atoms + pe.alphabet()))
         pet = PrefixExpressionTransducer.from_pe(pe, alphabet)
+        if pet.minimized().accepts(atoms):
+            print("---", pattern[0], "---")
+            print("Minimized PET should NOT accept: ", word)
+            exitval = 1
         if pet.accepts(atoms):
             print("---", pattern[0], "---")
             pet.dump()
@@ -68,7 +82,171 @@ for n, pattern in enumerate(PATTERNS):
             print("Should NOT accept: ", word)
             print(f"Trajectory: {pet.trajectory(atoms)}")
             print("------")
+            exitval = 1
+
+# letters that the PE cannot distinguish fall into the same class,
+# letters of the alphabet that the PE does not use at all are the last class
+CLASSES = [
+    ("{a + b}*c", "abcd", ["ab", "c", "d"]),
+    ("_*e1@{a + b}", "abcd", ["ab", "cd"]),
+    ("a.b + b.a", "abcd", ["a", "b", "cd"]),
+    ("_*c", "abc", ["c", "ab"]),
+]
+for pattern, letters, expected in CLASSES:
+    pe = parse(pattern)
+    pet = PrefixExpressionTransducer.from_pe(pe, [parse(l) for l in letters])
+    classes = ["".join(l.pretty_str() for l in cls) for cls in pet.classes]
+    if classes != expected:
+        print(f"-- Wrong classes of letters for {pattern}")
+        print(f"Got     : {classes}")
+        print(f"Expected: {expected}")
+        exitval = 1
+
+# events outside of the alphabet of the PET are ignored (like in the generated
+# monitors before PETs had default edges), events of the alphabet are derived
+IGNORED = [
+    ("a.b", None, ["ab", "acb", "ccacccb"], ["ba", "aab"]),
+    ("a.b", "abc", ["ab"], ["acb", "cab"]),
+    ("e@{a + b}.c", None, ["ac", "addc"], ["ca"]),
+]
+for pattern, letters, accepted, rejected in IGNORED:
+    pe = parse(pattern)
+    alphabet = None if letters is None else [parse(l) for l in letters]
+    pet = PrefixExpressionTransducer.from_pe(pe, alphabet)
+    for words, expected in ((accepted, True), (rejected, False)):
+        for word in words:
+            atoms = [parse(l) for l in word]
+            for p in (pet, pet.minimized()):
+                if p.accepts(atoms) != expected:
+                    print(f"-- {pattern} (alphabet {letters}) should {'' if expected else 'not '}accept {word}")
+                    exitval = 1
+
+# derivatives that differ only syntactically are merged by minimization
+MINIMIZED = [
+    ("a*b + b.a + a.b + c", 5, 4),
+    ("{a*b}*c", 4, 4),
+    # a long chain of choices needs many rounds of refinement,
+    # this takes forever if the blocks grow with the rounds
+    (".".join(["{a + b}"] * 40) + ".c", 43, 43),
+]
+for pattern, states_num, min_states_num in MINIMIZED:
+    pet = PrefixExpressionTransducer.from_pe(parse(pattern))
+    got = (len(pet.states), len(pet.minimized().states))
+    if got != (states_num, min_states_num):
+        print(f"-- Wrong number of states (before, after minimization) for {pattern}")
+        print(f"Got     : {got}")
+        print(f"Expected: {(states_num, min_states_num)}")
+        exitval = 1
+
+# the construction bails out when it exceeds its budget
+pe = parse("{{{a + b}*b}*{c + b}}*{d + e}")
+try:
+    PrefixExpressionTransducer.from_pe(pe, budget=PETBudget(max_states=3))
+    print("-- Building the PET should exceed the budget of 3 states")
+    exitval = 1
+except PETBudgetExceeded as e:
+    if e.culprit is None:
+        print("-- No sub-expression reported for the exceeded budget")
+        exitval = 1
+pet = PrefixExpressionTransducer.from_pe(pe, budget=PETBudget(max_states=5))
+if len(pet.states) != 5:
+    print(f"-- Wrong number of states with a budget: {len(pet.states)}")
+    exitval = 1
+
+# the product of PETs accepts and rejects with the PETs it is made of
+PRODUCTS = [
+    (("a*b", "_*c", "a.{a*b}"), ("ab", "aab", "aac", "c", "bc")),
+    # the end of trace comes before other letters in the alphabets
+    (("_*{c + $}", "a*b"), ("ab", "c", "bc")),
+]
+for patterns, words in PRODUCTS:
+    pets = [PrefixExpressionTransducer.from_pe(parse(p)).minimized() for p in patterns]
+    product = ProductPET(pets)
+    for word in words:
+        atoms = [parse(l) for l in word]
+        expected = []
+        for pet in pets:
+            trajectory = pet.trajectory(atoms)[1:]
+            end = next((i for i, s in enumerate(trajectory) if s.pe.is_empty() or s.pe.is_bot()), None)
+            expected.append(None if end is None else (end, trajectory[end].pe.is_empty()))
+        got = [None] * len(pets)
+        state = product.init_state
+        for i, l in enumerate(atoms):
+            edge = state.successors.get(l, state.default)
+            for k in edge.accepted:
+                got[k] = (i, True)
+            for k in edge.rejected:
+                got[k] = (i, False)
+            state = edge.succ
+        if got != expected:
+            print(f"-- Wrong product on {word}: {got}, expected {expected}")
+            exitval = 1
+
+# PEs that differ only in the names of labels share cached PETs,
+# the loaded PET has the labels of the PE it is loaded for
+def outputs(pet, word):
+    state, outs = pet.init_state, []
+    for l in word:
+        state, out = state.get_succ(l)
+        outs.append(str(out) if out else "")
+    return outs
+
+
+with TemporaryDirectory() as cache_dir:
+    for cache in (PETCache(cache_dir), MemoryPETCache()):
+        for pattern in ("x@{a*b}.y@c", "y@{a*b}.z@c", "z@{a*b}.x@c"):
+            pe = parse(pattern)
+            alphabet = pe.alphabet()
+            pet = cache.build(
+                pe, alphabet, lambda: PrefixExpressionTransducer.from_pe(pe, alphabet).minimized()
+            )
+            word = [parse(l) for l in "aabc"]
+            expected = outputs(PrefixExpressionTransducer.from_pe(pe, alphabet).minimized(), word)
+            if outputs(pet, word) != expected:
+                print(f"-- Wrong outputs of the cached PET for {pattern}: {outputs(pet, word)}, expected {expected}")
+                exitval = 1
+            if pet.init_state.pe is not pe:
+                print(f"-- The cached PET for {pattern} is not for the PE: {pet.init_state.pe.pretty_str()}")
+                exitval = 1
+        if (cache.hits, cache.misses) != (2, 1):
+            print(f"-- Wrong number of hits and misses of {type(cache).__name__}: {(cache.hits, cache.misses)}")
+            exitval = 1
+
+# entries that cannot be loaded (corrupted, of another format version
+# or not PETs at all) are misses and are rebuilt
+with TemporaryDirectory() as cache_dir:
+    cache = PETCache(cache_dir)
+    pe = parse("x@{a*b}.y@c")
+    alphabet = pe.alphabet()
+    build = lambda: PrefixExpressionTransducer.from_pe(pe, alphabet).minimized()
+    path = cache._path(cache.key(canonical_pe(pe)[0], alphabet))
+    word = [parse(l) for l in "aabc"]
+    expected = outputs(build(), word)
+    for name, content in (
+        ("truncated", b"\x80\x05"),
+        ("garbage", b"not a pickle"),
+        ("old version", pickle.dumps((PET_VERSION - 1, build()))),
+        ("not a PET", pickle.dumps((PET_VERSION, {}))),
+        ("unversioned", pickle.dumps(build())),
+    ):
+        with open(path, "wb") as fl:
+            fl.write(content)
+        misses = cache.misses
+        pet = cache.build(pe, alphabet, build)
+        if cache.misses != misses + 1 or outputs(pet, word) != expected:
+            print(f"-- A {name} cache entry is not rebuilt")
+            exitval = 1
 
+# the memory cache keeps at most `max_entries` PETs,
+# the least recently used one is dropped first
+cache = MemoryPETCache(max_entries=2)
+pes = [parse(pattern) for pattern in ("a*b", "a.b", "b*a")]
+for pe in pes[:2] + pes[:1] + pes[2:]:
+    cache.build(pe, pe.alphabet(), lambda: PrefixExpressionTransducer.from_pe(pe, pe.alphabet()).minimized())
+cached = [cache.has(pe, pe.alphabet()) for pe in pes]
+if len(cache.pets) != 2 or cached != [True, False, True]:
+    print(f"-- Wrong PETs in the bounded cache: {cached}")
+    exitval = 1
 
 print(f"Tested {n+1} expressions")
 exit(exitval)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import gc
 import sys
 from os import readlink
 from os.path import islink, dirname, abspath
@@ -9,6 +10,7 @@ self_path = abspath(dirname(readlink(__file__) if islink(__file__) else __file__
 sys.path.insert(0, abspath(f"{self_path}/.."))
 
 from parser.ast import ProcessPE, visit_ast
+from mpt.prefixexpr import _INTERNED
 
 PATTERNS = [
     ("a + b", "Choice(EventVar(ID(a)) + EventVar(ID(b)))"),
@@ -63,27 +65,53 @@ PATTERNS = [
     ),
     ("e@b(x)", "NamedGroup(ID(e), Event(ID(b): ID(x)))"),
     ("e@b(x, y)", "NamedGroup(ID(e), Event(ID(b): ID(x), ID(y)))"),
+    (
+        "_*e@{a + b + c}",
+        "Star(Atom(ANY), NamedGroup(ID(e), Choice(EventVar(ID(a)) + EventVar(ID(b)) + EventVar(ID(c)))))",
+    ),
+    ("a b.c", "Seq(EventVar(ID(a)).EventVar(ID(b)).EventVar(ID(c)))"),
 ]
 
 grammars_dir = abspath(f"{self_path}/../parser/grammars/")
-parser = Lark.open(
-    "prefixexpr.lark",
-    rel_to=f"{grammars_dir}/grammar.lark",
-    import_paths=[grammars_dir],
-    start="prefixexpr",
-)
+# the grammar must work with both, the (default) Earley and the LALR parser
+parsers = [
+    Lark.open(
+        "prefixexpr.lark",
+        rel_to=f"{grammars_dir}/grammar.lark",
+        import_paths=[grammars_dir],
+        start="prefixexpr",
+        parser=algorithm,
+    )
+    for algorithm in ("earley", "lalr")
+]
 
 exitval = 0
 n = 0
-for n, pattern in enumerate(PATTERNS):
-    t = parser.parse(pattern[0])
-    out = str(ProcessPE().transform(t))
-    if out != pattern[1]:
-        print(f"-- Wrong output for pattern {n}")
-        print(f"Pattern: {pattern[0]}")
-        print(f"Got     : {out}")
-        print(f"Expected: {pattern[1]}")
-        exitval = 1
+for parser in parsers:
+    for n, pattern in enumerate(PATTERNS):
+        t = parser.parse(pattern[0])
+        out = str(ProcessPE().transform(t))
+        if out != pattern[1]:
+            print(f"-- Wrong output for pattern {n} ({parser.options.parser})")
+            print(f"Pattern: {pattern[0]}")
+            print(f"Got     : {out}")
+            print(f"Expected: {pattern[1]}")
+            exitval = 1
+
+# expressions are shared while they are used and freed afterwards
+# (the compile server must not keep the expressions of all requests)
+text = "{uniq1*uniq2}*uniq3 + uniq4.uniq5"
+e1 = ProcessPE().transform(parsers[0].parse(text))
+e2 = ProcessPE().transform(parsers[1].parse(text))
+if e1 is not e2:
+    print("-- Equal expressions are not shared")
+    exitval = 1
+interned = len(_INTERNED)
+del e1, e2
+gc.collect()
+if len(_INTERNED) >= interned:
+    print(f"-- Unused expressions are not freed ({interned} -> {len(_INTERNED)})")
+    exitval = 1
 
 print(f"Tested {n} patterns")
 exit(exitval)
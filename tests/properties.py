@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import sys
+from os import readlink
+from os.path import islink, dirname, abspath
+
+self_path = abspath(dirname(readlink(__file__) if islink(__file__) else __file__))
+sys.path.insert(0, abspath(f"{self_path}/.."))
+
+from parser.parser import Parser
+from codegen.api import make_options
+from codegen.codegen import CodeGenCpp, MemorySink, mpt_name_from_path
+
+exitval = 0
+
+# MPTs without a name are named by their files
+NAMES = [
+    ("od.mpt", "od"),
+    ("dir/my-prop.mpt", "my_prop"),
+    ("dir.d/od.v2.mpt", "od_v2"),
+    ("2nd.mpt", "mpt_2nd"),
+]
+for path, expected in NAMES:
+    if mpt_name_from_path(path) != expected:
+        print(f"-- Wrong name of {path}: {mpt_name_from_path(path)}, expected {expected}")
+        exitval = 1
+
+
+def generate(mpts):
+    sink = MemorySink()
+    CodeGenCpp(make_options(), sink=sink).generate_properties(mpts)
+    return sink.files
+
+
+parser = Parser()
+_, od = parser.parse_path(f"{self_path}/OD/od.mpt")
+_, od_conds = parser.parse_path(f"{self_path}/OD/od-conds.mpt")
+
+# every MPT has its files in its directory,
+# the monitor is compiled and run by the OD tests (OD/CMakeLists.txt)
+files = generate([("OD", od), ("ODConds", od_conds)])
+for name in ("monitor.cpp", "OD/property.h", "OD/cfgs.h", "ODConds/property.h", "ODConds/cfgs.h"):
+    if name not in files:
+        print(f"-- Missing file {name}")
+        exitval = 1
+
+# names that clash with each other or with names in the monitor
+CLASHES = [
+    ["OD", "OD"],
+    ["OD", "od"],
+    ["OD", "monitor"],
+    ["OD", "namespace"],
+    ["OD", "2nd"],
+]
+for names in CLASHES:
+    try:
+        generate([(names[0], od), (names[1], od_conds)])
+        print(f"-- MPTs named {names} should be rejected")
+        exitval = 1
+    except RuntimeError:
+        pass
+
+print(f"Tested {len(NAMES) + len(CLASHES) + 1} cases")
+exit(exitval)
@@ -0,0 +1,12 @@
+#ifndef EVENTS_H_
+#define EVENTS_H_
+
+// events of the test traces, `subword-compare.h` only compares them
+struct TraceEvent {
+  int x;
+
+  bool operator==(const TraceEvent &rhs) const { return x == rhs.x; }
+  bool operator!=(const TraceEvent &rhs) const { return x != rhs.x; }
+};
+
+#endif
@@ -0,0 +1,96 @@
+#include <iostream>
+#include <vector>
+
+#include "mstring.h"
+#include "subword-compare.h"
+
+// comparisons of sub-words of traces, also on m-strings that
+// are not complete yet (the letters that are being read)
+
+struct TestTrace {
+  std::vector<TraceEvent> events;
+
+  TestTrace(std::initializer_list<int> xs) {
+    for (int x : xs)
+      events.push_back(TraceEvent{x});
+  }
+
+  const TraceEvent *get(size_t idx) const { return &events[idx]; }
+};
+
+using Letter = MString::Letter;
+using MStr = std::vector<Letter>;
+static const size_t BOT = Letter::BOT;
+
+static int failed = 0;
+
+static void expect(bool got, bool expected, const char *what) {
+  if (got != expected) {
+    std::cerr << "-- " << what << ": got " << got << ", expected "
+              << expected << "\n";
+    failed = 1;
+  }
+}
+
+int main() {
+  const TestTrace t1{1, 2, 3, 4};
+  const TestTrace t2{1, 2, 3, 5};
+  const TestTrace t3{9, 1, 2};
+
+  expect(__subword_compare_single(&t1, MStr{{0, 0}}, &t2, MStr{{0, 0}}), true,
+         "single events, equal");
+  expect(__subword_compare_single(&t1, MStr{{3, 3}}, &t2, MStr{{3, 3}}), false,
+         "single events, different");
+  expect(__subword_compare(&t1, MStr{{0, 2}}, &t2, MStr{{0, 2}}), true,
+         "sub-words, equal");
+  expect(__subword_compare(&t1, MStr{{0, 0}, {1, 2}}, &t3, MStr{{1, 2}}),
+         false, "sub-words of different lengths");
+
+  {
+    // the letters are open, only the known prefixes are compared
+    SubwordPrefixCompare cmp;
+    const MStr m1{{0, BOT}}, m2{{0, BOT}};
+    expect(cmp.check(&t1, m1, 2, false, &t2, m2, 3, false), true,
+           "open letters, equal prefixes");
+    expect(cmp.check(&t1, m1, 3, false, &t2, m2, 3, false), true,
+           "open letters, equal longer prefixes");
+    expect(cmp.check(&t1, m1, 4, false, &t2, m2, 4, false), false,
+           "open letters, different prefixes");
+  }
+  {
+    // the first sub-word is complete and shorter than the known
+    // prefix of the second one
+    SubwordPrefixCompare cmp;
+    const MStr m1{{0, 1}}, m2{{0, BOT}};
+    expect(cmp.check(&t1, m1, 2, true, &t2, m2, 2, false), true,
+           "complete sub-word, the other one may end");
+    expect(cmp.check(&t1, m1, 2, true, &t2, m2, 3, false), false,
+           "complete sub-word, the other one is longer");
+  }
+  {
+    // an m-string of several letters against a single letter,
+    // the letters are appended between the checks
+    const TestTrace t4{1, 9, 2, 3};
+    SubwordPrefixCompare cmp;
+    MStr m1{{0, 0}, {2, BOT}}, m2{{0, BOT}};
+    expect(cmp.check(&t4, m1, 3, false, &t1, m2, 2, false), true,
+           "several letters, the first prefix");
+    m1[1].end = 3;
+    expect(cmp.check(&t4, m1, 4, true, &t1, m2, 2, false), true,
+           "several letters, the second prefix");
+    m2[0].end = 2;
+    expect(cmp.check(&t4, m1, 4, true, &t1, m2, 3, true), true,
+           "several letters, complete and equal");
+  }
+  {
+    const TestTrace t4{1, 9, 2, 4};
+    SubwordPrefixCompare cmp;
+    const MStr m1{{0, 0}, {2, 3}}, m2{{0, BOT}};
+    expect(cmp.check(&t4, m1, 4, true, &t2, m2, 4, false), false,
+           "several letters, different");
+  }
+
+  if (!failed)
+    std::cout << "Sub-word comparisons OK\n";
+  return failed;
+}
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import re
+import sys
+from glob import glob
+from os import readlink
+from os.path import islink, dirname, abspath, basename, exists
+from subprocess import run
+from tempfile import TemporaryDirectory
+
+self_path = abspath(dirname(readlink(__file__) if islink(__file__) else __file__))
+sys.path.insert(0, abspath(f"{self_path}/.."))
+
+from parser.parser import Parser
+from mpt.pet import PrefixExpressionTransducer
+from mpt.prefixexpr import EMPTY
+from mpt.tables import MPTTables, lower_pet, NONE
+from codegen.api import compile_mpt, make_options
+from codegen.codegen import CodeGenCpp, MemorySink
+
+# the generic monitor (mpt-runtime)
+runtime = sys.argv[1]
+
+
+def write_traces(path, tmp):
+    """
+    Write the traces from the inputs of the OD test (`OD/inputs-*.cpp`)
+    into files in `tmp`, return the list of the files.
+    """
+    with open(path) as fl:
+        src = fl.read()
+    src = src[src.index("streams[]") : src.index("bool InputStream")]
+    files = []
+    for block in src.split("},"):
+        events = re.findall(r"Event_(\w+)\((\d+), addr, (-?\d+)\)", block)
+        if events:
+            files.append(f"{tmp}/{basename(path)}-{len(files)}.txt")
+            with open(files[-1], "w") as fl:
+                for kind, _, x in events:
+                    print(kind, 0, x, file=fl)
+    return files
+
+
+def get_pet(pe):
+    return PrefixExpressionTransducer.from_pe(pe, pe.alphabet()).minimized()
+
+
+_, mpt = Parser().parse_path(f"{self_path}/OD/od.mpt")
+
+# a PE that matches only ε has no successors, every event ends the match
+eps = get_pet(EMPTY)
+succ, action, bot = lower_pet(eps, {ev.name.name: code for code, ev in enumerate(mpt.alphabet)},
+                              len(mpt.alphabet) + 2, len(mpt.alphabet), id)
+assert succ == [NONE] * (len(mpt.alphabet) + 2), succ
+assert action == [0] * (len(mpt.alphabet) + 2) and bot == [False], (action, bot)
+gen = CodeGenCpp(make_options({"pe_backend": "table"}), sink=MemorySink())
+gen.alphabet = mpt.alphabet
+step = []
+gen._generate_pe_table(eps, {}, step.append)
+assert "PEStepResult::Accept, PEStepResult::Reject}" in "".join(step), "".join(step)
+
+with TemporaryDirectory() as tmp:
+    for reduction in [(), ("reflexivity", "symmetry")]:
+        MPTTables(mpt, get_pet, reduction).write(f"{tmp}/od.mptt")
+        inputs = sorted(glob(f"{self_path}/OD/inputs-*.cpp"))
+        assert inputs
+        for path in inputs:
+            result = run([runtime, f"{tmp}/od.mptt"] + write_traces(path, tmp))
+            expected = 0 if basename(path).startswith("inputs-true") else 1
+            assert result.returncode == expected, (path, reduction, result.returncode)
+
+    # the tables exported by a compilation in memory are among its files
+    # (as bytes), nothing is written into the working directory
+    with open(f"{self_path}/OD/od.mpt") as fl:
+        files = compile_mpt(fl.read(), {"export_tables": "od-api.mptt"})
+    assert not exists("od-api.mptt")
+    with open(f"{tmp}/od-api.mptt", "wb") as fl:
+        fl.write(files["od-api.mptt"])
+    for path in inputs:
+        result = run([runtime, f"{tmp}/od-api.mptt"] + write_traces(path, tmp))
+        expected = 0 if basename(path).startswith("inputs-true") else 1
+        assert result.returncode == expected, (path, result.returncode)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Compare the speed of the generated monitors with PEs stepped by switches
+(`--pe-backend switch`) and by tables (`--pe-backend table`) on an MPT
+with a wide alphabet.
+
+    tools/bench-pe-backends.py [--kinds N] [--events M] [--runs R] [--out-dir DIR]
+
+The MPT reads two traces of pairs of events of N kinds with the PE
+`{E0.E0 + E1.E1 + ...}*e@{$}`, whose initial state has a different successor
+for every kind of events, so the switch tests O(N) kinds on every other
+event. Both traces have M random events, the monitor is built in Release
+mode and the best time of R runs is reported.
+"""
+
+import argparse
+import subprocess
+import sys
+from os import makedirs, readlink
+from os.path import islink, dirname, abspath, join as pathjoin
+from shutil import copy
+from time import perf_counter
+
+self_path = abspath(dirname(readlink(__file__) if islink(__file__) else __file__))
+top_dir = abspath(f"{self_path}/..")
+
+INPUTS = """
+#include <cassert>
+#include <cstdint>
+
+#include "monitor.h"
+#include "events.h"
+#include "inputs.h"
+
+#define NUM_STREAMS 2
+#define NUM_EVS @EVENTS@
+#define NUM_KINDS @KINDS@
+
+static TraceEvent streams[NUM_STREAMS][NUM_EVS];
+
+// both traces are the same random sequence of pairs of events
+static void fill_streams() {
+  uint64_t x = 1;
+  for (size_t i = 0; i + 1 < NUM_EVS; i += 2) {
+    x = x * 6364136223846793005ull + 1442695040888963407ull;
+    const vms_kind kind = (vms_kind)Kind::E0 + (x >> 33) % NUM_KINDS;
+    for (size_t s = 0; s < NUM_STREAMS; ++s) {
+      streams[s][i] = TraceEvent(kind, i + 1);
+      streams[s][i + 1] = TraceEvent(kind, i + 2);
+    }
+  }
+}
+
+bool InputStream::hasEvent() const {
+  const size_t pos = data<const size_t>(1);
+  return pos < NUM_EVS;
+}
+
+bool InputStream::isDone() const {
+  const size_t pos = data<const size_t>(1);
+  return pos >= NUM_EVS;
+}
+
+Event *InputStream::getEvent() {
+  assert(hasEvent() && "getEvent() when there is no event");
+
+  TraceEvent *events = data<TraceEvent *>(0);
+  size_t &pos = data<size_t>(1);
+
+  return &events[pos++];
+}
+
+Inputs::Inputs() {
+  size_t &returned = data<size_t>(0);
+  returned = 0;
+  fill_streams();
+}
+
+bool Inputs::done() const {
+  const size_t returned = this->data<const size_t>(0);
+  return returned >= NUM_STREAMS;
+}
+
+InputStream *Inputs::getNewInputStream() {
+  size_t &returned = data<size_t>(0);
+  if (returned >= NUM_STREAMS)
+    return nullptr;
+
+  auto *stream = new InputStream(_streams.size());
+  _streams.emplace_back(stream);
+
+  stream->data<TraceEvent *>(0) = streams[returned];
+  stream->data<size_t>(1) = 0;
+
+  ++returned;
+
+  return stream;
+}
+"""
+
+
+def mpt_text(kinds):
+    names = [f"E{i}" for i in range(kinds)]
+    pairs = " + ".join(f"{n}.{n}" for n in names)
+    return f"""
+Event {", ".join(names)};
+
+mpt Bench {{
+  in t1 : [{", ".join(names)}], t2 : [{", ".join(names)}];
+  out o : Bool;
+
+  init q0;
+
+  q0 -> q1 {{
+    t1: {{{pairs}}}*e1@{{$}};
+    t2: {{{pairs}}}*e2@{{$}};
+    cond: t1[e1] == t2[e2];
+    out: true;
+  }}
+  q0 -> q2 {{
+    t1: e1@{{$}};
+    t2: e2@{{$}};
+    cond: t1[e1] != t2[e2];
+    out: false;
+  }}
+}}
+"""
+
+
+def write_sources(out_dir, kinds, events):
+    makedirs(out_dir, exist_ok=True)
+    with open(pathjoin(out_dir, "bench.mpt"), "w") as fl:
+        fl.write(mpt_text(kinds))
+    with open(pathjoin(out_dir, "inputs.cpp"), "w") as fl:
+        fl.write(INPUTS.replace("@EVENTS@", str(events)).replace("@KINDS@", str(kinds)))
+    copy(pathjoin(top_dir, "tests/OD/main.cpp"), pathjoin(out_dir, "main.cpp"))
+
+
+def build(src_dir, backend):
+    out_dir = pathjoin(src_dir, backend)
+    subprocess.run(
+        [sys.executable, pathjoin(top_dir, "mptc"), "--pe-backend", backend,
+         "--build-type", "Release", "--overwrite-default", "main.cpp",
+         "--out-dir", out_dir, pathjoin(src_dir, "bench.mpt"),
+         pathjoin(src_dir, "inputs.cpp"), pathjoin(src_dir, "main.cpp")],
+        check=True,
+    )
+    subprocess.run(["cmake", "."], cwd=out_dir, check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(["make"], cwd=out_dir, check=True, stdout=subprocess.DEVNULL)
+    return pathjoin(out_dir, "monitor")
+
+
+def run(monitor, runs):
+    best = None
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run([monitor, "true"], check=True, stdout=subprocess.DEVNULL)
+        t = perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kinds", type=int, default=200, help="Number of kinds of events (default: 200)")
+    parser.add_argument("--events", type=int, default=4000000, help="Events on each trace (default: 4000000)")
+    parser.add_argument("--runs", type=int, default=5, help="Report the best of this many runs (default: 5)")
+    parser.add_argument("--out-dir", default="/tmp/mpt-bench-pe", help="Output directory (default: /tmp/mpt-bench-pe)")
+    args = parser.parse_args()
+
+    write_sources(args.out_dir, args.kinds, args.events)
+    times = {}
+    for backend in ("switch", "table"):
+        times[backend] = run(build(args.out_dir, backend), args.runs)
+        print(f"{backend:>6}: {times[backend]:.3f}s")
+    print(f"speedup of tables: {times['switch'] / times['table']:.2f}x "
+          f"({args.kinds} kinds, {args.events} events on each of 2 traces)")
+
+
+if __name__ == "__main__":
+    main()